@@ -0,0 +1,223 @@
+"""
+Module name: asyncfetcher
+
+An asyncio counterpart to WikiFetcher that keeps several requests in flight
+over a shared keep-alive connection pool, while a token bucket per host limits
+how fast requests are started.
+"""
+
+import asyncio
+from time import monotonic
+from urllib.parse import urlsplit
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from metrics import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter for coroutines.
+
+    Attributes
+    ----------
+    rate : float
+        Tokens added per second.
+    capacity : float
+        The most tokens the bucket can hold, i.e. the largest burst.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    async def acquire(self):
+        """
+        Waits until a token is available and takes it.
+        """
+        while True:
+            now = monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncWikiFetcher:
+    """
+    A class used to fetch Wikipedia pages concurrently.
+
+    Use it as an async context manager so the connection pool is closed:
+
+        async with AsyncWikiFetcher() as fetcher:
+            page = await fetcher.fetch_wikipedia(url)
+
+    Attributes
+    ----------
+    max_in_flight : int
+        The most requests that can be waiting on a response at once.
+    rate : float
+        Requests started per second, per host.
+    burst : int
+        Requests that can be started at once after the host has been idle.
+    retries : int
+        Attempts after the first one for failed or throttled requests.
+    backoff : float
+        Seconds to wait before the first retry, doubled on every retry.
+    cache : PageCache or None
+        Optional cache of page bodies, used as in WikiFetcher.
+
+    Methods
+    -------
+    fetch_html(url)
+        Fetches the page at the given URL and returns its HTML.
+    fetch_wikipedia(url)
+        Fetches the Wikipedia page at the given URL and returns a BeautifulSoup object.
+    """
+
+    user_agent = "python-page-rank/0.1 (https://github.com/cabbagestone/ml-portfolio)"
+
+    def __init__(
+        self,
+        max_in_flight=8,
+        rate=5.0,
+        burst=1,
+        retries=3,
+        backoff=0.5,
+        timeout=30,
+        cache=None,
+    ):
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+
+        self.session = None
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.host_buckets = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"User-Agent": self.user_agent},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def bucket_for(self, url):
+        """
+        Returns the rate limiter for the host of the given URL.
+        """
+        host = urlsplit(url).netloc
+        bucket = self.host_buckets.get(host)
+        if bucket is None:
+            bucket = self.host_buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def fetch_html(self, url):
+        """
+        Fetches the page at the given URL and returns its HTML, retrying
+        connection errors, timeouts and throttled or failed responses with
+        exponential backoff. Fresh cached pages are returned without a
+        request, and stale ones are revalidated with a conditional GET.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the page to fetch.
+
+        Returns
+        -------
+        str
+            The body of the response.
+
+        Raises
+        ------
+        aiohttp.ClientError, asyncio.TimeoutError
+            If the last attempt failed.
+        """
+        cached, cached_body = self.cache.get(url) if self.cache else (None, None)
+        if cached and self.cache.is_fresh(cached):
+            metrics.count("page_cache_hits_total")
+            return cached_body.decode("utf-8", errors="replace")
+        headers = cached.conditional_headers() if cached else None
+
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            await self.bucket_for(url).acquire()
+            try:
+                # The timer starts once a request slot is free, so it does not
+                # count the wait behind other requests.
+                async with (
+                    self.in_flight,
+                    metrics.timer("fetch_seconds"),
+                    self.session.get(url, headers=headers) as response,
+                ):
+                    if response.status == 304 and cached:
+                        metrics.count("page_cache_revalidated_total")
+                        self.cache.touch(cached)
+                        return cached_body.decode("utf-8", errors="replace")
+
+                    if response.status in RETRY_STATUSES and attempt < self.retries:
+                        retry_after = response.headers.get("Retry-After", "")
+                        if retry_after.isdigit():
+                            delay = max(delay, int(retry_after))
+                    else:
+                        response.raise_for_status()
+                        body = await response.read()
+                        metrics.count("pages_fetched_total")
+                        metrics.count("fetch_bytes_total", len(body))
+                        if self.cache:
+                            metrics.count("page_cache_misses_total")
+                            self.cache.store(
+                                url,
+                                body,
+                                response.headers.get("ETag"),
+                                response.headers.get("Last-Modified"),
+                            )
+                        return body.decode(response.get_encoding(), errors="replace")
+            except aiohttp.ClientResponseError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+
+            metrics.count("fetch_retries_total")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    async def fetch_wikipedia(self, url):
+        """
+        Fetches the Wikipedia page at the given URL and returns a BeautifulSoup object.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the Wikipedia page to fetch.
+
+        Returns
+        -------
+        BeautifulSoup
+            A BeautifulSoup object representing the fetched Wikipedia page.
+        """
+        html = await self.fetch_html(url)
+        return BeautifulSoup(html, "html.parser")
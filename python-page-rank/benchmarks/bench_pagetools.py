@@ -0,0 +1,62 @@
+"""
+Module name: benchmarks.bench_pagetools
+
+Compares extract_page with the BeautifulSoup based iterate_words and
+link_generator on saved HTML pages, e.g. Wikipedia articles saved with
+"curl -o page.html https://en.wikipedia.org/wiki/...".
+
+Example usage, from the python-page-rank directory:
+
+    python -m benchmarks.bench_pagetools saved/*.html
+
+"""
+
+import argparse
+from collections import Counter
+from timeit import repeat
+
+from bs4 import BeautifulSoup
+
+from pagetools import extract_page, iterate_words, link_generator
+
+
+def soup_extract(html):
+    """
+    The current extraction: parse a tree, then walk it once for the words and
+    once for the links.
+    """
+    page = BeautifulSoup(html, "html.parser")
+    word_counts = Counter(iterate_words(page))
+    hrefs = [element.get("href") for element in link_generator(page)]
+    return word_counts, hrefs
+
+
+def main():
+    """
+    Times both extractors on every given page and prints the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("pages", nargs="+", help="saved HTML files")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for path in args.pages:
+        with open(path, encoding="utf-8") as fp:
+            html = fp.read()
+
+        words, links = soup_extract(html)
+        content_words, content_links = extract_page(html)
+        print(
+            f"{path}: {len(html) / 1024:.0f} KiB, "
+            f"{sum(words.values())} words / {len(links)} links on the page, "
+            f"{sum(content_words.values())} words / {len(content_links)} links "
+            "in the content"
+        )
+
+        for name, function in (("soup", soup_extract), ("extract_page", extract_page)):
+            best = min(repeat(lambda f=function: f(html), number=1, repeat=args.repeat))
+            print(f"  {name:>12}: {best * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Module name: benchmarks.bench_suite
+
+Times the crawl, index, rank and query hot paths on generated fixture data
+and saves the results as JSON, so a later run can be compared against them.
+
+Pages come from a synthetic Wikipedia-like corpus and link graphs from a
+power-law generator (see benchmarks.fixtures). Redis work runs against an
+in-process fakeredis server unless a local redis-server is given, which
+gives timings closer to production.
+
+Example usage, from the python-page-rank directory:
+
+    python -m benchmarks.bench_suite --output before.json
+    python -m benchmarks.bench_suite --baseline before.json --output after.json
+    python -m benchmarks.bench_suite --graph-sizes 1000 1000000 \\
+        --redis-url redis://localhost:6379/15
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+from datetime import datetime, timezone
+from statistics import mean
+from timeit import repeat
+
+import networkx as nx
+import numpy as np
+from bs4 import BeautifulSoup
+
+from benchmarks.fixtures import (
+    benchmark_redis,
+    personalization_vectors,
+    power_law_graph,
+    synthetic_corpus,
+)
+from pagerank import (
+    edge_matrix,
+    pagerank_edges,
+    pagerank_numpy,
+    pagerank_power,
+    pagerank_power_block,
+    transition_matrix,
+)
+from pagesearchlist import PageSearchList
+from parallelrank import ParallelPageRank
+from pagetools import iterate_words, link_generator
+from query import search_index
+from redistools import redis_index_pipeline, store_page_ranks
+from wordtools import url_relevance
+
+SEARCH_TERM = "machine learning"
+
+# Number of personalized pagerank vectors solved one by one with
+# pagerank_power (personalized_loop) and together with pagerank_power_block
+# (personalized_block).
+PERSONALIZED_COUNT = 32
+
+
+def time_function(function, repeat_count, setup=None):
+    """
+    Function that times a function.
+
+    Parameters:
+    - function: The function to time, called without arguments.
+    - repeat_count: The number of times to run it.
+    - setup: Optional function called before each run, outside the timing.
+
+    Returns:
+    - A dictionary of the best and mean run time in seconds.
+    """
+    runs = repeat(function, setup or "pass", number=1, repeat=repeat_count)
+    return {"best": min(runs), "mean": mean(runs)}
+
+
+def page_benchmarks(corpus, client):
+    """
+    Returns the benchmarks that run over the pages of the corpus, as a
+    dictionary of name to function.
+    """
+    soups = [BeautifulSoup(html, "html.parser") for _, html in corpus]
+    page_words = [list(iterate_words(soup)) for soup in soups]
+    hrefs = [element.get("href") for soup in soups for element in link_generator(soup)]
+
+    def index_pages():
+        for (url, _), words in zip(corpus, page_words):
+            redis_index_pipeline(words, url, client)
+
+    def query_index():
+        for words in page_words:
+            search_index(client, words[0], count=20)
+
+    return {
+        "iterate_words": lambda: [sum(1 for _ in iterate_words(soup)) for soup in soups],
+        "link_generator": lambda: [sum(1 for _ in link_generator(soup)) for soup in soups],
+        "url_relevance": lambda: [url_relevance(href, SEARCH_TERM) for href in hrefs],
+        "redis_index_pipeline": index_pages,
+        "search_index": query_index,
+    }
+
+
+def search_list_benchmark(num_pages, seed=0):
+    """
+    Returns a function that adds num_pages pages to a PageSearchList and
+    takes them all out again.
+    """
+    rng = random.Random(seed)
+    pages = [
+        (f"https://en.wikipedia.org/wiki/Page_{rng.randrange(num_pages)}", rng.random())
+        for _ in range(num_pages)
+    ]
+
+    def fill_and_drain():
+        page_list = PageSearchList(SEARCH_TERM, max_pages=num_pages)
+        for url, score in pages:
+            page_list.add_page(url, score)
+        while page_list.get_page_with_highest_score():
+            pass
+
+    return fill_and_drain
+
+
+def run_benchmarks(args):
+    """
+    Function that runs every benchmark and prints the timings as they finish.
+
+    Returns:
+    - A dictionary of benchmark name to its size and timings.
+    """
+    results = {}
+
+    def record(name, size, unit, function, setup=None):
+        timings = time_function(function, args.repeat, setup)
+        results[name] = {"size": size, "unit": unit, **timings}
+        print(f"{name:>32}: {timings['best'] * 1000:10.2f} ms")
+
+    corpus = synthetic_corpus(args.pages, seed=args.seed)
+    client = benchmark_redis(args.redis_url)
+    for name, function in page_benchmarks(corpus, client).items():
+        setup = None
+        if name == "redis_index_pipeline":
+            # Pages indexed again unchanged write nothing, so every run starts
+            # from an empty database to time the first index of each page.
+            setup = client.flushdb
+        if name == "search_index":
+            # Rank the indexed pages so queries blend both scores.
+            store_page_ranks(client, {url: 1 / len(corpus) for url, _ in corpus})
+        record(name, args.pages, "pages", function, setup)
+
+    for size in args.graph_sizes:
+        record(
+            f"PageSearchList[{size}]", size, "pages", search_list_benchmark(size)
+        )
+
+    for size in args.graph_sizes:
+        sources, targets = power_law_graph(size, seed=args.seed)
+        record(
+            f"pagerank_edges[{size}]",
+            size,
+            "nodes",
+            lambda: pagerank_edges(sources, targets, size),
+        )
+
+        transition_t, dangling = transition_matrix(
+            edge_matrix(sources, targets, size)
+        )
+        vectors = personalization_vectors(size, PERSONALIZED_COUNT, seed=args.seed)
+        record(
+            f"personalized_loop[{size}]",
+            size,
+            "nodes",
+            lambda: [
+                pagerank_power(transition_t, dangling, personalization=vector)
+                for vector in vectors.T
+            ],
+        )
+        record(
+            f"personalized_block[{size}]",
+            size,
+            "nodes",
+            lambda: pagerank_power_block(transition_t, dangling, vectors),
+        )
+
+        # The workers are started once, as a ranking job would, so only the
+        # iteration is timed.
+        with ParallelPageRank(transition_t, dangling, args.processes) as engine:
+            record(f"pagerank_parallel[{size}]", size, "nodes", engine.solve)
+
+        if size <= args.dense_limit:
+            graph = nx.DiGraph()
+            graph.add_nodes_from(range(size))
+            graph.add_edges_from(zip(sources.tolist(), targets.tolist()))
+            record(
+                f"pagerank_numpy[{size}]", size, "nodes", lambda: pagerank_numpy(graph)
+            )
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Function that prints how each benchmark changed since the baseline run.
+
+    Returns:
+    - The names of the benchmarks that got slower by more than threshold.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if before is None:
+            continue
+
+        ratio = result["best"] / before["best"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  <- slower"
+            regressions.append(name)
+        print(f"{name:>32}: {ratio:6.2f}x the baseline time{flag}")
+    return regressions
+
+
+def main():
+    """
+    Runs the suite, saves the results and compares them with a baseline.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument(
+        "--graph-sizes", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument(
+        "--dense-limit",
+        type=int,
+        default=2000,
+        help="largest graph to run the dense pagerank_numpy on",
+    )
+    parser.add_argument(
+        "--processes", type=int, help="workers for pagerank_parallel, one per core"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--redis-url", help="flushed before use")
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--baseline", help="results of an earlier run to compare to")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "redis": args.redis_url or "fakeredis",
+            "pages": args.pages,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "cpus": os.cpu_count(),
+        },
+        "benchmarks": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(report, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fp:
+            regressions = compare(results, json.load(fp), args.threshold)
+        if regressions:
+            sys.exit(f"{len(regressions)} benchmarks got slower: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Module name: benchmarks.bench_wordtools
+
+Compares scoring a page's links one at a time with url_relevance against
+scoring them all at once with url_relevance_batch.
+
+Example usage, from the python-page-rank directory:
+
+    python -m benchmarks.bench_wordtools --links 1000 --term "machine learning"
+
+"""
+
+import argparse
+import random
+import string
+from timeit import repeat
+
+from wordtools import url_relevance, url_relevance_batch
+
+
+def random_hrefs(count, seed=0):
+    """
+    Returns hrefs shaped like Wikipedia article links.
+    """
+    rng = random.Random(seed)
+    hrefs = []
+    for _ in range(count):
+        words = [
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))).title()
+            for _ in range(rng.randint(1, 4))
+        ]
+        hrefs.append("/wiki/" + "_".join(words))
+    return hrefs
+
+
+def main():
+    """
+    Times both scoring functions and checks that they agree.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--term", default="machine learning")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    hrefs = random_hrefs(args.links)
+
+    def one_at_a_time():
+        return [url_relevance(href, args.term) for href in hrefs]
+
+    def batch():
+        return url_relevance_batch(hrefs, args.term)
+
+    if one_at_a_time() != batch():
+        raise SystemExit("url_relevance_batch does not match url_relevance")
+
+    print(f"{args.links} links scored against {args.term!r}")
+    for name, function in (("url_relevance", one_at_a_time), ("batch", batch)):
+        best = min(repeat(function, number=1, repeat=args.repeat))
+        print(f"  {name:>13}: {best * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Module name: benchmarks.fixtures
+
+Reproducible fixture data for the benchmarks: a synthetic Wikipedia-like HTML
+corpus, power-law link graphs and a Redis stand-in. Everything is generated
+from a seed, so two runs on the same machine time the same work.
+"""
+
+import random
+import string
+
+import numpy as np
+from redis import Redis
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def synthetic_vocabulary(size=5000, seed=0):
+    """
+    Returns size distinct lowercase words of 2 to 12 letters.
+    """
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 12))))
+    return sorted(words)
+
+
+def synthetic_title(rng, vocabulary):
+    """
+    Returns an article title of one to four capitalized words.
+    """
+    return "_".join(word.title() for word in rng.sample(vocabulary, rng.randint(1, 4)))
+
+
+def synthetic_page(rng, vocabulary, weights, words=2000, links=150):
+    """
+    Returns the HTML of one page shaped like a Wikipedia article: a head with
+    a script, navigation and footer links around a mw-content-text element
+    holding paragraphs of words drawn with Zipf weights, with /wiki/ links
+    mixed in.
+    """
+    title = synthetic_title(rng, vocabulary)
+    body = rng.choices(vocabulary, weights, k=words)
+    hrefs = [synthetic_title(rng, vocabulary) for _ in range(links)]
+
+    paragraphs = []
+    per_paragraph = max(1, words // 20)
+    links_per_paragraph = max(1, links // 20)
+    for start in range(0, words, per_paragraph):
+        text = " ".join(body[start : start + per_paragraph])
+        anchors = " ".join(
+            f'<a href="/wiki/{href}" title="{href}">{href.replace("_", " ")}</a>'
+            for href in hrefs[: links_per_paragraph]
+        )
+        hrefs = hrefs[links_per_paragraph:]
+        paragraphs.append(f"<p>{text}, {anchors}.</p>")
+
+    navigation = " ".join(
+        f'<li><a href="/wiki/Special:{name}">{name}</a></li>'
+        for name in ("Random", "Search", "RecentChanges", "Upload")
+    )
+    return (
+        "<!DOCTYPE html><html><head>"
+        f"<title>{title.replace('_', ' ')} - Wikipedia</title>"
+        "<script>var config = {'wgTitle': 'x'};</script>"
+        "<style>.mw-body { margin: 0 }</style></head><body>"
+        f'<div id="mw-navigation"><ul>{navigation}</ul></div>'
+        f'<h1 id="firstHeading">{title.replace("_", " ")}</h1>'
+        f'<div id="mw-content-text" class="mw-body-content">{"".join(paragraphs)}</div>'
+        '<div id="footer"><a href="/wiki/Wikipedia:About">About Wikipedia</a></div>'
+        "</body></html>"
+    )
+
+
+def synthetic_corpus(pages=50, words=2000, links=150, seed=0):
+    """
+    Function that generates a corpus of Wikipedia-like pages.
+
+    Parameters:
+    - pages: The number of pages.
+    - words: The number of words in each page's content.
+    - links: The number of /wiki/ links in each page's content.
+    - seed: The random seed.
+
+    Returns:
+    - A list of (url, html) tuples.
+    """
+    rng = random.Random(seed)
+    vocabulary = synthetic_vocabulary(seed=seed)
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+
+    corpus = []
+    for _ in range(pages):
+        url = "https://en.wikipedia.org/wiki/" + synthetic_title(rng, vocabulary)
+        corpus.append((url, synthetic_page(rng, vocabulary, weights, words, links)))
+    return corpus
+
+
+def power_law_graph(num_nodes, average_degree=10, exponent=1.0, seed=0):
+    """
+    Function that generates a directed graph whose in-degrees follow a power
+    law, like links between Wikipedia articles: a few pages are linked from
+    everywhere and most from a handful of pages.
+
+    Parameters:
+    - num_nodes: The number of nodes.
+    - average_degree: The average number of links from each node.
+    - exponent: The power law exponent of the target popularity.
+    - seed: The random seed.
+
+    Returns:
+    - A tuple of int32 arrays of the sources and targets of the links.
+    """
+    rng = np.random.default_rng(seed)
+    num_edges = num_nodes * average_degree
+
+    popularity = np.arange(1, num_nodes + 1, dtype=np.float64) ** -exponent
+    popularity /= popularity.sum()
+    ranks = np.searchsorted(np.cumsum(popularity), rng.random(num_edges))
+    # Shuffled so that the popular pages are not just the lowest node ids.
+    targets = rng.permutation(num_nodes)[np.minimum(ranks, num_nodes - 1)]
+    sources = rng.integers(0, num_nodes, num_edges)
+
+    keep = sources != targets
+    return sources[keep].astype(np.int32), targets[keep].astype(np.int32)
+
+
+def personalization_vectors(num_nodes, count, pages=100, seed=0):
+    """
+    Function that generates personalization vectors like those of search
+    terms, each weighting a few pages by how often they use the term.
+
+    Parameters:
+    - num_nodes: The number of nodes in the graph.
+    - count: The number of vectors.
+    - pages: The number of pages each vector weights.
+    - seed: The random seed.
+
+    Returns:
+    - A num_nodes x count array with one vector per column.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.zeros((num_nodes, count))
+    for column in range(count):
+        nodes = rng.choice(num_nodes, min(pages, num_nodes), replace=False)
+        vectors[nodes, column] = rng.integers(3, 50, len(nodes))
+    return vectors
+
+
+def benchmark_redis(url=None):
+    """
+    Function that returns an empty Redis database to benchmark against.
+
+    Parameters:
+    - url: The URL of a local redis-server, e.g. redis://localhost:6379/15.
+      The database is flushed. Without one, an in-process fakeredis server
+      is used, which needs the fakeredis and lupa packages.
+
+    Returns:
+    - Redis client object used to interact with Redis.
+    """
+    if url:
+        client = Redis.from_url(url)
+    elif fakeredis is not None:
+        client = fakeredis.FakeRedis()
+    else:
+        raise RuntimeError("Install fakeredis and lupa, or pass --redis-url.")
+
+    client.flushdb()
+    return client
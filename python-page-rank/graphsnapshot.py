@@ -0,0 +1,359 @@
+"""
+Module name: graphsnapshot
+
+Saves the link graph to a binary snapshot file, so ranking and query
+processes can start from it instead of reading every Links:{id} set from
+Redis.
+
+The file starts with a fixed header: the magic bytes, the format version and
+the length of a JSON metadata block. The metadata holds the size of the graph,
+when it was written, any extra fields given by the writer and the position of
+each array. The arrays follow, each aligned to 64 bytes:
+
+    offsets      int64[num_nodes + 1]  CSR row offsets into targets
+    targets      int32[num_edges]      target node id of each link, by source
+    url_offsets  int64[num_nodes + 1]  offsets into url_bytes
+    url_bytes    uint8[...]            the UTF-8 URLs of the nodes, end to end
+
+Snapshots are written to a temporary file that is renamed over the old one,
+so readers never see a partial file. They are opened with numpy.memmap, so
+opening takes milliseconds whatever the size of the graph, and processes that
+open the same file share its pages in the OS page cache.
+
+A snapshot does not change when the crawl writes new links to Redis, and
+links that expire stay in it. Crawling records the time of its last link
+write, and is_stale() compares it with the time the snapshot was taken, so
+a process can tell that the snapshot should be written again.
+
+Example usage:
+
+    python graphsnapshot.py write graph.snapshot
+    python graphsnapshot.py info graph.snapshot
+    python main.py --snapshot graph.snapshot
+
+"""
+
+import argparse
+import json
+import os
+import struct
+import tempfile
+from time import perf_counter, time
+
+import numpy as np
+import scipy.sparse as sp
+
+from linkgraph import LinkGraph, load_link_graph
+from pagerank import pagerank_power, transition_matrix
+from redistools import LINKS_UPDATED_KEY, connect_to_redis
+
+MAGIC = b"PRGRAPH\0"
+FORMAT_VERSION = 1
+
+# Magic bytes, format version and the length of the JSON metadata.
+HEADER = struct.Struct("<8sII")
+ALIGNMENT = 64
+
+SECTIONS = (
+    ("offsets", np.int64),
+    ("targets", np.int32),
+    ("url_offsets", np.int64),
+    ("url_bytes", np.uint8),
+)
+
+
+class UrlTable:
+    """
+    The URLs of a snapshot's nodes, decoded from the mapped bytes on access.
+    It can be indexed and iterated like the list of URLs of a LinkGraph.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, node_id):
+        if isinstance(node_id, slice):
+            return [self[index] for index in range(*node_id.indices(len(self)))]
+        if node_id < 0:
+            node_id += len(self)
+        if not 0 <= node_id < len(self):
+            raise IndexError("node id out of range")
+
+        start, end = self.offsets[node_id], self.offsets[node_id + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode("utf-8")
+
+
+class GraphSnapshot:
+    """
+    A link graph snapshot opened with numpy.memmap.
+
+    Attributes
+    ----------
+    path : str
+        The snapshot file.
+    metadata : dict
+        The metadata block, e.g. num_nodes, num_edges and created.
+    offsets : numpy.memmap of int64
+        The CSR row offsets: the links of node i are
+        targets[offsets[i]:offsets[i + 1]].
+    targets : numpy.memmap of int32
+        The target node id of each link, grouped by source.
+    urls : UrlTable
+        The URL of each node, by node id.
+
+    Methods
+    -------
+    links(node_id)
+        Returns the node ids a node links to.
+    sources()
+        Returns the source node id of each link.
+    link_graph()
+        Returns the snapshot as a linkgraph.LinkGraph.
+    adjacency()
+        Returns the sparse adjacency matrix on the mapped arrays.
+    page_ranks(alpha)
+        Calculates the pagerank of every page.
+    is_stale(r)
+        Returns whether links were written to Redis after the snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fp:
+            magic, version, metadata_length = HEADER.unpack(fp.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a link graph snapshot.")
+            if version != FORMAT_VERSION:
+                raise ValueError(
+                    f"{path} has snapshot format {version}, "
+                    f"expected {FORMAT_VERSION}."
+                )
+            self.metadata = json.loads(fp.read(metadata_length))
+
+        # The whole file is mapped once and each array is a view into it.
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays = {}
+        for name, dtype in SECTIONS:
+            offset, length = self.metadata["sections"][name]
+            size = length * np.dtype(dtype).itemsize
+            arrays[name] = data[offset : offset + size].view(dtype)
+
+        self.offsets = arrays["offsets"]
+        self.targets = arrays["targets"]
+        self.urls = UrlTable(arrays["url_offsets"], arrays["url_bytes"])
+
+    @property
+    def num_nodes(self):
+        """
+        The number of pages in the graph.
+        """
+        return len(self.offsets) - 1
+
+    @property
+    def num_edges(self):
+        """
+        The number of links in the graph.
+        """
+        return len(self.targets)
+
+    def links(self, node_id):
+        """
+        Returns the node ids the given node links to.
+        """
+        return self.targets[self.offsets[node_id] : self.offsets[node_id + 1]]
+
+    def sources(self):
+        """
+        Returns the source node id of each link, in the order of targets.
+        """
+        return np.repeat(
+            np.arange(self.num_nodes, dtype=np.int32), np.diff(self.offsets)
+        )
+
+    def link_graph(self):
+        """
+        Returns the snapshot as a LinkGraph for the code that takes one, e.g.
+        IncrementalPageRank.from_link_graph. The targets and URLs stay mapped.
+        """
+        return LinkGraph(self.urls, self.sources(), self.targets)
+
+    def adjacency(self):
+        """
+        Returns the sparse adjacency matrix of the graph, built on the mapped
+        CSR arrays without sorting the links again.
+        """
+        offsets = self.offsets
+        if self.num_edges < np.iinfo(np.int32).max:
+            # With offsets of the same type as the targets, scipy uses the
+            # mapped targets as they are instead of copying them to int64.
+            offsets = offsets.astype(np.int32)
+
+        adjacency = sp.csr_array(
+            (np.ones(self.num_edges), self.targets, offsets),
+            shape=(self.num_nodes, self.num_nodes),
+        )
+        # Links were deduplicated when the snapshot was written.
+        adjacency.has_canonical_format = True
+        return adjacency
+
+    def page_ranks(self, alpha=0.85, **kwargs):
+        """
+        Calculates the pagerank of every page in the graph.
+
+        Parameters:
+        - alpha: Damping parameter for PageRank.
+        - kwargs: Passed on to pagerank.pagerank_power.
+
+        Returns:
+        - A dictionary of URL to pagerank score.
+        """
+        transition_t, dangling = transition_matrix(self.adjacency())
+        ranks = pagerank_power(transition_t, dangling, alpha, **kwargs)
+        return dict(zip(self.urls, map(float, ranks)))
+
+    def is_stale(self, r):
+        """
+        Returns whether links were added or removed in Redis after the
+        snapshot was taken, so it is missing them.
+
+        Parameters:
+        - r: Redis client object used to interact with Redis.
+        """
+        updated = r.get(LINKS_UPDATED_KEY)
+        return updated is not None and float(updated) > self.metadata["created"]
+
+    def __str__(self):
+        return (
+            f"Link graph snapshot with {self.num_nodes} pages and "
+            f"{self.num_edges} links, format {FORMAT_VERSION}."
+        )
+
+
+def _aligned(position):
+    """
+    Returns the first multiple of ALIGNMENT at or after position.
+    """
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(graph, path, **metadata):
+    """
+    Function that writes a link graph to a snapshot file. Duplicate links
+    are dropped and the links are sorted by source.
+
+    The file is written next to the destination and renamed over it once
+    it is complete, so a process opening the path sees either the old
+    snapshot or the new one.
+
+    Parameters:
+    - graph: The linkgraph.LinkGraph to save.
+    - path: The snapshot file to write.
+    - metadata: Extra JSON-serializable fields to store in the metadata.
+      created defaults to now; pass the time the graph was read instead,
+      so links written while writing the snapshot make it stale.
+
+    Returns:
+    - The metadata that was written.
+    """
+    num_nodes = graph.num_nodes
+    # Each link as one integer, sorted by source then target; sorting and
+    # dropping repeats is much faster than numpy.unique on large graphs.
+    edges = np.asarray(graph.sources, dtype=np.int64) * num_nodes
+    edges += np.asarray(graph.targets, dtype=np.int64)
+    edges.sort()
+    if len(edges):
+        edges = edges[np.concatenate(([True], edges[1:] != edges[:-1]))]
+    sources, targets = np.divmod(edges, max(num_nodes, 1))
+    offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=offsets[1:])
+
+    encoded = [url.encode("utf-8") for url in graph.urls]
+    url_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum([len(url) for url in encoded], out=url_offsets[1:])
+
+    arrays = {
+        "offsets": offsets,
+        "targets": targets.astype(np.int32),
+        "url_offsets": url_offsets,
+        "url_bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+    }
+
+    metadata = {
+        "created": time(),
+        **metadata,
+        "num_nodes": num_nodes,
+        "num_edges": len(targets),
+    }
+
+    # The positions of the arrays depend on the length of the metadata that
+    # holds them, so the metadata is given room for the largest positions.
+    metadata["sections"] = {name: [0, 0] for name in arrays}
+    reserved = len(json.dumps(metadata)) + 40 * len(arrays)
+    position = _aligned(HEADER.size + reserved)
+    for name, array in arrays.items():
+        metadata["sections"][name] = [position, len(array)]
+        position = _aligned(position + array.nbytes)
+
+    encoded_metadata = json.dumps(metadata).encode("utf-8")
+    encoded_metadata += b" " * (reserved - len(encoded_metadata))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded_metadata)))
+            fp.write(encoded_metadata)
+            for name, array in arrays.items():
+                fp.seek(metadata["sections"][name][0])
+                fp.write(array.tobytes())
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+    return metadata
+
+
+def main():
+    """
+    Writes a snapshot of the link graph in Redis, or describes a snapshot.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("command", choices=["write", "info"])
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "write":
+        created = time()
+        start = perf_counter()
+        graph = load_link_graph(connect_to_redis())
+        loaded = perf_counter()
+        write_snapshot(graph, args.path, source="redis", created=created)
+        print(
+            f"Loaded {graph.num_nodes} pages and {graph.num_edges} links in "
+            f"{loaded - start:.2f} seconds and wrote them to {args.path} in "
+            f"{perf_counter() - loaded:.2f} seconds."
+        )
+        return
+
+    start = perf_counter()
+    snapshot = GraphSnapshot(args.path)
+    print(f"{snapshot} Opened in {(perf_counter() - start) * 1000:.1f} ms.")
+    print(json.dumps(snapshot.metadata, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Module name: incrementalrank
+
+Keeps pagerank scores up to date while the crawl adds pages and links, instead
+of recomputing them from scratch.
+
+Scores are kept scaled so they sum to about the number of pages, together
+with a residual for every page: the part of the solution that has not been
+pushed into the scores yet. A change to one page's links only changes the
+residuals of the pages it links to, so refresh() pushes residual mass from
+page to page along the links, in the style of approximate personalized
+pagerank, and only touches the part of the graph near the change.
+
+Rank flowing out of dangling pages is spread over every page. The same
+residual u on every page adds u / (1 - alpha) times the solution itself to
+it, so instead of pushing it from every page, it is applied to all scores and
+residuals at once by dividing them by 1 - u / (1 - alpha). The scores and
+residuals are stored divided by a single scale factor, so this is one update
+of that factor.
+"""
+
+from collections import deque
+
+import numpy as np
+
+from linkgraph import LinkGraph
+from pagerank import edge_matrix, pagerank_power, transition_matrix
+
+
+class IncrementalPageRank:
+    """
+    Pagerank scores for a growing link graph.
+
+    Attributes
+    ----------
+    alpha : float
+        Damping parameter for PageRank.
+    tolerance : float
+        Largest residual left on a single page after refresh(), relative to
+        an average page score of 1.
+
+    Methods
+    -------
+    set_links(url, links)
+        Replaces the out links of the given page.
+    refresh()
+        Brings the scores up to date after changes to the graph.
+    recompute()
+        Recalculates the scores over the whole graph with power iteration.
+    ranks()
+        Returns the pagerank of every page.
+    link_graph()
+        Returns the current graph as a linkgraph.LinkGraph.
+    """
+
+    def __init__(self, alpha=0.85, tolerance=1.0e-4):
+        self.alpha = alpha
+        self.tolerance = tolerance
+
+        self.urls = []
+        self._node_ids = {}
+        self._out_links = []
+        self._scores = []
+        self._residuals = []
+
+        # The links of the pages from from_link_graph, as CSR arrays. A page's
+        # entry in _out_links stays None until its links are first needed.
+        self._link_offsets = np.zeros(1, dtype=np.int64)
+        self._link_targets = np.zeros(0, dtype=np.int32)
+
+        # The stored scores and residuals are multiplied by the scale to give
+        # the actual ones. The total score of dangling pages is stored the
+        # same way.
+        self._scale = 1.0
+        self._dangling_score = 0.0
+        self._needs_recompute = False
+
+        self._queue = deque()
+        self._queued = set()
+
+    @classmethod
+    def from_link_graph(cls, graph, **kwargs):
+        """
+        Creates the ranker for a linkgraph.LinkGraph and solves it.
+
+        Parameters:
+        - graph: The LinkGraph to start from.
+        - kwargs: Passed on to IncrementalPageRank.
+
+        Returns:
+        - An IncrementalPageRank with up to date scores.
+        """
+        ranker = cls(**kwargs)
+        ranker.urls = list(graph.urls)
+        num_nodes = len(ranker.urls)
+        ranker._node_ids = dict(zip(ranker.urls, range(num_nodes)))
+        ranker._out_links = [None] * num_nodes
+        ranker._scores = [0.0] * num_nodes
+        ranker._residuals = [0.0] * num_nodes
+
+        # The links stay in arrays sorted by source instead of being added
+        # one at a time, which takes seconds for millions of links.
+        sources = np.asarray(graph.sources)
+        ranker._link_targets = np.asarray(graph.targets)[
+            np.argsort(sources, kind="stable")
+        ]
+        ranker._link_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(sources, minlength=num_nodes), out=ranker._link_offsets[1:]
+        )
+
+        ranker._recompute(graph)
+        return ranker
+
+    def __len__(self):
+        return len(self.urls)
+
+    def add_page(self, url):
+        """
+        Adds the given page to the graph if it is not already in it.
+
+        Parameters:
+        - url: The URL of the page.
+
+        Returns:
+        - The node id of the page.
+        """
+        node_id = self._node_ids.get(url)
+        if node_id is not None:
+            return node_id
+
+        old_count = len(self.urls)
+        node_id = self._node_ids[url] = old_count
+        self.urls.append(url)
+        self._out_links.append([])
+        self._scores.append(0.0)
+
+        # Dangling pages now share their rank with one more page, which
+        # lowers the residual of every other page by the same amount.
+        dangling_rank = self.alpha * self._dangling_score * self._scale
+        dangling_share = dangling_rank / (old_count + 1)
+        uniform = dangling_share - dangling_rank / old_count if old_count else 0.0
+
+        self._residuals.append(
+            ((1 - self.alpha) + dangling_share - uniform) / self._scale
+        )
+        self._add_uniform_residual(uniform)
+        self._enqueue(node_id)
+        return node_id
+
+    def set_links(self, url, links):
+        """
+        Replaces the out links of the given page, adding any new pages.
+
+        Parameters:
+        - url: The URL of the page.
+        - links: The URLs the page links to.
+        """
+        node_id = self.add_page(url)
+        new_links = [self.add_page(link) for link in dict.fromkeys(links)]
+
+        score = self._scores[node_id]
+        self._move_score(node_id, score, -1)
+        self._out_links[node_id] = new_links
+        self._move_score(node_id, score, 1)
+
+    def _links(self, node_id):
+        """
+        Returns the node ids the given page links to, taking them from the
+        arrays of from_link_graph the first time.
+        """
+        links = self._out_links[node_id]
+        if links is None:
+            start, end = self._link_offsets[node_id : node_id + 2]
+            links = self._out_links[node_id] = self._link_targets[start:end].tolist()
+        return links
+
+    def _move_score(self, node_id, score, sign):
+        """
+        Adds (sign=1) or removes (sign=-1) the rank the given page passes on
+        through its current links to the residuals.
+        """
+        links = self._links(node_id)
+        if links:
+            share = sign * self.alpha * score / len(links)
+            for link in links:
+                self._residuals[link] += share
+                self._enqueue(link)
+        else:
+            self._dangling_score += sign * score
+            self._add_uniform_residual(
+                sign * self.alpha * score * self._scale / len(self.urls)
+            )
+
+    def _add_uniform_residual(self, residual):
+        """
+        Adds the given residual to every page by rescaling the solution, see
+        the module docstring. A residual too large for that to be accurate
+        makes the next refresh() recompute the scores instead.
+        """
+        correction = residual / (1 - self.alpha)
+        if correction > 0.5:
+            self._needs_recompute = True
+        else:
+            self._scale /= 1 - correction
+
+    def _enqueue(self, node_id):
+        if node_id not in self._queued:
+            self._queued.add(node_id)
+            self._queue.append(node_id)
+
+    def refresh(self):
+        """
+        Brings the scores up to date by pushing residuals along the links of
+        the pages that changed since the last refresh. Falls back to
+        recompute() when a dangling page's rank changed too much to rescale.
+        """
+        if self._needs_recompute or not self._push():
+            self.recompute()
+            self._push()
+
+    def _push(self):
+        """
+        Pushes residuals until every queued page is within the tolerance.
+
+        Returns:
+        - False if it stopped early because the scores need to be recomputed,
+          True otherwise.
+        """
+        alpha = self.alpha
+        tolerance = self.tolerance
+        scores = self._scores
+        residuals = self._residuals
+        out_links = self._out_links
+        queue = self._queue
+        queued = self._queued
+
+        while queue:
+            if self._needs_recompute:
+                return False
+
+            node_id = queue.popleft()
+            queued.discard(node_id)
+
+            pushed = residuals[node_id]
+            if abs(pushed * self._scale) <= tolerance:
+                continue
+
+            scores[node_id] += pushed
+            residuals[node_id] = 0.0
+
+            links = out_links[node_id]
+            if links is None:
+                links = self._links(node_id)
+            if not links:
+                self._dangling_score += pushed
+                self._add_uniform_residual(alpha * pushed * self._scale / len(scores))
+                continue
+
+            share = alpha * pushed / len(links)
+            for link in links:
+                residuals[link] += share
+                if link not in queued:
+                    queued.add(link)
+                    queue.append(link)
+
+        return not self._needs_recompute
+
+    def recompute(self, tol=1.0e-6, max_iter=100):
+        """
+        Recalculates the scores with power iteration over the whole graph,
+        starting from the current scores, and resets the residuals to match.
+
+        Parameters:
+        - tol: Tolerance passed on to pagerank.pagerank_power.
+        - max_iter: Maximum number of power iterations.
+        """
+        self._recompute(self.link_graph(), tol, max_iter)
+
+    def _recompute(self, graph, tol=1.0e-6, max_iter=100):
+        """
+        Does the work of recompute() on the given LinkGraph, which must have
+        the same pages and links as the ranker.
+        """
+        num_nodes = len(self.urls)
+        self._queue.clear()
+        self._queued.clear()
+        if num_nodes == 0:
+            return
+
+        transition_t, dangling = transition_matrix(
+            edge_matrix(graph.sources, graph.targets, num_nodes)
+        )
+
+        start = np.asarray(self._scores) * self._scale
+        if start.sum() <= 0:
+            start = None
+        ranks = pagerank_power(
+            transition_t, dangling, self.alpha, start=start, tol=tol, max_iter=max_iter
+        )
+
+        scores = ranks * num_nodes
+        dangling_score = scores[dangling].sum()
+        residuals = (
+            (1 - self.alpha)
+            + self.alpha * (transition_t @ scores + dangling_score / num_nodes)
+            - scores
+        )
+
+        self._scores = scores.tolist()
+        self._residuals = residuals.tolist()
+        self._dangling_score = float(dangling_score)
+        self._scale = 1.0
+        self._needs_recompute = False
+
+        pending = np.flatnonzero(np.abs(residuals) > self.tolerance).tolist()
+        self._queue.extend(pending)
+        self._queued.update(pending)
+
+    def link_graph(self):
+        """
+        Returns the pages and links the scores are for as a LinkGraph, with
+        the same node ids as the ranker.
+        """
+        out_links = [self._links(node_id) for node_id in range(len(self.urls))]
+        degrees = [len(links) for links in out_links]
+        sources = np.repeat(np.arange(len(self.urls), dtype=np.int32), degrees)
+        targets = np.fromiter(
+            (link for links in out_links for link in links),
+            dtype=np.int32,
+            count=len(sources),
+        )
+        return LinkGraph(list(self.urls), sources, targets)
+
+    def ranks(self):
+        """
+        Returns the pagerank of every page, scaled to sum to 1.
+
+        Returns:
+        - A dictionary of URL to pagerank score.
+        """
+        total = sum(self._scores)
+        if total <= 0:
+            return {}
+
+        return {url: score / total for url, score in zip(self.urls, self._scores)}
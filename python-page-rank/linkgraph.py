@@ -0,0 +1,123 @@
+"""
+Module name: linkgraph
+
+Builds the link graph for pagerank straight from the Links:{id} sets in Redis,
+as integer edge arrays rather than a NetworkX graph.
+"""
+
+from array import array
+
+import numpy as np
+from redis import Redis
+
+from pagerank import pagerank_edges
+from redistools import get_doc_urls
+
+LINKS_PREFIX = b"Links:"
+
+
+class LinkGraph:
+    """
+    A directed link graph with URLs interned to integer node ids.
+
+    Attributes
+    ----------
+    urls : list of str
+        The URL of each node, indexed by node id.
+    sources : numpy.ndarray of int32
+        The node id at the start of each link.
+    targets : numpy.ndarray of int32
+        The node id at the end of each link.
+    """
+
+    def __init__(self, urls, sources, targets):
+        self.urls = urls
+        self.sources = sources
+        self.targets = targets
+
+    @property
+    def num_nodes(self):
+        """
+        The number of pages in the graph.
+        """
+        return len(self.urls)
+
+    @property
+    def num_edges(self):
+        """
+        The number of links in the graph.
+        """
+        return len(self.sources)
+
+    def page_ranks(self, alpha=0.85, **kwargs):
+        """
+        Calculates the pagerank of every page in the graph.
+
+        Parameters:
+        - alpha: Damping parameter for PageRank.
+        - kwargs: Passed on to pagerank.pagerank_power.
+
+        Returns:
+        - A dictionary of URL to pagerank score.
+        """
+        ranks = pagerank_edges(
+            self.sources, self.targets, self.num_nodes, alpha, **kwargs
+        )
+        return dict(zip(self.urls, map(float, ranks)))
+
+    def __str__(self):
+        return f"Link graph with {self.num_nodes} pages and {self.num_edges} links."
+
+
+def load_link_graph(r: Redis, batch_size=1000):
+    """
+    Function that reads every Links:{id} set from Redis into a LinkGraph.
+
+    Keys are found with SCAN and their members are fetched batch_size keys
+    at a time in a single pipeline. The links are doc ids, so they are
+    accumulated in typed arrays and only renumbered to consecutive node ids
+    at the end. The URL of each node is then read from the DocUrl hash.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - batch_size: The number of keys to fetch per SCAN call and per pipeline.
+
+    Returns:
+    - A LinkGraph of all the stored links.
+    """
+    sources = array("q")
+    targets = array("q")
+
+    def load_batch(keys):
+        p = r.pipeline(transaction=False)
+        for key in keys:
+            p.smembers(key)
+
+        for key, links in zip(keys, p.execute()):
+            source = int(key[len(LINKS_PREFIX) :])
+            sources.extend([source] * len(links))
+            targets.extend(map(int, links))
+
+    batch = []
+    for key in r.scan_iter(match=LINKS_PREFIX + b"*", count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            load_batch(batch)
+            batch = []
+
+    if batch:
+        load_batch(batch)
+
+    source_ids = np.frombuffer(sources, dtype=np.int64)
+    target_ids = np.frombuffer(targets, dtype=np.int64)
+    doc_ids = np.unique(np.concatenate([source_ids, target_ids]))
+
+    urls = []
+    for start in range(0, len(doc_ids), batch_size):
+        urls += get_doc_urls(r, doc_ids[start : start + batch_size].tolist())
+
+    return LinkGraph(
+        urls,
+        np.searchsorted(doc_ids, source_ids).astype(np.int32),
+        np.searchsorted(doc_ids, target_ids).astype(np.int32),
+    )
@@ -10,16 +10,33 @@ handles the user input, and the search term by fetching the search page,
 creating the page index, and updating relevant pagerank scores, and then
 returning the relevant links sorted by a hybrid scoring system.
 
+It runs interactively by default, or as a long-running HTTP/JSON query
+server with the serve argument (see server.py).
+
 Example usage:
 
     python main.py
+    python main.py serve --host 0.0.0.0 --port 8080
+    python main.py --metrics-log metrics.jsonl
+    python main.py --personalized
+    python main.py --snapshot graph.snapshot
 
 """
 
+import argparse
+import asyncio
+import atexit
 import sys
 
+from graphsnapshot import GraphSnapshot
+from incrementalrank import IncrementalPageRank
+from linkgraph import load_link_graph
+from metrics import MetricsLogger, metrics
+from pagecache import PageCache
 from redistools import connect_to_redis
-from search import handle_search_term
+from search import handle_search_term_async
+from server import serve
+from termrank import TermRanker
 
 
 def main():
@@ -29,7 +46,53 @@ def main():
     and updating relevant pagerank scores, and then returning the relevant links
     sorted by a hybrid scoring system
     """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[3])
+    parser.add_argument("mode", nargs="?", choices=["interactive", "serve"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--metrics", action="store_true", help="record metrics")
+    parser.add_argument(
+        "--metrics-log", help="file to append a JSON line of metrics to"
+    )
+    parser.add_argument("--metrics-interval", type=float, default=10.0)
+    parser.add_argument(
+        "--snapshot",
+        help="start from this link graph snapshot instead of the links in Redis, "
+        "without the links written to Redis after it was taken",
+    )
+    parser.add_argument(
+        "--personalized",
+        action="store_true",
+        help="rank results by pagerank personalized to the search term",
+    )
+    args = parser.parse_args()
+
+    if args.metrics or args.metrics_log:
+        metrics.enable()
+    if args.metrics_log:
+        logger = MetricsLogger(metrics, args.metrics_log, args.metrics_interval)
+        logger.start()
+        atexit.register(logger.stop)
+
     redis_client = connect_to_redis()
+    if args.snapshot:
+        snapshot = GraphSnapshot(args.snapshot)
+        if snapshot.is_stale(redis_client):
+            print(
+                f"{args.snapshot} is older than the links in Redis, run "
+                f"python graphsnapshot.py write {args.snapshot} to update it.",
+                file=sys.stderr,
+            )
+        graph = snapshot.link_graph()
+    else:
+        graph = load_link_graph(redis_client)
+    ranker = IncrementalPageRank.from_link_graph(graph)
+    term_ranker = TermRanker(graph) if args.personalized else None
+    cache = PageCache()
+
+    if args.mode == "serve":
+        serve(redis_client, ranker, args.host, args.port, term_ranker, cache=cache)
+        return
 
     while True:
 
@@ -38,7 +101,11 @@ def main():
         if handle_command(search_term):
             continue
 
-        handle_search_term(redis_client, search_term)
+        asyncio.run(
+            handle_search_term_async(
+                redis_client, search_term, ranker, term_ranker, cache=cache
+            )
+        )
 
 
 def handle_command(search_term):
@@ -0,0 +1,327 @@
+"""
+Module name: metrics
+
+Counters, gauges and histograms for the crawl and query stages, exported as
+periodic JSON lines or in the Prometheus text format.
+
+Metrics are disabled by default, and then every call returns after checking a
+single attribute, so the instrumentation can stay in the hot paths. Enable
+them with `metrics.enable()` or by starting main.py with --metrics.
+
+Example usage:
+
+    from metrics import metrics
+
+    with metrics.timer("fetch_seconds"):
+        html = fetch(url)
+    metrics.count("fetch_bytes_total", len(html))
+    metrics.set_gauge("frontier_size", len(page_list))
+
+"""
+
+import json
+import threading
+from bisect import bisect_left
+from time import perf_counter, time
+
+# Upper bounds of the histogram buckets, in seconds: 100 microseconds to 10
+# seconds, covering Redis round trips up to slow page fetches.
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+PROMETHEUS_PREFIX = "pagerank_"
+
+
+class Histogram:
+    """
+    Counts observations in the BUCKETS, plus their total and sum.
+    """
+
+    __slots__ = ("buckets", "count", "sum")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Adds an observation.
+        """
+        self.buckets[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket holding the q quantile, or
+        None if nothing has been observed.
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound, bucket in zip(BUCKETS, self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _Timer:
+    """
+    Observes the seconds spent in a with block in a histogram.
+    """
+
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, perf_counter() - self.start)
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        self.__exit__(*exc_info)
+
+
+class _NullTimer:
+    """
+    Stands in for _Timer while metrics are disabled.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    A registry of named metrics.
+
+    Attributes
+    ----------
+    enabled : bool
+        Whether calls record anything.
+    counters : dict
+        Monotonic totals, e.g. pages fetched or bytes downloaded.
+    gauges : dict
+        Current values, e.g. the frontier size.
+    histograms : dict
+        Distributions of timings, by name.
+
+    Methods
+    -------
+    enable()
+        Starts recording.
+    count(name, value)
+        Adds to a counter.
+    set_gauge(name, value)
+        Sets a gauge.
+    observe(name, value)
+        Adds an observation to a histogram.
+    timer(name)
+        Returns a context manager that observes its duration.
+    snapshot()
+        Returns every metric as a JSON-serializable dictionary.
+    to_prometheus()
+        Returns every metric in the Prometheus text format.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def enable(self):
+        """
+        Starts recording metrics.
+        """
+        self.enabled = True
+
+    def count(self, name, value=1):
+        """
+        Adds value to the named counter.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """
+        Sets the named gauge to value.
+        """
+        if not self.enabled:
+            return
+        self.gauges[name] = value
+
+    def observe(self, name, value):
+        """
+        Adds value to the named histogram.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name):
+        """
+        Returns a context manager that observes the seconds spent in its
+        block in the named histogram. It can be used with `with` or
+        `async with`.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def snapshot(self):
+        """
+        Returns the current value of every metric. Histograms are summarized
+        by their count, sum, mean and approximate 50th and 99th percentiles.
+        """
+        with self.lock:
+            histograms = {
+                name: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "mean": histogram.sum / histogram.count,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                }
+                for name, histogram in self.histograms.items()
+                if histogram.count
+            }
+            return {
+                "time": time(),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": histograms,
+            }
+
+    def to_prometheus(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} counter")
+                lines.append(f"{PROMETHEUS_PREFIX}{name} {value}")
+
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} gauge")
+                lines.append(f"{PROMETHEUS_PREFIX}{name} {value}")
+
+            for name, histogram in sorted(self.histograms.items()):
+                full_name = PROMETHEUS_PREFIX + name
+                lines.append(f"# TYPE {full_name} histogram")
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS, histogram.buckets):
+                    cumulative += bucket
+                    lines.append(f'{full_name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{full_name}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{full_name}_sum {histogram.sum}")
+                lines.append(f"{full_name}_count {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsLogger(threading.Thread):
+    """
+    A daemon thread that appends a JSON line with a snapshot of the metrics
+    to a file every interval seconds. Each line also has the rate per second
+    of every counter since the previous line, e.g. pages indexed per second.
+
+    Attributes
+    ----------
+    registry : Metrics
+        The metrics to log.
+    path : str
+        The file to append to.
+    interval : float
+        Seconds between lines.
+    """
+
+    def __init__(self, registry, path, interval=10.0):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        previous = self.registry.snapshot()
+        while not self.stopped.wait(self.interval):
+            previous = self.write_line(previous)
+        self.write_line(previous)
+
+    def write_line(self, previous):
+        """
+        Appends one snapshot to the log and returns it.
+        """
+        snapshot = self.registry.snapshot()
+        elapsed = snapshot["time"] - previous["time"]
+        if elapsed > 0:
+            snapshot["rates"] = {
+                name: (value - previous["counters"].get(name, 0)) / elapsed
+                for name, value in snapshot["counters"].items()
+            }
+
+        with open(self.path, "a", encoding="utf-8") as fp:
+            fp.write(json.dumps(snapshot) + "\n")
+        return snapshot
+
+    def stop(self):
+        """
+        Writes a last line and stops the thread.
+        """
+        self.stopped.set()
+        self.join()
+
+
+metrics = Metrics()
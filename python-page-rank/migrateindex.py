@@ -0,0 +1,279 @@
+"""
+Module name: migrateindex
+
+Migrates an index written by older versions, which kept every count twice:
+in an Index:{word} hash and in the IndexSorted:{word} sorted set. Counts that
+are only in the hash are copied into the sorted set, then the hash is deleted.
+
+Before migrating, the memory used by both structures is measured with
+MEMORY USAGE on a sample of words, to show what dropping the hashes saves.
+
+Older versions also stored full URLs in the IndexSorted:{word} sorted sets,
+the Links:{url} sets and the PageRank sorted set. These are rewritten to use
+the doc ids from the DocId hash, and the memory per key is measured before
+and after.
+
+Re-indexing a page only writes the changes to its words, which it finds in
+the page's PageWords:{id} hash. For pages indexed by older versions the
+hashes are built from the IndexSorted:{word} sorted sets.
+
+Example usage:
+
+    python migrateindex.py --sample 1000
+
+"""
+
+import argparse
+
+from redis import Redis
+
+from redistools import PAGE_RANK_KEY, _decode, connect_to_redis, get_doc_ids
+
+
+def index_memory_usage(r: Redis, sample_size=1000):
+    """
+    Function that measures the memory used by the Index:{word} hashes and the
+    IndexSorted:{word} sorted sets for a sample of indexed words.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - sample_size: The number of words to measure.
+
+    Returns:
+    - A tuple of the number of words sampled, the bytes used by their hashes
+      and the bytes used by their sorted sets.
+    """
+    words = []
+    for key in r.scan_iter(match="IndexSorted:*", count=sample_size):
+        words.append(_decode(key)[len("IndexSorted:") :])
+        if len(words) >= sample_size:
+            break
+
+    p = r.pipeline(transaction=False)
+    for word in words:
+        p.memory_usage(f"Index:{word}")
+        p.memory_usage(f"IndexSorted:{word}")
+    usage = [size or 0 for size in p.execute()]
+
+    return len(words), sum(usage[::2]), sum(usage[1::2])
+
+
+def migrate_index(r: Redis, batch_size=500):
+    """
+    Function that copies the counts in the Index:{word} hashes that are missing
+    from the IndexSorted:{word} sorted sets, and deletes the hashes.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - batch_size: The number of hashes to migrate per pipeline.
+
+    Returns:
+    - The number of hashes migrated.
+    """
+    migrated = 0
+    batch = []
+
+    def migrate_batch(keys):
+        p = r.pipeline(transaction=False)
+        for key in keys:
+            p.hgetall(key)
+        hashes = p.execute()
+
+        p = r.pipeline(transaction=False)
+        for key, counts in zip(keys, hashes):
+            if counts:
+                sorted_set_key = f"IndexSorted:{_decode(key)[len('Index:') :]}"
+                counts = {url: int(count) for url, count in counts.items()}
+                p.zadd(sorted_set_key, counts, nx=True)
+            p.delete(key)
+        p.execute()
+
+    for key in r.scan_iter(match="Index:*", count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            migrate_batch(batch)
+            migrated += len(batch)
+            batch = []
+
+    if batch:
+        migrate_batch(batch)
+        migrated += len(batch)
+
+    return migrated
+
+
+def key_memory_usage(r: Redis, pattern, sample_size=1000):
+    """
+    Function that measures the memory used by a sample of the keys matching
+    the given pattern.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - pattern: The SCAN pattern of the keys to measure.
+    - sample_size: The number of keys to measure.
+
+    Returns:
+    - A tuple of the number of keys sampled and the bytes they use.
+    """
+    keys = []
+    for key in r.scan_iter(match=pattern, count=sample_size):
+        keys.append(key)
+        if len(keys) >= sample_size:
+            break
+
+    p = r.pipeline(transaction=False)
+    for key in keys:
+        p.memory_usage(key)
+    return len(keys), sum(size or 0 for size in p.execute())
+
+
+def migrate_sorted_set_to_doc_ids(r: Redis, key):
+    """
+    Function that replaces the URL members of a sorted set with their doc ids.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - key: The key of the sorted set.
+
+    Returns:
+    - True if the sorted set had URL members.
+    """
+    scores = r.zrange(key, 0, -1, withscores=True)
+    url_scores = [(member, score) for member, score in scores if not member.isdigit()]
+    if not url_scores:
+        return False
+
+    doc_ids = get_doc_ids(r, [member for member, _ in url_scores])
+    p = r.pipeline(transaction=True)
+    p.zrem(key, *(member for member, _ in url_scores))
+    p.zadd(key, {doc_id: score for doc_id, (_, score) in zip(doc_ids, url_scores)})
+    p.execute()
+    return True
+
+
+def migrate_doc_ids(r: Redis, batch_size=500):
+    """
+    Function that rewrites the IndexSorted:{word} sorted sets, the
+    Links:{url} sets and the PageRank sorted set to hold doc ids instead of
+    URLs. Keys that already hold doc ids are left alone, so the migration can
+    be run again after an interruption.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - batch_size: The number of keys to scan per SCAN call.
+
+    Returns:
+    - The number of keys migrated.
+    """
+    migrated = 0
+
+    for key in r.scan_iter(match="IndexSorted:*", count=batch_size):
+        migrated += migrate_sorted_set_to_doc_ids(r, key)
+
+    if r.exists(PAGE_RANK_KEY):
+        migrated += migrate_sorted_set_to_doc_ids(r, PAGE_RANK_KEY)
+
+    # The new Links:{id} keys match the same pattern, so collect the old keys
+    # before writing any.
+    link_keys = [
+        key
+        for key in r.scan_iter(match="Links:*", count=batch_size)
+        if not key[len(b"Links:") :].isdigit()
+    ]
+    for key in link_keys:
+        p = r.pipeline(transaction=False)
+        p.smembers(key)
+        p.pttl(key)
+        links, ttl = p.execute()
+
+        url = key[len(b"Links:") :]
+        doc_id, *link_ids = get_doc_ids(r, [url, *links])
+
+        p = r.pipeline(transaction=True)
+        new_key = f"Links:{doc_id}"
+        p.delete(new_key, key)
+        if link_ids:
+            p.sadd(new_key, *link_ids)
+            if ttl > 0:
+                p.pexpire(new_key, ttl)
+        p.execute()
+        migrated += 1
+
+    return migrated
+
+
+def build_forward_index(r: Redis, batch_size=500):
+    """
+    Function that fills the PageWords:{id} hash of each indexed page with the
+    words it is indexed under and their counts, from the IndexSorted:{word}
+    sorted sets. Counts already in the hashes are overwritten with the same
+    values, so it can be run again after an interruption.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - batch_size: The number of postings to write per pipeline.
+
+    Returns:
+    - The number of words read.
+    """
+    words = 0
+
+    for key in r.scan_iter(match="IndexSorted:*", count=batch_size):
+        word = _decode(key)[len("IndexSorted:") :]
+        p = r.pipeline(transaction=False)
+        for i, (doc_id, count) in enumerate(
+            r.zscan_iter(key, count=batch_size), start=1
+        ):
+            p.hset(f"PageWords:{_decode(doc_id)}", word, int(count))
+            if i % batch_size == 0:
+                p.execute()
+        p.execute()
+        words += 1
+
+    return words
+
+
+def main():
+    """
+    Measures the index memory, migrates it and measures it again.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sample", type=int, default=1000)
+    args = parser.parse_args()
+
+    client = connect_to_redis()
+
+    words, hash_bytes, sorted_set_bytes = index_memory_usage(client, args.sample)
+    print(
+        f"Before: {words} sampled words use {hash_bytes} bytes in Index hashes "
+        f"and {sorted_set_bytes} bytes in IndexSorted sorted sets."
+    )
+    if hash_bytes + sorted_set_bytes:
+        saved = hash_bytes / (hash_bytes + sorted_set_bytes)
+        print(f"Dropping the hashes saves {saved:.0%} of the index memory.")
+
+    print(f"Migrated {migrate_index(client)} Index hashes.")
+
+    words, hash_bytes, sorted_set_bytes = index_memory_usage(client, args.sample)
+    print(
+        f"After: {words} sampled words use {hash_bytes + sorted_set_bytes} bytes."
+    )
+
+    before = {
+        pattern: key_memory_usage(client, pattern, args.sample)
+        for pattern in ("IndexSorted:*", "Links:*")
+    }
+    print(f"Migrated {migrate_doc_ids(client)} keys to doc ids.")
+    for pattern, (keys, size) in before.items():
+        new_keys, new_size = key_memory_usage(client, pattern, args.sample)
+        if keys and new_keys:
+            print(
+                f"{pattern} keys use {new_size / new_keys:.0f} bytes on average, "
+                f"down from {size / keys:.0f}."
+            )
+
+    print(f"Built the forward index from {build_forward_index(client)} words.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Module name: pagecache
+
+A content-addressed on-disk cache of fetched pages.
+
+Page bodies are compressed and stored under the SHA-256 of their content, so
+pages with identical HTML are only stored once. A small JSON record per URL
+points at the body and keeps the ETag and Last-Modified headers, so a stale
+page can be revalidated with a conditional GET instead of downloaded again.
+
+Bodies are compressed with zstd when the zstandard package is installed, and
+with gzip otherwise.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from time import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CachedPage:
+    """
+    The cache record for one URL.
+
+    Attributes
+    ----------
+    url : str
+        The URL the page was fetched from.
+    body_hash : str
+        The SHA-256 of the page body.
+    etag : str or None
+        The ETag header of the response.
+    last_modified : str or None
+        The Last-Modified header of the response.
+    fetched_at : float
+        When the page was last fetched or revalidated, in seconds since the epoch.
+    """
+
+    def __init__(self, url, body_hash, etag=None, last_modified=None, fetched_at=0.0):
+        self.url = url
+        self.body_hash = body_hash
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def conditional_headers(self):
+        """
+        Returns the request headers to revalidate this page.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """
+    A cache of page bodies on disk.
+
+    Attributes
+    ----------
+    directory : str
+        The directory the cache is stored in.
+    ttl : float
+        Seconds a page is used without revalidating it.
+
+    Methods
+    -------
+    lookup(url)
+        Returns the cache record for the URL, or None.
+    get(url)
+        Returns the cache record and body for the URL.
+    is_fresh(page)
+        Returns True if the page can be used without revalidating it.
+    load(page)
+        Returns the body of a cached page.
+    store(url, body, etag, last_modified)
+        Adds or replaces the page for the URL.
+    touch(page)
+        Marks a page as revalidated.
+    iter_pages()
+        Yields the URL and body of every cached page.
+    """
+
+    def __init__(self, directory="cache", ttl=7 * 24 * 60 * 60):
+        self.directory = directory
+        self.ttl = ttl
+        self.extension = ".zst" if zstandard else ".gz"
+
+    def _record_path(self, url):
+        url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "urls", url_hash[:2], url_hash + ".json")
+
+    def _body_path(self, body_hash, extension):
+        return os.path.join(
+            self.directory, "bodies", body_hash[:2], body_hash + extension
+        )
+
+    def lookup(self, url):
+        """
+        Returns the cache record for the given URL, or None if it is not cached.
+        """
+        try:
+            with open(self._record_path(url), encoding="utf-8") as fp:
+                return CachedPage(**json.load(fp))
+        except FileNotFoundError:
+            return None
+
+    def get(self, url):
+        """
+        Returns the cache record and body for the given URL, or (None, None)
+        if the page is not cached or its body has gone missing.
+        """
+        page = self.lookup(url)
+        body = self.load(page) if page else None
+        if body is None:
+            return None, None
+        return page, body
+
+    def is_fresh(self, page):
+        """
+        Returns True if the page was fetched or revalidated within the TTL.
+        """
+        return time() - page.fetched_at < self.ttl
+
+    def load(self, page):
+        """
+        Returns the body of a cached page, or None if it has gone missing.
+        """
+        for extension in (".zst", ".gz"):
+            path = self._body_path(page.body_hash, extension)
+            if not os.path.exists(path):
+                continue
+
+            with open(path, "rb") as fp:
+                data = fp.read()
+            if extension == ".gz":
+                return gzip.decompress(data)
+            if zstandard:
+                return zstandard.ZstdDecompressor().decompress(data)
+
+        return None
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """
+        Adds or replaces the cached page for the given URL.
+
+        Parameters:
+        - url: The URL the page was fetched from.
+        - body: The body of the response, as bytes.
+        - etag: The ETag header of the response.
+        - last_modified: The Last-Modified header of the response.
+
+        Returns:
+        - The new CachedPage.
+        """
+        body_hash = hashlib.sha256(body).hexdigest()
+        body_path = self._body_path(body_hash, self.extension)
+        if not os.path.exists(body_path):
+            if zstandard:
+                data = zstandard.ZstdCompressor().compress(body)
+            else:
+                data = gzip.compress(body)
+            self._write_atomic(body_path, data)
+
+        page = CachedPage(url, body_hash, etag, last_modified, time())
+        self._write_record(page)
+        return page
+
+    def touch(self, page):
+        """
+        Marks the page as revalidated, restarting its TTL.
+        """
+        page.fetched_at = time()
+        self._write_record(page)
+
+    def iter_pages(self):
+        """
+        Yields the URL and body of every cached page, e.g. to re-index
+        without crawling.
+        """
+        records = os.path.join(self.directory, "urls")
+        for root, _, files in os.walk(records):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                with open(os.path.join(root, name), encoding="utf-8") as fp:
+                    page = CachedPage(**json.load(fp))
+                body = self.load(page)
+                if body is not None:
+                    yield page.url, body
+
+    def _write_record(self, page):
+        data = json.dumps(vars(page)).encode("utf-8")
+        self._write_atomic(self._record_path(page.url), data)
+
+    @staticmethod
+    def _write_atomic(path, data):
+        """
+        Writes to a temporary file and renames it into place, so readers
+        never see a partly written file.
+        """
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
@@ -4,11 +4,12 @@ Module name: pagerank
 
 import numpy as np
 import networkx as nx
+import scipy.sparse as sp
 
 # copied nearly verbatim from https://allendowney.github.io/DSIRP/pagerank.html
 
 
-def google_matrix(graph_to_convert, alpha=0.85):
+def google_matrix(graph_to_convert, alpha=0.85, personalization=None, dangling=None):
     """Returns the Google matrix of the graph.
 
     Parameters
@@ -20,6 +21,14 @@ def google_matrix(graph_to_convert, alpha=0.85):
     alpha : float
       The damping factor.
 
+    personalization : dict, optional
+      Teleport weight of each node, e.g. high for the pages matching a search
+      term. Nodes that are left out get 0. Uniform if not given.
+
+    dangling : dict, optional
+      Where the rank of nodes without out links is sent, in the same form.
+      Defaults to the personalization vector.
+
     Notes
     -----
     The matrix returned represents the transition matrix that describes the
@@ -35,10 +44,19 @@ def google_matrix(graph_to_convert, alpha=0.85):
         return graph_as_matrix
 
     # Personalization vector
-    personalization_vector = np.repeat(1.0 / matrix_length, matrix_length)
+    personalization_vector = _normalized_vector(
+        _node_weights(graph_to_convert, personalization),
+        matrix_length,
+        "personalization",
+    )
 
     # Dangling nodes
-    dangling_weights = personalization_vector
+    if dangling is None:
+        dangling_weights = personalization_vector
+    else:
+        dangling_weights = _normalized_vector(
+            _node_weights(graph_to_convert, dangling), matrix_length, "dangling"
+        )
     dangling_nodes = np.where(graph_as_matrix.sum(axis=1) == 0)[0]
 
     # Assign dangling_weights to any dangling nodes
@@ -51,7 +69,9 @@ def google_matrix(graph_to_convert, alpha=0.85):
     return alpha * graph_as_matrix + (1 - alpha) * personalization_vector
 
 
-def pagerank_numpy(graph_to_calculate, alpha=0.85):
+def pagerank_numpy(
+    graph_to_calculate, alpha=0.85, personalization=None, dangling=None
+):
     """Returns the PageRank of the nodes in the graph.
 
     PageRank computes a ranking of the nodes in the graph G based on
@@ -67,6 +87,9 @@ def pagerank_numpy(graph_to_calculate, alpha=0.85):
     alpha : float, optional
       Damping parameter for PageRank, default=0.85.
 
+    personalization, dangling : dict, optional
+      Teleport and dangling weights of the nodes, as in `google_matrix`.
+
     Returns
     -------
     pagerank : dictionary
@@ -94,7 +117,9 @@ def pagerank_numpy(graph_to_calculate, alpha=0.85):
     """
     if len(graph_to_calculate) == 0:
         return {}
-    google_matrix_from_graph = google_matrix(graph_to_calculate, alpha)
+    google_matrix_from_graph = google_matrix(
+        graph_to_calculate, alpha, personalization, dangling
+    )
 
     # use numpy LAPACK solver
     eigenvalues, eigenvectors = np.linalg.eig(google_matrix_from_graph.T)
@@ -104,3 +129,388 @@ def pagerank_numpy(graph_to_calculate, alpha=0.85):
     largest = np.array(eigenvectors[:, indices]).flatten().real
     norm = float(largest.sum())
     return dict(zip(graph_to_calculate, map(float, largest / norm)))
+
+
+def edge_matrix(sources, targets, num_nodes):
+    """Returns the sparse adjacency matrix for a list of directed edges.
+
+    Parameters
+    ----------
+    sources : array_like of int
+      Node id of the start of each edge.
+
+    targets : array_like of int
+      Node id of the end of each edge.
+
+    num_nodes : int
+      Number of nodes in the graph. Node ids must be below this value.
+
+    Returns
+    -------
+    adjacency : scipy.sparse.csr_array
+      A num_nodes x num_nodes matrix where entry (i, j) counts the edges
+      from i to j.
+    """
+    sources = np.asarray(sources, dtype=np.int32)
+    targets = np.asarray(targets, dtype=np.int32)
+    weights = np.ones(len(sources), dtype=np.float64)
+    return sp.csr_array(
+        (weights, (sources, targets)), shape=(num_nodes, num_nodes)
+    )
+
+
+def transition_matrix(adjacency):
+    """Returns the transposed transition matrix and the dangling node mask.
+
+    This is the sparse counterpart of `google_matrix`. Rather than folding
+    the damping factor, dangling weights and personalization into a dense
+    matrix, only the link structure is kept; the rest is applied as vector
+    operations during the iteration.
+
+    Parameters
+    ----------
+    adjacency : scipy sparse matrix
+      A square matrix where entry (i, j) is the weight of the link from
+      i to j.
+
+    Returns
+    -------
+    transition_t : scipy.sparse.csr_array
+      The transpose of the row-normalized adjacency matrix, so that
+      ``transition_t @ x`` moves rank along the links.
+
+    dangling : numpy.ndarray of bool
+      True for the nodes with no out links.
+    """
+    adjacency = sp.csr_array(adjacency, dtype=np.float64)
+    out_weight = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+
+    inverse_weight = np.zeros_like(out_weight)
+    inverse_weight[~dangling] = 1.0 / out_weight[~dangling]
+
+    transition = sp.diags_array(inverse_weight, format="csr") @ adjacency
+    return sp.csr_array(transition.T), dangling
+
+
+def _node_weights(graph, weights):
+    """Returns a dict of node weights as a vector in graph order, or None."""
+    if weights is None:
+        return None
+    return [weights.get(node, 0.0) for node in graph]
+
+
+def _normalized_vector(values, num_nodes, name):
+    """Returns the given weights scaled to sum to 1, or uniform weights."""
+    if values is None:
+        return np.repeat(1.0 / num_nodes, num_nodes)
+
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape != (num_nodes,):
+        raise ValueError(f"{name} must have one entry per node.")
+
+    total = values.sum()
+    if total <= 0:
+        raise ValueError(f"{name} must have a positive sum.")
+
+    return values / total
+
+
+def pagerank_power(
+    transition_t,
+    dangling,
+    alpha=0.85,
+    personalization=None,
+    dangling_weights=None,
+    start=None,
+    tol=1.0e-6,
+    max_iter=100,
+):
+    """Returns the PageRank vector computed by sparse power iteration.
+
+    Parameters
+    ----------
+    transition_t, dangling :
+      The transposed transition matrix and dangling mask, as returned by
+      `transition_matrix`.
+
+    alpha : float, optional
+      Damping parameter for PageRank, default=0.85.
+
+    personalization : array_like, optional
+      Teleport weight of each node. Uniform if not given.
+
+    dangling_weights : array_like, optional
+      Where the rank of dangling nodes is sent. Defaults to the
+      personalization vector, as in `google_matrix`.
+
+    start : array_like, optional
+      Initial rank vector, e.g. the result of a previous run. Defaults to
+      the personalization vector.
+
+    tol : float, optional
+      The iteration stops once the L1 change is below ``num_nodes * tol``.
+
+    max_iter : int, optional
+      Maximum number of iterations.
+
+    Returns
+    -------
+    pagerank : numpy.ndarray
+      The rank of each node, summing to 1.
+
+    Raises
+    ------
+    RuntimeError
+      If the iteration does not converge within max_iter iterations.
+    """
+    num_nodes = transition_t.shape[0]
+    if num_nodes == 0:
+        return np.zeros(0)
+
+    personalization = _normalized_vector(
+        personalization, num_nodes, "personalization"
+    )
+    if dangling_weights is None:
+        dangling_weights = personalization
+    else:
+        dangling_weights = _normalized_vector(
+            dangling_weights, num_nodes, "dangling_weights"
+        )
+
+    if start is None:
+        rank = personalization.copy()
+    else:
+        rank = _normalized_vector(start, num_nodes, "start")
+
+    teleport = (1 - alpha) * personalization
+    for _ in range(max_iter):
+        last_rank = rank
+        dangling_mass = last_rank[dangling].sum()
+        rank = alpha * (transition_t @ last_rank + dangling_mass * dangling_weights)
+        rank += teleport
+
+        if np.abs(rank - last_rank).sum() < num_nodes * tol:
+            return rank
+
+    raise RuntimeError(f"PageRank did not converge in {max_iter} iterations.")
+
+
+def _normalized_columns(values, num_nodes, name):
+    """Returns a matrix of weights with each column scaled to sum to 1."""
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim != 2 or values.shape[0] != num_nodes:
+        raise ValueError(f"{name} must have one row per node.")
+
+    totals = values.sum(axis=0)
+    if (totals <= 0).any():
+        raise ValueError(f"Every column of {name} must have a positive sum.")
+
+    return values / totals
+
+
+def pagerank_power_block(
+    transition_t,
+    dangling,
+    personalization,
+    alpha=0.85,
+    dangling_weights=None,
+    tol=1.0e-6,
+    max_iter=100,
+    block_size=16,
+):
+    """Returns one PageRank vector per personalization vector, computed
+    together by sparse power iteration.
+
+    Each iteration multiplies the transition matrix by a dense block of rank
+    vectors, so the links are read once per iteration for the whole block
+    instead of once per vector. Every column is checked for convergence on
+    its own and dropped from the block once it has converged. Each column is
+    the same as the result of `pagerank_power` with that personalization.
+
+    Parameters
+    ----------
+    transition_t, dangling :
+      The transposed transition matrix and dangling mask, as returned by
+      `transition_matrix`.
+
+    personalization : array_like, shape (num_nodes, K)
+      Teleport weight of each node, one column per rank vector.
+
+    alpha : float, optional
+      Damping parameter for PageRank, default=0.85.
+
+    dangling_weights : array_like, shape (num_nodes, K), optional
+      Where the rank of dangling nodes is sent, per column. Defaults to the
+      personalization vectors.
+
+    tol : float, optional
+      A column stops once its L1 change is below ``num_nodes * tol``.
+
+    max_iter : int, optional
+      Maximum number of iterations.
+
+    block_size : int, optional
+      The most columns iterated together. Wider blocks read the links fewer
+      times, but once a block no longer fits in the CPU cache each product
+      gets slower per column; about 16 is fastest on large graphs.
+
+    Returns
+    -------
+    pagerank : numpy.ndarray, shape (num_nodes, K)
+      The rank of each node in each column, every column summing to 1.
+
+    Raises
+    ------
+    RuntimeError
+      If any column does not converge within max_iter iterations.
+    """
+    num_nodes = transition_t.shape[0]
+    if num_nodes == 0:
+        return np.zeros((0, np.shape(personalization)[1]))
+
+    personalization = _normalized_columns(
+        personalization, num_nodes, "personalization"
+    )
+    if dangling_weights is not None:
+        dangling_weights = _normalized_columns(
+            dangling_weights, num_nodes, "dangling_weights"
+        )
+
+    ranks = np.empty_like(personalization)
+
+    # The damping factor is folded into the matrix once, and the dangling
+    # nodes are gathered by index, which is much faster than a boolean mask
+    # over a block.
+    damped_t = alpha * transition_t
+    dangling_ids = np.flatnonzero(dangling)
+
+    for start in range(0, ranks.shape[1], block_size):
+        columns = slice(start, start + block_size)
+        ranks[:, columns] = _power_block(
+            damped_t,
+            dangling_ids,
+            alpha,
+            personalization[:, columns],
+            None if dangling_weights is None else dangling_weights[:, columns],
+            num_nodes * tol,
+            max_iter,
+        )
+    return ranks
+
+
+def _weight_rows(weights):
+    """Returns the rows of a weight block with a nonzero entry, as an index
+    and the weights of those rows. Personalization vectors usually weight a
+    few pages, so only those rows need updating in every iteration."""
+    rows = np.flatnonzero(weights.any(axis=1))
+    if 2 * len(rows) > len(weights):
+        return slice(None), weights
+    return rows, weights[rows]
+
+
+def _power_block(
+    damped_t, dangling_ids, alpha, personalization, dangling_weights, tol, max_iter
+):
+    """Runs the iteration of `pagerank_power_block` for one block."""
+    ranks = np.empty_like(personalization)
+    # Column sums as a product with a vector of ones, which is several times
+    # faster than sum(axis=0) on a row-major block.
+    ones = np.ones(len(personalization))
+
+    # The columns that have not converged, and their rank and weights.
+    active = np.arange(ranks.shape[1])
+    rank = personalization.copy()
+    teleport_rows, teleport = _weight_rows((1 - alpha) * personalization)
+    if dangling_weights is None:
+        dangling_rows = teleport_rows
+        dangling_weights = personalization[teleport_rows]
+    else:
+        dangling_rows, dangling_weights = _weight_rows(dangling_weights)
+
+    for _ in range(max_iter):
+        last_rank = rank
+        dangling_mass = alpha * last_rank[dangling_ids].sum(axis=0)
+        rank = damped_t @ last_rank
+        rank[teleport_rows] += teleport
+        rank[dangling_rows] += dangling_weights * dangling_mass
+
+        # last_rank is not needed any more, so the change is computed in it.
+        change = np.abs(np.subtract(rank, last_rank, out=last_rank), out=last_rank)
+        converged = ones @ change < tol
+        if converged.any():
+            ranks[:, active[converged]] = rank[:, converged]
+            remaining = ~converged
+            active = active[remaining]
+            if not active.size:
+                return ranks
+
+            rank = rank[:, remaining]
+            teleport = teleport[:, remaining]
+            dangling_weights = dangling_weights[:, remaining]
+
+    raise RuntimeError(
+        f"{active.size} PageRank vectors did not converge in {max_iter} iterations."
+    )
+
+
+def pagerank_edges(sources, targets, num_nodes, alpha=0.85, **kwargs):
+    """Returns the PageRank vector of a graph given as edge arrays.
+
+    Parameters
+    ----------
+    sources, targets : array_like of int
+      The start and end node id of each edge.
+
+    num_nodes : int
+      Number of nodes in the graph.
+
+    alpha : float, optional
+      Damping parameter for PageRank, default=0.85.
+
+    **kwargs :
+      Passed on to `pagerank_power`.
+
+    Returns
+    -------
+    pagerank : numpy.ndarray
+      The rank of each node id, summing to 1.
+    """
+    transition_t, dangling = transition_matrix(
+        edge_matrix(sources, targets, num_nodes)
+    )
+    return pagerank_power(transition_t, dangling, alpha, **kwargs)
+
+
+def pagerank_sparse(graph_to_calculate, alpha=0.85, **kwargs):
+    """Returns the PageRank of the nodes in the graph.
+
+    Gives the same result as `pagerank_numpy` within the tolerance, but
+    keeps the graph as a sparse matrix and uses power iteration, so memory
+    grows with the number of edges rather than the square of the number of
+    nodes.
+
+    Parameters
+    ----------
+    graph_to_calculate : graph
+      A NetworkX graph.
+
+    alpha : float, optional
+      Damping parameter for PageRank, default=0.85.
+
+    **kwargs :
+      Passed on to `pagerank_power`.
+
+    Returns
+    -------
+    pagerank : dictionary
+       Dictionary of nodes with PageRank as value.
+    """
+    if len(graph_to_calculate) == 0:
+        return {}
+
+    nodes = list(graph_to_calculate)
+    adjacency = nx.to_scipy_sparse_array(graph_to_calculate, nodelist=nodes)
+    transition_t, dangling = transition_matrix(adjacency)
+    ranks = pagerank_power(transition_t, dangling, alpha, **kwargs)
+    return dict(zip(nodes, map(float, ranks)))
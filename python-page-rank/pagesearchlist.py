@@ -3,6 +3,7 @@ Module name: pagesearchlist
 """
 
 import heapq
+from array import array
 
 
 ## To-do: also sort by the URL if the scores are the same, based on similarity to the search term
@@ -11,42 +12,164 @@ import heapq
 # is that it may only search a single group of pages from a single source.
 # not sure how to fix that.
 
+# States of an interned page.
+UNQUEUED = 0
+QUEUED = 1
+SEARCHED = 2
+
 
 class PageSearchList:
     """
     a max heap priority queue that keeps track of the number of pages
+
+    Every URL is interned to an integer id and kept in the list at most once,
+    with the highest score it has been added with. Pages that have already
+    been searched are never added again. The heap holds (-score, id) tuples;
+    when a page's score is raised a new tuple is pushed and the old one is
+    skipped when it reaches the top. Once more than max_frontier pages are
+    waiting, the lowest scored ones are dropped, and while the list stays
+    that full, new pages scored no higher than them are not added.
     """
 
-    def __init__(self, search_term, max_pages=100):
+    def __init__(self, search_term, max_pages=100, max_frontier=10000):
         self.heap = []
         self.max_pages = max_pages
+        self.max_frontier = max_frontier
         self.current_page_searches = 0
         self.search_term = search_term
 
+        self.page_ids = {}
+        self.urls = []
+        self.scores = array("d")
+        self.states = bytearray()
+        self.frontier_size = 0
+        self.eviction_floor = float("-inf")
+
+    def __len__(self):
+        return self.frontier_size
+
     def add_page(self, page_url, parent_score):
         """
-        Adds the given page to the list in sorted order.
+        Adds the given page to the list in sorted order, or raises its score
+        if it is already in the list with a lower one.
         """
-        heapq.heappush(self.heap, PageDatum(page_url, -parent_score))
+        if not isinstance(page_url, str):
+            page_url = str(page_url, "utf-8")
+
+        page_id = self.page_ids.get(page_url)
+        if page_id is None:
+            page_id = self.page_ids[page_url] = len(self.urls)
+            self.urls.append(page_url)
+            self.scores.append(parent_score)
+            self.states.append(UNQUEUED)
+
+        state = self.states[page_id]
+        if state == SEARCHED:
+            return
+        if state == QUEUED:
+            if parent_score <= self.scores[page_id]:
+                return
+        else:
+            if (
+                parent_score <= self.eviction_floor
+                and self.frontier_size >= self.max_frontier * 9 // 10
+            ):
+                return
+            self.states[page_id] = QUEUED
+            self.frontier_size += 1
+
+        self.scores[page_id] = parent_score
+        heapq.heappush(self.heap, (-parent_score, page_id))
+
+        if self.frontier_size > self.max_frontier:
+            self.evict_lowest()
+        elif len(self.heap) > 2 * self.max_frontier:
+            self.compact(self.frontier_size)
 
     def get_page_with_highest_score(self):
         """
         Removes and returns the page with the highest score from the list.
+        Returns None once max_pages have been returned or the list is empty.
         """
         if self.current_page_searches >= self.max_pages:
             return None
 
+        page_id = self.pop_stale_entries()
+        if page_id is None:
+            return None
+
+        heapq.heappop(self.heap)
+        self.states[page_id] = SEARCHED
+        self.frontier_size -= 1
         self.current_page_searches += 1
-        return heapq.heappop(self.heap)
+        return PageDatum(self.urls[page_id], self.scores[page_id])
+
+    def pop_batch(self, count):
+        """
+        Removes and returns up to count pages with the highest scores, so
+        they can be looked up together. Returns fewer once max_pages have
+        been returned or the list runs out.
+        """
+        batch = []
+        while len(batch) < count and (page := self.get_page_with_highest_score()):
+            batch.append(page)
+        return batch
+
+    def pop_stale_entries(self):
+        """
+        Drops heap entries for pages that were searched, evicted or re-added
+        with a higher score, and returns the id of the page on top, if any.
+        """
+        heap = self.heap
+        while heap:
+            negative_score, page_id = heap[0]
+            if (
+                self.states[page_id] == QUEUED
+                and -negative_score == self.scores[page_id]
+            ):
+                return page_id
+            heapq.heappop(heap)
+        return None
+
+    def evict_lowest(self):
+        """
+        Drops the lowest scored pages, keeping 90% of max_frontier so that
+        eviction does not run on every add.
+        """
+        self.compact(max(1, self.max_frontier * 9 // 10))
+        self.eviction_floor = min(-negative_score for negative_score, _ in self.heap)
+
+    def compact(self, keep):
+        """
+        Rebuilds the heap from its live entries, keeping the highest scored
+        keep pages and marking the rest as no longer queued.
+        """
+        live = [
+            (negative_score, page_id)
+            for negative_score, page_id in self.heap
+            if self.states[page_id] == QUEUED
+            and -negative_score == self.scores[page_id]
+        ]
+        if len(live) > keep:
+            live.sort()
+            for _, page_id in live[keep:]:
+                self.states[page_id] = UNQUEUED
+            del live[keep:]
+
+        heapq.heapify(live)
+        self.heap = live
+        self.frontier_size = len(live)
 
     def __str__(self):
-        if not self.heap:
+        page_id = self.pop_stale_entries()
+        if page_id is None:
             return f"No pages to search for {self.search_term}."
 
         return (
             f"Page search list for {self.search_term} "
             f"with {self.current_page_searches} of {self.max_pages} pages searched. "
-            f"Next page to search: {self.heap[0]}"
+            f"{self.frontier_size} pages waiting. "
+            f"Next page to search: {PageDatum(self.urls[page_id], self.scores[page_id])}"
         )
 
 
@@ -55,6 +178,8 @@ class PageDatum:
     A class to hold the URL and score of a page.
     """
 
+    __slots__ = ("page_url", "score")
+
     def __init__(self, page_url, score):
         if not isinstance(page_url, str):
             page_url = str(page_url, "utf-8")
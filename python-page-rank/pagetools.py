@@ -2,10 +2,23 @@
 Module Name: pagetools
 """
 
+from collections import Counter
+from html.parser import HTMLParser
 from string import punctuation, whitespace
 
 from bs4 import NavigableString, Tag
 
+STRIP_CHARACTERS = whitespace + punctuation
+
+EXCLUDED_LINK_PREFIXES = (
+    "/wiki/Wikipedia",
+    "/wiki/Help",
+    "/wiki/File",
+    "/wiki/Special",
+    "/wiki/Template",
+    "/wiki/Talk",
+)
+
 
 def link_generator(root):
     """
@@ -25,16 +38,7 @@ def link_generator(root):
             if (
                 title
                 and href.startswith("/wiki")
-                and not href.startswith(
-                    (
-                        "/wiki/Wikipedia",
-                        "/wiki/Help",
-                        "/wiki/File",
-                        "/wiki/Special",
-                        "/wiki/Template",
-                        "/wiki/Talk",
-                    )
-                )
+                and not href.startswith(EXCLUDED_LINK_PREFIXES)
             ):
                 yield element
 
@@ -52,7 +56,112 @@ def iterate_words(root):
 
     for element in root.descendants:
         if isinstance(element, NavigableString):
-            for word in element.string.split():
-                word = word.strip(whitespace + punctuation)
-                if word:
-                    yield word.lower()
+            yield from split_words(element.string)
+
+
+def split_words(text):
+    """
+    Function that splits text into lowercase words with the surrounding
+    whitespace and punctuation removed.
+
+    Parameters:
+    - text: The text to split.
+
+    Yields:
+    - The next word in the text.
+    """
+    for word in text.split():
+        word = word.strip(STRIP_CHARACTERS)
+        if word:
+            yield word.lower()
+
+
+def extract_page(html, content_id="mw-content-text"):
+    """
+    Function that counts the words and collects the /wiki links of a page in
+    a single streaming pass over its HTML, without building a tree.
+
+    Words and links follow the same rules as iterate_words and link_generator,
+    except that the text of script and style elements is skipped. Only the
+    element with the given id is used, so navigation and other page chrome is
+    not indexed; if the page has no such element, the whole page is used.
+
+    Parameters:
+    - html: The HTML of the page.
+    - content_id: The id of the element holding the article content.
+
+    Returns:
+    - A tuple of a Counter of the words and a list of the link hrefs.
+    """
+    parser = PageExtractor(content_id)
+    parser.feed(html)
+    parser.close()
+
+    if parser.found_content:
+        return parser.content_words, parser.content_links
+
+    parser.content_words.update(parser.other_words)
+    return parser.content_words, parser.other_links + parser.content_links
+
+
+class PageExtractor(HTMLParser):
+    """
+    An HTMLParser that counts words and collects links as it reads, keeping
+    those inside the content element apart from the rest of the page.
+    """
+
+    def __init__(self, content_id):
+        super().__init__()
+        self.content_id = content_id
+        self.found_content = False
+        self.content_words = Counter()
+        self.content_links = []
+        self.other_words = Counter()
+        self.other_links = []
+
+        # Depth of open tags of the content element's type inside it,
+        # or 0 when outside it.
+        self.content_depth = 0
+        self.content_tag = None
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self.content_depth:
+            if tag == self.content_tag:
+                self.content_depth += 1
+        elif not self.found_content and ("id", self.content_id) in attrs:
+            self.found_content = True
+            self.content_tag = tag
+            self.content_depth = 1
+
+        if tag in ("script", "style"):
+            self.skip_depth += 1
+        elif tag == "a":
+            attributes = dict(attrs)
+            href = attributes.get("href") or ""
+            if (
+                attributes.get("title")
+                and href.startswith("/wiki")
+                and not href.startswith(EXCLUDED_LINK_PREFIXES)
+            ):
+                if self.content_depth:
+                    self.content_links.append(href)
+                else:
+                    self.other_links.append(href)
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self.skip_depth:
+            self.skip_depth -= 1
+        elif self.content_depth and tag == self.content_tag:
+            self.content_depth -= 1
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+
+        words = self.content_words if self.content_depth else self.other_words
+        words.update(
+            word
+            for word in (word.strip(STRIP_CHARACTERS) for word in data.lower().split())
+            if word
+        )
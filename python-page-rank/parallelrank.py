@@ -0,0 +1,278 @@
+"""
+Module name: parallelrank
+
+Runs the sparse pagerank power iteration of pagerank.pagerank_power on
+several cores. The transposed transition matrix is copied once into shared
+memory (multiprocessing.shared_memory) and split into row blocks with about
+the same number of links each. In every iteration each worker process
+multiplies its block of rows by the current rank vector, which is shared as
+well, and writes its part of the next one. The main process then merges the
+blocks: it adds up their rank changes to test convergence and collects the
+rank of the dangling pages that the next iteration spreads over the graph.
+
+Each node's new rank is computed with exactly the same operations as in
+pagerank_power, so the results are the same as the single-process path, up
+to the rounding of the summed changes in the convergence test.
+
+Example usage:
+
+    with ParallelPageRank(transition_t, dangling, processes=8) as engine:
+        ranks = engine.solve(alpha=0.85)
+
+    python parallelrank.py graph.snapshot --processes 8 --store
+
+"""
+
+import argparse
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+from time import perf_counter
+
+import numpy as np
+import scipy.sparse as sp
+
+from graphsnapshot import GraphSnapshot
+from pagerank import _normalized_vector, transition_matrix
+from redistools import connect_to_redis, store_page_ranks
+
+# Rows of the shared vectors array: the two rank vectors the iterations
+# alternate between, the personalization and the dangling weights.
+PERSONALIZATION_ROW = 2
+DANGLING_ROW = 3
+
+# The arrays and matrix blocks of the current worker process.
+_worker = {}
+
+
+def _attach(specs):
+    """
+    Worker initializer: maps the shared arrays described by specs, a dict of
+    name to (shared memory name, dtype, shape).
+    """
+    for name, (memory_name, dtype, shape) in specs.items():
+        # Pool workers use the resource tracker of the main process, so the
+        # memory stays registered once and is unlinked by close().
+        memory = shared_memory.SharedMemory(name=memory_name)
+        _worker[name] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        _worker[f"{name}_memory"] = memory
+    _worker["blocks"] = {}
+
+
+def _block(start, end):
+    """
+    Returns the rows start to end of the shared matrix as a CSR matrix on
+    the shared arrays, made once per worker.
+    """
+    block = _worker["blocks"].get((start, end))
+    if block is None:
+        indptr = _worker["indptr"]
+        first, last = indptr[start], indptr[end]
+        block = sp.csr_array(
+            (
+                _worker["data"][first:last],
+                _worker["indices"][first:last],
+                indptr[start : end + 1] - first,
+            ),
+            shape=(end - start, len(_worker["vectors"][0])),
+        )
+        _worker["blocks"][(start, end)] = block
+    return block
+
+
+def _step(task):
+    """
+    Computes the next rank of the rows of one block, as pagerank_power does
+    for every row, and returns the L1 change of the block.
+    """
+    start, end, source, alpha, dangling_mass = task
+    vectors = _worker["vectors"]
+    last_rank = vectors[source]
+
+    rank = alpha * (
+        _block(start, end) @ last_rank
+        + dangling_mass * vectors[DANGLING_ROW, start:end]
+    )
+    rank += (1 - alpha) * vectors[PERSONALIZATION_ROW, start:end]
+    vectors[1 - source, start:end] = rank
+    return float(np.abs(rank - last_rank[start:end]).sum())
+
+
+class ParallelPageRank:
+    """
+    A transition matrix in shared memory and a pool of worker processes to
+    run pagerank power iterations on it. Solving several times, e.g. with
+    different personalizations, reuses both.
+
+    Attributes
+    ----------
+    num_nodes : int
+        The number of nodes in the graph.
+    processes : int
+        The number of worker processes.
+    blocks : list of tuple
+        The first and last row of each block, one task per worker.
+
+    Methods
+    -------
+    solve(alpha, personalization, dangling_weights, start, tol, max_iter)
+        Returns the PageRank vector, as pagerank.pagerank_power does.
+    close()
+        Stops the workers and frees the shared memory.
+    """
+
+    def __init__(self, transition_t, dangling, processes=None):
+        transition_t = sp.csr_array(transition_t)
+        self.num_nodes = transition_t.shape[0]
+        self.dangling_ids = np.flatnonzero(dangling)
+        self.processes = processes or os.cpu_count() or 1
+
+        self.memory = []
+        specs = {}
+        arrays = {
+            "indptr": transition_t.indptr,
+            "indices": transition_t.indices,
+            "data": transition_t.data,
+            "vectors": np.zeros((4, self.num_nodes)),
+        }
+        for name, array in arrays.items():
+            size = max(array.nbytes, 1)
+            memory = shared_memory.SharedMemory(create=True, size=size)
+            self.memory.append(memory)
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+            shared[...] = array
+            specs[name] = (memory.name, array.dtype.str, array.shape)
+            if name == "vectors":
+                self.vectors = shared
+
+        # Row blocks with about the same number of links, so the workers
+        # finish each iteration at about the same time.
+        indptr = transition_t.indptr
+        bounds = np.searchsorted(
+            indptr, np.linspace(0, indptr[-1], self.processes + 1), side="left"
+        )
+        bounds[0], bounds[-1] = 0, self.num_nodes
+        bounds = np.unique(np.minimum(bounds, self.num_nodes))
+        self.blocks = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        self.pool = multiprocessing.Pool(
+            self.processes, initializer=_attach, initargs=(specs,)
+        )
+
+    def solve(
+        self,
+        alpha=0.85,
+        personalization=None,
+        dangling_weights=None,
+        start=None,
+        tol=1.0e-6,
+        max_iter=100,
+    ):
+        """Returns the PageRank vector computed by parallel power iteration.
+
+        The parameters, result and errors are those of
+        pagerank.pagerank_power.
+        """
+        num_nodes = self.num_nodes
+        if num_nodes == 0:
+            return np.zeros(0)
+
+        vectors = self.vectors
+        vectors[PERSONALIZATION_ROW] = _normalized_vector(
+            personalization, num_nodes, "personalization"
+        )
+        if dangling_weights is None:
+            vectors[DANGLING_ROW] = vectors[PERSONALIZATION_ROW]
+        else:
+            vectors[DANGLING_ROW] = _normalized_vector(
+                dangling_weights, num_nodes, "dangling_weights"
+            )
+
+        if start is None:
+            vectors[0] = vectors[PERSONALIZATION_ROW]
+        else:
+            vectors[0] = _normalized_vector(start, num_nodes, "start")
+
+        source = 0
+        for _ in range(max_iter):
+            dangling_mass = vectors[source][self.dangling_ids].sum()
+            changes = self.pool.map(
+                _step,
+                [
+                    (first, last, source, alpha, dangling_mass)
+                    for first, last in self.blocks
+                ],
+            )
+            source = 1 - source
+
+            if sum(changes) < num_nodes * tol:
+                return vectors[source].copy()
+
+        raise RuntimeError(f"PageRank did not converge in {max_iter} iterations.")
+
+    def close(self):
+        """
+        Stops the worker processes and frees the shared memory.
+        """
+        self.pool.terminate()
+        self.pool.join()
+        self.vectors = None
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
+        self.memory = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def pagerank_parallel(transition_t, dangling, alpha=0.85, processes=None, **kwargs):
+    """
+    Function that computes the PageRank vector like pagerank.pagerank_power,
+    with the iteration split over a pool of worker processes.
+
+    Parameters:
+    - transition_t, dangling: As returned by pagerank.transition_matrix.
+    - alpha: Damping parameter for PageRank.
+    - processes: The number of worker processes, by default one per core.
+    - kwargs: Passed on to ParallelPageRank.solve.
+
+    Returns:
+    - The rank of each node, summing to 1.
+    """
+    with ParallelPageRank(transition_t, dangling, processes) as engine:
+        return engine.solve(alpha, **kwargs)
+
+
+def main():
+    """
+    Ranks the pages of a link graph snapshot on several cores.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("snapshot")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--alpha", type=float, default=0.85)
+    parser.add_argument(
+        "--store", action="store_true", help="store the scores in Redis"
+    )
+    args = parser.parse_args()
+
+    snapshot = GraphSnapshot(args.snapshot)
+    print(snapshot)
+
+    start = perf_counter()
+    transition_t, dangling = transition_matrix(snapshot.adjacency())
+    ranks = pagerank_parallel(transition_t, dangling, args.alpha, args.processes)
+    print(f"Ranked in {perf_counter() - start:.1f} seconds.")
+
+    if args.store:
+        store_page_ranks(
+            connect_to_redis(), dict(zip(snapshot.urls, map(float, ranks)))
+        )
+
+
+if __name__ == "__main__":
+    main()
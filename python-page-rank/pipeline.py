@@ -0,0 +1,167 @@
+"""
+Module name: pipeline
+
+A staged crawl pipeline. Pages are fetched concurrently on the event loop,
+parsed and tokenized on a pool of worker processes, and written to Redis in
+batches. The stages are connected by bounded queues, so a slow stage makes the
+ones before it wait instead of buffering pages without limit. Writing batches
+and choosing the next pages run blocking Redis calls and pagerank updates, so
+they run on a worker thread, one call at a time, while the event loop keeps
+handling fetches.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from asyncfetcher import AsyncWikiFetcher
+from metrics import metrics
+from pagetools import extract_page
+
+
+def parse_page(html):
+    """
+    Function that parses a page and counts its words. Runs in a worker process.
+
+    Parameters:
+    - html: The HTML of the page.
+
+    Returns:
+    - A tuple of a dictionary of word counts and a list of the hrefs of the
+      page's links.
+    """
+    word_counts, hrefs = extract_page(html)
+    return dict(word_counts), hrefs
+
+
+class CrawlPipeline:
+    """
+    Runs pages through the fetch, parse and write stages.
+
+    Attributes
+    ----------
+    processes : int
+        Number of parse worker processes, or None for one per core.
+    queue_size : int
+        The most pages that can wait between two stages.
+    batch_size : int
+        The most parsed pages handed to write_batch at once.
+    fetcher_options : dict
+        Passed on to AsyncWikiFetcher.
+
+    Methods
+    -------
+    run(next_url, write_batch)
+        Crawls until next_url runs out of pages and every page is written.
+    """
+
+    def __init__(self, processes=None, queue_size=16, batch_size=8, **fetcher_options):
+        self.processes = processes
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.fetcher_options = fetcher_options
+
+    async def run(self, next_url, write_batch):
+        """
+        Crawls pages until there are none left.
+
+        Parameters:
+        - next_url: Function that returns the next URL to fetch, or None if
+          there is nothing to fetch right now. It is called again whenever a
+          batch has been written, since that may add pages to fetch.
+        - write_batch: Function that is called with a list of
+          (url, word_counts, hrefs) tuples, one per parsed page.
+
+        Both functions are called on a worker thread, never at the same time.
+        """
+        loop = asyncio.get_running_loop()
+        html_queue = asyncio.Queue(self.queue_size)
+        parsed_queue = asyncio.Queue(self.queue_size)
+        progress = asyncio.Event()
+        fetching = 0
+        in_progress = 0
+
+        # next_url and write_batch usually share a search list, so they are
+        # run one at a time.
+        frontier_lock = asyncio.Lock()
+
+        async def call_frontier(function, *args):
+            async with frontier_lock:
+                return await asyncio.to_thread(function, *args)
+
+        def finish_pages(count):
+            nonlocal in_progress
+            in_progress -= count
+            progress.set()
+
+        async def fetch(url):
+            nonlocal fetching
+            try:
+                html = await fetcher.fetch_html(url)
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"Failed to fetch {url}: {e}")
+                finish_pages(1)
+            else:
+                await html_queue.put((url, html))
+            finally:
+                fetching -= 1
+                progress.set()
+
+        async def parse():
+            while True:
+                url, html = await html_queue.get()
+                try:
+                    async with metrics.timer("parse_seconds"):
+                        word_counts, hrefs = await loop.run_in_executor(
+                            pool, parse_page, html
+                        )
+                except Exception as e:  # pylint: disable=broad-except
+                    print(f"Failed to parse {url}: {e}")
+                    finish_pages(1)
+                    continue
+                await parsed_queue.put((url, word_counts, hrefs))
+
+        async def write():
+            while True:
+                batch = [await parsed_queue.get()]
+                while len(batch) < self.batch_size and not parsed_queue.empty():
+                    batch.append(parsed_queue.get_nowait())
+                await call_frontier(write_batch, batch)
+                finish_pages(len(batch))
+
+        workers = self.processes or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers) as pool:
+            async with AsyncWikiFetcher(**self.fetcher_options) as fetcher:
+                stages = [asyncio.create_task(parse()) for _ in range(workers)]
+                stages.append(asyncio.create_task(write()))
+                fetches = set()
+
+                try:
+                    while True:
+                        while fetching < fetcher.max_in_flight and (
+                            url := await call_frontier(next_url)
+                        ):
+                            fetching += 1
+                            in_progress += 1
+                            task = asyncio.create_task(fetch(url))
+                            fetches.add(task)
+                            task.add_done_callback(fetches.discard)
+
+                        metrics.set_gauge("fetches_in_flight", fetching)
+                        metrics.set_gauge("html_queue_size", html_queue.qsize())
+                        metrics.set_gauge("parsed_queue_size", parsed_queue.qsize())
+                        if in_progress == 0:
+                            break
+
+                        progress.clear()
+                        waiter = asyncio.create_task(progress.wait())
+                        done, _ = await asyncio.wait(
+                            [waiter, *stages], return_when=asyncio.FIRST_COMPLETED
+                        )
+                        waiter.cancel()
+                        for stage in done.intersection(stages):
+                            stage.result()
+                finally:
+                    for task in [*stages, *fetches]:
+                        task.cancel()
+                    await asyncio.gather(*stages, *fetches, return_exceptions=True)
@@ -0,0 +1,53 @@
+"""
+Module name: query
+
+Answers multi-word queries from the index. Queries are split into words the
+same way pages are when they are indexed, and the posting lists of the words
+are combined on the Redis server, so only the top results are sent back.
+"""
+
+from redis import Redis
+
+from pagetools import split_words
+from redistools import (
+    get_cached_ranked_index_list_for_words,
+    get_ranked_index_list_for_words,
+)
+
+
+def tokenize_query(query):
+    """
+    Function that splits a query into its distinct index words.
+
+    Parameters:
+    - query: The query entered by the user.
+
+    Returns:
+    - A list of the words in the query, in order of first appearance.
+    """
+    return list(dict.fromkeys(split_words(query)))
+
+
+def search_index(r: Redis, query, count=10, mode="and", cache=None, **options):
+    """
+    Function that returns the top pages for a query.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - query: The query entered by the user, e.g. "machine learning".
+    - count: The number of pages to return, or None for all of them.
+    - mode: "and" for pages containing every word, "or" for any of them.
+    - cache: Optional resultcache.ResultCache to answer repeated queries from.
+    - options: Passed on to redistools.get_ranked_index_list_for_words.
+
+    Returns:
+    - A list of tuples containing the URL and hybrid score, highest first.
+    """
+    if cache is not None:
+        return get_cached_ranked_index_list_for_words(
+            r, cache, tokenize_query(query), count, mode, **options
+        )
+
+    return get_ranked_index_list_for_words(
+        r, tokenize_query(query), count, mode, **options
+    )
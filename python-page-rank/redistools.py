@@ -1,33 +1,235 @@
 """
 Module name: redistools
+
+Every helper that runs commands takes either a redis.Redis client or a
+redis.asyncio.Redis client. With an asyncio client the helper returns a
+coroutine, so async callers write `await get_doc_urls(r, ids)` and sync
+callers use the result directly.
 """
 
+import functools
+import inspect
+import json
 import os
 import sys
 from collections import Counter
+from time import time
 
+import redis.asyncio
 from dotenv import load_dotenv
-from redis import Redis, RedisError
+from redis import ConnectionPool, Redis, RedisError
+from redis.utils import HIREDIS_AVAILABLE
+
+PAGE_RANK_KEY = "PageRank"
+
+# Every URL is stored once, in the DocId hash (URL to id) and the DocUrl hash
+# (id to URL). Index postings, link sets and pagerank scores hold the ids,
+# which Redis stores far more compactly than the URL strings.
+DOC_ID_KEY = "DocId"
+DOC_URL_KEY = "DocUrl"
+DOC_ID_COUNTER_KEY = "DocIdCounter"
+
+# The time, in seconds since the epoch, when links were last added to or
+# removed from a Links:{id} set, so a graphsnapshot can tell it is stale.
+LINKS_UPDATED_KEY = "LinksUpdated"
+
+# Returns the id of every URL in ARGV, giving the next id from the counter
+# to URLs that have none yet.
+ASSIGN_DOC_IDS_SCRIPT = """
+local ids = {}
+for i, url in ipairs(ARGV) do
+    local id = redis.call('HGET', KEYS[1], url)
+    if not id then
+        id = redis.call('INCR', KEYS[3])
+        redis.call('HSET', KEYS[1], url, id)
+        redis.call('HSET', KEYS[2], id, url)
+    end
+    ids[i] = tonumber(id)
+end
+return ids
+"""
+
+# Looks up a batch of crawl frontier pages for the search words, whose
+# indexes are KEYS[2..ARGV[1] + 1]. The remaining keys are the Links:{id} sets
+# of the pages, whose doc ids are ARGV[2..]. Returns the sum of the words'
+# highest counts, then for each page the sum of its counts for the words and
+# the URLs it links to, from KEYS[1]. The URLs are read in chunks, since Lua
+# can only unpack a few thousand values at once.
+LOOKUP_PAGES_SCRIPT = """
+local num_words = tonumber(ARGV[1])
+local highest = 0
+for w = 2, num_words + 1 do
+    local top = redis.call('ZREVRANGE', KEYS[w], 0, 0, 'WITHSCORES')[2]
+    highest = highest + (tonumber(top) or 0)
+end
+
+local result = {highest}
+for i = 2, #ARGV do
+    local count = 0
+    for w = 2, num_words + 1 do
+        count = count + (tonumber(redis.call('ZSCORE', KEYS[w], ARGV[i])) or 0)
+    end
+
+    local links = {}
+    local link_ids = redis.call('SMEMBERS', KEYS[num_words + i])
+    for first = 1, #link_ids, 1000 do
+        local last = math.min(first + 999, #link_ids)
+        local urls = redis.call('HMGET', KEYS[1], unpack(link_ids, first, last))
+        for _, url in ipairs(urls) do
+            table.insert(links, url)
+        end
+    end
+    table.insert(result, count)
+    table.insert(result, links)
+end
+return result
+"""
+
+# A hash of version counters: one per indexed word, bumped whenever a page's
+# count for it is added, changed or removed, and one per pagerank key
+# (PageRank, or a TermRank:* key of personalized scores), named after the key
+# and bumped whenever new scores are stored in it. Cached query results are
+# only used while the counters they were computed at are unchanged. Words are
+# lowercase, so the rank fields can not clash with one.
+TERM_VERSION_KEY = "TermVersion"
+
+# A sorted set of how often each query was asked, by its sorted words, used
+# to choose the queries whose personalized pagerank is precomputed.
+QUERY_COUNT_KEY = "QueryCount"
+
+COMBINE_COMMANDS = {"and": "ZINTERSTORE", "or": "ZUNIONSTORE"}
+
+# Blends a term's index scores with the stored pagerank scores, each scaled by
+# its highest value, and keeps only the pages that contain the term.
+# When more than four keys are given, KEYS[1] is first built from the index
+# keys in KEYS[5..] with ARGV[7] (ZINTERSTORE or ZUNIONSTORE). It is built
+# on every call, so it always has the current index counts. The doc ids of
+# the results are replaced with their URLs from KEYS[4].
+HYBRID_RANKING_SCRIPT = """
+if #KEYS > 4 then
+    redis.call(ARGV[7], KEYS[1], #KEYS - 4, unpack(KEYS, 5))
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+
+local top_index = redis.call('ZREVRANGE', KEYS[1], 0, 0, 'WITHSCORES')[2]
+if not top_index then
+    return {}
+end
+
+local index_weight = tonumber(ARGV[1]) / tonumber(top_index)
+local rank_weight = 0
+local top_rank = redis.call('ZREVRANGE', KEYS[2], 0, 0, 'WITHSCORES')[2]
+if top_rank and tonumber(top_rank) > 0 then
+    rank_weight = tonumber(ARGV[2]) / tonumber(top_rank)
+end
+
+-- The rank part of the pages that have a pagerank score, then the index part
+-- of every page. Both commands only walk the term's postings, however many
+-- pages have a pagerank score.
+redis.call('ZINTERSTORE', KEYS[3], 2, KEYS[1], KEYS[2], 'WEIGHTS', 0, rank_weight)
+redis.call('ZUNIONSTORE', KEYS[3], 2, KEYS[1], KEYS[3],
+    'WEIGHTS', index_weight, 1)
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+local ranked = redis.call('ZREVRANGEBYSCORE', KEYS[3], '+inf', ARGV[4],
+    'WITHSCORES', 'LIMIT', ARGV[5], ARGV[6])
+for i = 1, #ranked, 2 do
+    ranked[i] = redis.call('HGET', KEYS[4], ranked[i])
+end
+return ranked
+"""
+
 
+# Connection pools shared by the clients from create_redis_client, one per
+# distinct set of connection options.
+_connection_pools = {}
 
-def connect_to_redis():
+
+def redis_options(**overrides):
     """
-    Function that connects to Redis and returns the Redis client object.
-    performs a ping to check if the connection was successful.
+    Function that reads the Redis connection options from the environment
+    (or a .env file), with the given options taking precedence.
+
+    The environment variables are REDIS_HOST, REDIS_PORT, REDIS_DB,
+    REDIS_PASSWORD, REDIS_MAX_CONNECTIONS, REDIS_SOCKET_TIMEOUT and
+    REDIS_CONNECT_TIMEOUT. Replies are parsed by hiredis whenever the
+    hiredis package is installed.
+
+    Parameters:
+    - overrides: Options for redis.ConnectionPool, e.g. decode_responses=True.
 
     Returns:
-    - Redis client object used to interact with Redis.
+    - A dictionary of connection pool options.
     """
     load_dotenv()
 
-    redis_host = os.getenv("REDIS_HOST")
-    redis_port = os.getenv("REDIS_PORT")
+    options = {
+        "host": os.getenv("REDIS_HOST", "localhost"),
+        "port": int(os.getenv("REDIS_PORT", "6379")),
+        "db": int(os.getenv("REDIS_DB", "0")),
+        "password": os.getenv("REDIS_PASSWORD") or None,
+        "max_connections": int(os.getenv("REDIS_MAX_CONNECTIONS", "32")),
+        "socket_timeout": float(os.getenv("REDIS_SOCKET_TIMEOUT", "5")),
+        "socket_connect_timeout": float(os.getenv("REDIS_CONNECT_TIMEOUT", "5")),
+        "health_check_interval": 30,
+    }
+    options.update(overrides)
+    return options
+
+
+def create_redis_client(**overrides):
+    """
+    Function that returns a Redis client on the shared connection pool, so
+    clients created across the program reuse the same connections.
+
+    Parameters:
+    - overrides: Passed on to redis_options.
 
-    client = Redis(host=redis_host, port=redis_port)
+    Returns:
+    - Redis client object used to interact with Redis.
+    """
+    options = redis_options(**overrides)
+    pool_key = tuple(sorted(options.items()))
+
+    pool = _connection_pools.get(pool_key)
+    if pool is None:
+        pool = _connection_pools[pool_key] = ConnectionPool(**options)
+    return Redis(connection_pool=pool)
+
+
+def create_async_redis_client(**overrides):
+    """
+    Function that returns a redis.asyncio client with its own connection pool.
+    Asyncio connections belong to the event loop they were opened on, so
+    create the client inside the loop that uses it and close it with
+    `await client.aclose()`.
+
+    Parameters:
+    - overrides: Passed on to redis_options.
+
+    Returns:
+    - redis.asyncio.Redis client object used to interact with Redis.
+    """
+    pool = redis.asyncio.ConnectionPool(**redis_options(**overrides))
+    return redis.asyncio.Redis.from_pool(pool)
+
+
+def connect_to_redis(**overrides):
+    """
+    Function that connects to Redis and returns the Redis client object.
+    performs a ping to check if the connection was successful.
+
+    Parameters:
+    - overrides: Passed on to redis_options.
+
+    Returns:
+    - Redis client object used to interact with Redis.
+    """
+    client = create_redis_client(**overrides)
 
     try:
         client.ping()
-        print("Connected to Redis successfully!")
+        parser = "hiredis" if HIREDIS_AVAILABLE else "the Python parser"
+        print(f"Connected to Redis successfully, using {parser}!")
     except RedisError as e:
         print("Failed to connect to Redis." + str(e))
         sys.exit(1)
@@ -35,6 +237,49 @@ def connect_to_redis():
     return client
 
 
+def _decode(value):
+    """
+    Returns a reply as a string, whether or not the client decodes responses.
+    """
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _sync_or_async(steps):
+    """
+    Decorator for helpers that work with sync and asyncio clients.
+
+    The helper is written as a generator that yields the result of each
+    command, helper call or pipeline execute and is sent back its value. With
+    a sync client the values are sent straight back and the helper's return
+    value is returned. With an asyncio client the yielded awaitables are
+    awaited in a coroutine, which is returned instead.
+    """
+
+    @functools.wraps(steps)
+    def wrapper(r, *args, **kwargs):
+        generator = steps(r, *args, **kwargs)
+        if inspect.iscoroutinefunction(r.execute_command):
+            return _run_async(generator)
+
+        try:
+            result = next(generator)
+            while True:
+                result = generator.send(result)
+        except StopIteration as stop:
+            return stop.value
+
+    return wrapper
+
+
+async def _run_async(generator):
+    try:
+        result = next(generator)
+        while True:
+            result = generator.send(await result)
+    except StopIteration as stop:
+        return stop.value
+
+
 def redis_index_pipeline(word_iterator, url, r: Redis):
     """
     Function that creates a Redis pipeline to index the words in the given root
@@ -45,111 +290,629 @@ def redis_index_pipeline(word_iterator, url, r: Redis):
     - url: The URL of the page to index.
     - r: Redis client object used to interact with Redis.
     """
+    return _redis_index_pipeline(r, Counter(word_iterator), url)
 
-    counter = Counter(word_iterator)
+
+@_sync_or_async
+def _redis_index_pipeline(r: Redis, counter, url):
+    (doc_id,) = yield get_doc_ids(r, [url])
+    old_counts = yield r.hgetall(f"PageWords:{doc_id}")
     p = r.pipeline(transaction=False)
-    for word, count in counter.items():
-        if count >= 3:
-            hash_key = f"Index:{word}"
-            sorted_set_key = f"IndexSorted:{word}"
-            p.hset(hash_key, url, count)
-            p.zadd(sorted_set_key, {url: count})
-    p.execute()
+    queue_page_index(p, doc_id, counter, _word_counts(old_counts))
+    yield p.execute()
+
+
+def queue_page_index(p, doc_id, word_counts, old_counts=None):
+    """
+    Function that queues the index updates for one page on a pipeline, so
+    several pages can be written in a single round trip.
+    Words that appear fewer than 3 times on the page are not indexed.
+    Each count is stored in the IndexSorted:{word} sorted set and in the
+    page's PageWords:{id} hash, its forward index.
+
+    Only the difference to the page's previous index is written: the page is
+    removed from the words it no longer has, and only new or changed counts
+    are stored. The version counters of those words are bumped so cached
+    results for them are dropped.
+
+    Parameters:
+    - p: Redis pipeline to queue the commands on.
+    - doc_id: The doc id of the page to index, from get_doc_ids.
+    - word_counts: A mapping of each word on the page to its count.
+    - old_counts: The page's previous word counts, from get_forward_index.
+      None for a page that was not indexed before.
+    """
+    old_counts = old_counts or {}
+    counts = {word: count for word, count in word_counts.items() if count >= 3}
+    page_words_key = f"PageWords:{doc_id}"
+
+    removed = [word for word in old_counts if word not in counts]
+    for word in removed:
+        p.zrem(f"IndexSorted:{word}", doc_id)
+        p.hincrby(TERM_VERSION_KEY, word, 1)
+    if removed:
+        p.hdel(page_words_key, *removed)
+
+    changed = {
+        word: count for word, count in counts.items() if old_counts.get(word) != count
+    }
+    for word, count in changed.items():
+        p.zadd(f"IndexSorted:{word}", {doc_id: count})
+        p.hincrby(TERM_VERSION_KEY, word, 1)
+    if changed:
+        p.hset(page_words_key, mapping=changed)
+
+
+def _word_counts(reply):
+    """
+    Returns a PageWords:{id} hash reply as a dict of word to count.
+    """
+    return {_decode(word): int(count) for word, count in reply.items()}
 
 
-def linked_pages(r: Redis, url):
+def _link_ids(reply):
+    """
+    Returns a Links:{id} set reply as a set of doc ids.
     """
-    Function that returns the URLs of the pages that are linked to the given URL.
-    If it doesn't exist, it returns an empty list.
+    return {int(link_id) for link_id in reply}
+
+
+@_sync_or_async
+def get_forward_index(r: Redis, doc_ids):
+    """
+    Function that reads what is stored for each page, so indexing it again
+    only writes what changed: the words it is indexed under with their
+    counts, and the doc ids of the pages it links to.
 
     Parameters:
     - r: Redis client object used to interact with Redis.
-    - url: The URL of the page to get the linked pages for.
+    - doc_ids: The doc ids of the pages.
 
     Returns:
-    - A list of URLs of the pages that are linked to the given URL.
+    - A list of (word counts, link ids) tuples, one per doc id, with an
+      empty dict and set for pages that are not stored.
     """
-    key = f"Links:{url}"
-
-    if not r.exists(key):
+    if not doc_ids:
         return []
 
-    return r.smembers(key)
+    p = r.pipeline(transaction=False)
+    for doc_id in doc_ids:
+        p.hgetall(f"PageWords:{doc_id}")
+        p.smembers(f"Links:{doc_id}")
+    replies = yield p.execute()
+
+    return [
+        (_word_counts(words), _link_ids(links))
+        for words, links in zip(replies[::2], replies[1::2])
+    ]
 
 
-def store_page_links(r: Redis, url, page_links):
+@_sync_or_async
+def get_doc_ids(r: Redis, urls, batch_size=1000):
     """
-    Function that stores the URLs of the pages that are linked to the given URL.
+    Function that returns the doc id of each URL, registering the URLs that
+    do not have one yet.
 
     Parameters:
     - r: Redis client object used to interact with Redis.
-    - url: The URL of the page to store the linked pages for.
-    - linked_pages: A list of URLs of the pages that are linked to the given URL.
+    - urls: The URLs to get the doc ids for.
+    - batch_size: The number of URLs to send per script call.
+
+    Returns:
+    - A list of the doc id of each URL.
     """
-    key = f"Links:{url}"
-    r.sadd(key, *page_links)
+    script = r.register_script(ASSIGN_DOC_IDS_SCRIPT)
+    keys = [DOC_ID_KEY, DOC_URL_KEY, DOC_ID_COUNTER_KEY]
 
-    # to-do: use r.expire(key, {some_seconds}) to handle cache invalidation for page changes
+    urls = list(urls)
+    doc_ids = []
+    for start in range(0, len(urls), batch_size):
+        doc_ids += yield script(keys=keys, args=urls[start : start + batch_size])
+    return doc_ids
 
 
-def get_sorted_index_list_for_word(r: Redis, word):
+@_sync_or_async
+def get_doc_urls(r: Redis, doc_ids):
+    """
+    Function that returns the URL of each doc id.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - doc_ids: The doc ids to get the URLs for, as ints or bytes.
+
+    Returns:
+    - A list of the URL of each doc id, or None for unknown ids.
+    """
+    if not doc_ids:
+        return []
+    urls = yield r.hmget(DOC_URL_KEY, doc_ids)
+    return [None if url is None else _decode(url) for url in urls]
+
+
+@_sync_or_async
+def lookup_pages(r: Redis, urls, words):
+    """
+    Function that looks up a batch of pages: the links stored for each page,
+    each page's index count for the search words and the highest index
+    count, as in highest_index_from_scores. A page's count is the sum of its
+    counts for the words. The doc ids of the pages are read first, then the
+    rest in one script call.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - urls: The URLs of the pages to look up.
+    - words: The words of the search term, from query.tokenize_query.
+
+    Returns:
+    - A tuple of the highest index count for the words and a list of
+      (links, index count) tuples, one per URL. The links are an empty list
+      for pages whose links are not stored.
+    """
+    urls = list(urls)
+    if not urls:
+        return 0, []
+    doc_ids = yield r.hmget(DOC_ID_KEY, urls)
+    known_ids = [_decode(doc_id) for doc_id in doc_ids if doc_id is not None]
+
+    script = r.register_script(LOOKUP_PAGES_SCRIPT)
+    keys = [DOC_URL_KEY] + [f"IndexSorted:{word}" for word in words]
+    keys += [f"Links:{doc_id}" for doc_id in known_ids]
+    highest, *result = yield script(keys=keys, args=[len(words)] + known_ids)
+
+    found = iter(zip(result[::2], result[1::2]))
+    pages = []
+    for doc_id in doc_ids:
+        if doc_id is None:
+            pages.append(([], 0))
+            continue
+        count, links = next(found)
+        pages.append(([_decode(link) for link in links if link is not None], count))
+    return highest, pages
+
+
+def queue_highest_index_for_words(p, words):
+    """
+    Function that queues reading the highest index count of each search word
+    on a pipeline, so it can share a round trip with the writes before it.
+    The pipeline's results for it are read with highest_index_from_scores.
+
+    Parameters:
+    - p: Redis pipeline to queue the commands on.
+    - words: The words of the search term, from query.tokenize_query.
+    """
+    for word in words:
+        p.zrange(f"IndexSorted:{word}", -1, -1, withscores=True)
+
+
+def highest_index_from_scores(highest_scores):
+    """
+    Function that returns the highest index count for the search words from
+    the results of queue_highest_index_for_words: the sum of each word's
+    highest count, which no page's summed count can exceed.
+    """
+    # Each zrange returns a list of tuples [(doc id, score)].
+    return sum(int(scores[0][1]) for scores in highest_scores if scores)
+
+
+def queue_page_links(p, doc_id, link_ids, ttl=None, old_link_ids=None):
+    """
+    Function that queues storing the links of one page on a pipeline.
+    Only the difference to the page's stored links is written: links that
+    are gone are removed and new ones are added.
+
+    Parameters:
+    - p: Redis pipeline to queue the commands on.
+    - doc_id: The doc id of the page to store the linked pages for.
+    - link_ids: The doc ids of the pages that are linked to the page.
+    - ttl: Optional seconds after which the links expire.
+    - old_link_ids: The page's stored links, from get_forward_index. None
+      for a page whose links are not stored.
+    """
+    link_ids = set(link_ids)
+    old_link_ids = old_link_ids or set()
+    key = f"Links:{doc_id}"
+
+    removed = old_link_ids - link_ids
+    if removed:
+        p.srem(key, *removed)
+    added = link_ids - old_link_ids
+    if added:
+        p.sadd(key, *added)
+    if removed or added:
+        p.set(LINKS_UPDATED_KEY, time())
+    if link_ids and ttl:
+        p.expire(key, ttl)
+
+
+@_sync_or_async
+def get_sorted_index_list_for_word(r: Redis, word, count=None, offset=0, min_score=None):
     """
     Modified function to retrieve a sorted list of URLs and counts for the given word
     using a Sorted Set to efficiently manage sorted data.
 
     This version assumes that during indexing, scores (counts) for words are stored in a Sorted Set
-    with a key pattern like "IndexSorted:{word}", where each member of the set is a URL
+    with a key pattern like "IndexSorted:{word}", where each member of the set is a doc id
     and its score represents the count (or any other metric determining the order).
 
+    Only the requested slice is fetched from Redis, so asking for the top few
+    pages costs the same however many pages contain the word.
+
     Parameters:
     - r: Redis client object used to interact with Redis.
     - word: The word to get the index list for.
+    - count: The number of pages to return, or None for all of them.
+    - offset: The number of highest counted pages to skip.
+    - min_score: Optional lowest count to return.
 
     Returns:
     - A list of tuples containing the URL and count for the given word, sorted by count.
     """
     sorted_set_key = f"IndexSorted:{word}"
 
-    page_index_scores = r.zrevrange(sorted_set_key, 0, -1, withscores=True)
+    page_index_scores = yield r.zrevrangebyscore(
+        sorted_set_key,
+        "+inf",
+        "-inf" if min_score is None else min_score,
+        start=offset,
+        num=-1 if count is None else count,
+        withscores=True,
+    )
 
+    urls = yield get_doc_urls(r, [member for member, _ in page_index_scores])
     sorted_list = [
-        (member.decode("utf-8"), int(score)) for member, score in page_index_scores
+        (url, int(score)) for url, (_, score) in zip(urls, page_index_scores)
     ]
 
     return sorted_list
 
 
-def get_index_for_page_for_search_term(r: Redis, search_term, url):
+@_sync_or_async
+def get_sorted_index_page_for_word(r: Redis, word, count, cursor=None, min_score=None):
     """
-    Function that returns the index score for the given page and search term.
+    Function that returns one page of the sorted index list for the given word,
+    and a cursor for the next page.
+
+    The cursor is the count of the last page returned and how many pages with
+    that count have been returned, so pages further down are reached without
+    Redis having to skip over all the pages before them.
 
     Parameters:
     - r: Redis client object used to interact with Redis.
-    - search_term: The search term entered by the user.
-    - url: The URL of the page to get the index score for.
+    - word: The word to get the index list for.
+    - count: The number of pages to return.
+    - cursor: The cursor returned with the previous page, or None for the first.
+    - min_score: Optional lowest count to return.
 
     Returns:
-    - The index score for the given page and search term.
+    - A tuple of a list of (url, count) tuples and the cursor for the next
+      page, which is None when there are no more pages.
+    """
+    sorted_set_key = f"IndexSorted:{word}"
+    max_score, skip = cursor or ("+inf", 0)
+
+    page_index_scores = yield r.zrevrangebyscore(
+        sorted_set_key,
+        max_score,
+        "-inf" if min_score is None else min_score,
+        start=skip,
+        num=count,
+        withscores=True,
+    )
+
+    if len(page_index_scores) < count:
+        next_cursor = None
+    else:
+        last_score = page_index_scores[-1][1]
+        ties = sum(1 for _, score in page_index_scores if score == last_score)
+        if last_score == max_score:
+            ties += skip
+        next_cursor = (last_score, ties)
+
+    urls = yield get_doc_urls(r, [member for member, _ in page_index_scores])
+    return (
+        [(url, int(score)) for url, (_, score) in zip(urls, page_index_scores)],
+        next_cursor,
+    )
+
+
+def iter_sorted_index_for_word(r: Redis, word, batch_size=100, min_score=None):
+    """
+    Function that yields the sorted index list for the given word, fetching
+    batch_size pages at a time as the caller consumes them.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - word: The word to get the index list for.
+    - batch_size: The number of pages to fetch per round trip.
+    - min_score: Optional lowest count to return.
+
+    Yields:
+    - Tuples containing the URL and count, highest count first.
     """
-    key = f"Index:{search_term}"
-    count = r.hget(key, url)
+    cursor = None
+    while True:
+        sorted_list, cursor = get_sorted_index_page_for_word(
+            r, word, batch_size, cursor, min_score
+        )
+        yield from sorted_list
+        if cursor is None:
+            return
 
-    if count is None:
-        return 0
 
-    return int(count)
+async def aiter_sorted_index_for_word(r, word, batch_size=100, min_score=None):
+    """
+    Function that is the asyncio counterpart of iter_sorted_index_for_word,
+    for use with `async for` and a redis.asyncio client.
+    """
+    cursor = None
+    while True:
+        sorted_list, cursor = await get_sorted_index_page_for_word(
+            r, word, batch_size, cursor, min_score
+        )
+        for item in sorted_list:
+            yield item
+        if cursor is None:
+            return
+
+
+@_sync_or_async
+def find_unindexed_words(r: Redis, words):
+    """
+    Function that returns the words that have no index yet.
 
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - words: The words to check.
 
+    Returns:
+    - A list of the words without an IndexSorted:{word} sorted set.
+    """
+    p = r.pipeline(transaction=False)
+    for word in words:
+        p.exists(f"IndexSorted:{word}")
+    exists = yield p.execute()
+
+    return [word for word, found in zip(words, exists) if not found]
+
+
+@_sync_or_async
+def get_term_versions(r: Redis, fields):
+    """
+    Function that returns the version counters of words or pagerank keys.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - fields: The words or rank keys to get the counters of.
+
+    Returns:
+    - A list of the counters, None for fields that were never bumped.
+    """
+    versions = yield r.hmget(TERM_VERSION_KEY, list(fields))
+    return [None if version is None else int(version) for version in versions]
+
+
+@_sync_or_async
+def count_query(r: Redis, words):
+    """
+    Function that adds one to the number of times a query was asked.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - words: The words of the query.
+    """
+    yield r.zincrby(QUERY_COUNT_KEY, 1, " ".join(sorted(set(words))))
+
+
+@_sync_or_async
+def get_top_queries(r: Redis, count):
+    """
+    Function that returns the most frequently asked queries.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - count: The number of queries to return.
+
+    Returns:
+    - A list of the sorted words of each query, most frequent first.
+    """
+    queries = yield r.zrevrange(QUERY_COUNT_KEY, 0, count - 1)
+    return [_decode(query).split(" ") for query in queries]
+
+
+@_sync_or_async
 def get_highest_index_for_search_term(r: Redis, search_term):
     """
     retrieve the highest index score for a search term using Sorted Sets
     """
     sorted_set_key = f"IndexSorted:{search_term}"
-    highest_scores = r.zrange(sorted_set_key, -1, -1, withscores=True)
+    highest_scores = yield r.zrange(sorted_set_key, -1, -1, withscores=True)
+    return highest_index_from_scores(highest_scores)
 
-    if not highest_scores:
-        return 0
 
-    # The zrange will return a list of tuples [(url, score)]
-    _, highest_score = highest_scores[0]
-    return int(highest_score)
+@_sync_or_async
+def store_page_ranks(r: Redis, page_ranks, batch_size=10000, key=PAGE_RANK_KEY):
+    """
+    Function that replaces the stored pagerank scores with the given ones.
+    The scores are written to a temporary key and renamed over the rank key,
+    so readers never see a partially written set.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - page_ranks: A dictionary of URL to pagerank score.
+    - batch_size: The number of pages to add per ZADD.
+    - key: The sorted set to store the scores in.
+    """
+    doc_ids = yield get_doc_ids(r, page_ranks)
+    yield store_doc_ranks(r, dict(zip(doc_ids, page_ranks.values())), batch_size, key)
+
+
+@_sync_or_async
+def store_doc_ranks(r: Redis, doc_ranks, batch_size=10000, key=PAGE_RANK_KEY):
+    """
+    Function that replaces the stored pagerank scores like store_page_ranks,
+    for callers that already have the doc ids of the pages.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - doc_ranks: A dictionary of doc id to pagerank score.
+    - batch_size: The number of pages to add per ZADD.
+    - key: The sorted set to store the scores in.
+    """
+    temporary_key = f"{key}:new"
+    items = list(doc_ranks.items())
+
+    p = r.pipeline(transaction=False)
+    p.delete(temporary_key)
+    for start in range(0, len(items), batch_size):
+        p.zadd(temporary_key, dict(items[start : start + batch_size]))
+
+    if items:
+        p.rename(temporary_key, key)
+    else:
+        p.delete(key)
+    p.hincrby(TERM_VERSION_KEY, key, 1)
+    yield p.execute()
+
+
+def get_ranked_index_list_for_word(r: Redis, word, count=None, **options):
+    """
+    Function that returns the pages containing the given word, sorted by a
+    hybrid of their index score and pagerank score.
+
+    Both scores are scaled by their highest value and combined on the Redis
+    server in a single script call, so only the returned pages are sent back.
+    Pages without a pagerank score are ranked by their index score alone.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - word: The word to get the ranked list for.
+    - count: The number of pages to return, or None for all of them.
+    - options: Passed on to get_ranked_index_list_for_words.
+
+    Returns:
+    - A list of tuples containing the URL and hybrid score, highest first.
+    """
+    return get_ranked_index_list_for_words(r, [word], count, **options)
+
+
+@_sync_or_async
+def get_ranked_index_list_for_words(
+    r: Redis,
+    words,
+    count=None,
+    mode="and",
+    offset=0,
+    min_score=None,
+    index_weight=0.3,
+    rank_weight=0.7,
+    ttl=60,
+    rank_key=PAGE_RANK_KEY,
+):
+    """
+    Function that returns the pages matching the given words, sorted by a
+    hybrid of their summed index scores and pagerank score.
+
+    The posting lists of the words are intersected (mode "and") or merged
+    (mode "or") on the Redis server into a Query:{mode}:{words} key, then
+    ranked as in get_ranked_index_list_for_word, all in one script call.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - words: The words to get the ranked list for.
+    - count: The number of pages to return, or None for all of them.
+    - mode: "and" for pages containing every word, "or" for any of them.
+    - offset: The number of highest ranked pages to skip.
+    - min_score: Optional lowest hybrid score to return.
+    - index_weight: The weight of the scaled index score.
+    - rank_weight: The weight of the scaled pagerank score.
+    - ttl: Seconds after which the combined sorted sets expire.
+    - rank_key: The sorted set of pagerank scores to rank by.
+
+    Returns:
+    - A list of tuples containing the URL and hybrid score, highest first.
+    """
+    if mode not in COMBINE_COMMANDS:
+        raise ValueError(f"Unknown query mode {mode!r}, expected 'and' or 'or'.")
+
+    words = sorted(set(words))
+    if not words:
+        return []
+
+    if len(words) == 1:
+        name = words[0]
+        keys = [f"IndexSorted:{name}", rank_key, f"Ranked:{name}", DOC_URL_KEY]
+    else:
+        name = f"{mode}:{' '.join(words)}"
+        keys = [f"Query:{name}", rank_key, f"Ranked:{name}"]
+        keys += [DOC_URL_KEY] + [f"IndexSorted:{word}" for word in words]
+
+    script = r.register_script(HYBRID_RANKING_SCRIPT)
+    args = [
+        index_weight,
+        rank_weight,
+        ttl,
+        "-inf" if min_score is None else min_score,
+        offset,
+        -1 if count is None else count,
+        COMBINE_COMMANDS[mode],
+    ]
+    result = yield script(keys=keys, args=args)
+
+    return [
+        (_decode(member), float(score))
+        for member, score in zip(result[::2], result[1::2])
+    ]
+
+
+@_sync_or_async
+def get_cached_ranked_index_list_for_words(
+    r: Redis, cache, words, count=None, mode="and", **options
+):
+    """
+    Function that returns the same results as get_ranked_index_list_for_words,
+    from a cache when nothing that contributed to them has changed.
+
+    The version counters of the words and the pagerank scores, and the
+    Results:* key in Redis, are read in one round trip. The results are taken
+    from the in-process cache, or else from the Redis key, if they were
+    computed at the current versions. Otherwise they are computed again and
+    stored in both, the Redis key expiring after cache.ttl seconds.
+
+    Parameters:
+    - r: Redis client object used to interact with Redis.
+    - cache: The resultcache.ResultCache in front of the Redis keys.
+    - words: The words to get the ranked list for.
+    - count: The number of pages to return, or None for all of them.
+    - mode: "and" for pages containing every word, "or" for any of them.
+    - options: Passed on to get_ranked_index_list_for_words.
+
+    Returns:
+    - A list of tuples containing the URL and hybrid score, highest first.
+    """
+    words = sorted(set(words))
+    settings = "".join(f":{name}={options[name]}" for name in sorted(options))
+    key = f"Results:{mode}:{count}{settings}:{' '.join(words)}"
+
+    p = r.pipeline(transaction=False)
+    p.hmget(TERM_VERSION_KEY, [*words, options.get("rank_key", PAGE_RANK_KEY)])
+    p.get(key)
+    versions, stored = yield p.execute()
+    versions = [None if version is None else int(version) for version in versions]
+
+    entry = cache.get(key)
+    if (entry is None or entry[0] != versions) and stored is not None:
+        entry = json.loads(stored)
+        entry = entry["versions"], [tuple(result) for result in entry["results"]]
+    if entry is not None and entry[0] == versions:
+        cache.put(key, *entry)
+        return list(entry[1])
+
+    results = yield get_ranked_index_list_for_words(r, words, count, mode, **options)
+
+    yield r.set(
+        key,
+        json.dumps({"versions": versions, "results": results}),
+        px=max(1, int(cache.ttl * 1000)),
+    )
+    cache.put(key, versions, results)
+    return list(results)
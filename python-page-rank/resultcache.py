@@ -0,0 +1,78 @@
+"""
+Module name: resultcache
+
+An in-process LRU cache of ranked query results. It sits in front of the
+Results:* keys in Redis (see redistools.get_cached_ranked_index_list_for_words),
+which hold the same results for every process and expire after the same TTL.
+
+Every entry keeps the version counters of the words that produced it and of
+the pagerank scores. Indexing a page bumps the counters of its words and
+storing new pagerank scores bumps the rank counter, so an entry is only used
+while nothing that contributed to it has changed.
+"""
+
+from collections import OrderedDict
+from time import monotonic
+
+
+class ResultCache:
+    """
+    A least recently used cache of query results with a TTL.
+
+    Attributes
+    ----------
+    max_entries : int
+        The most results kept; the least recently used are dropped first.
+    ttl : float
+        Seconds an entry is kept, here and in Redis.
+
+    Methods
+    -------
+    get(key)
+        Returns the versions and results stored for the key, or None.
+    put(key, versions, results)
+        Stores the results and the versions they were computed at.
+    clear()
+        Drops every entry.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Returns a (versions, results) tuple for the key, or None if it is not
+        cached or has expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, versions, results = entry
+        if monotonic() >= expires_at:
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return versions, results
+
+    def put(self, key, versions, results):
+        """
+        Stores the results for the key with the versions they were computed
+        at, dropping the least recently used entry if the cache is full.
+        """
+        self.entries[key] = (monotonic() + self.ttl, versions, results)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drops every entry.
+        """
+        self.entries.clear()
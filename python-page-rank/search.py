@@ -2,21 +2,52 @@
 Module Name: search
 """
 
-from pagetools import iterate_words, link_generator
+from collections import Counter, deque
+
+from pagetools import extract_page, iterate_words, link_generator
 from redistools import (
-    get_sorted_index_list_for_word,
-    linked_pages,
-    redis_index_pipeline,
-    store_page_links,
-    get_index_for_page_for_search_term,
-    get_highest_index_for_search_term,
+    lookup_pages,
+    store_page_ranks,
+    get_doc_ids,
+    get_forward_index,
+    queue_page_index,
+    queue_page_links,
+    queue_highest_index_for_words,
+    highest_index_from_scores,
 )
+from metrics import metrics
+from pipeline import CrawlPipeline
+from query import search_index, tokenize_query
 from wikifetcher import WikiFetcher
 from pagesearchlist import PageSearchList
-from wordtools import url_relevance
+from wordtools import url_relevance_batch
+
+# Number of results printed for a search.
+RESULT_COUNT = 20
+
+# Seconds before a page's stored links expire and it is fetched again. With a
+# page cache the refetch is usually a conditional GET answered with 304.
+LINKS_TTL = 7 * 24 * 60 * 60
+
+# Number of pages taken from the search list and looked up in Redis at once.
+# Pages already crawled are expanded from their stored links without a fetch,
+# so a larger batch saves round trips when most of the frontier is known.
+FRONTIER_BATCH_SIZE = 16
 
 
-def handle_search_term(redis_client, search_term):
+def search_page_url(search_term):
+    """
+    Function that returns the URL of the Wikipedia search page for a term,
+    where every crawl starts.
+    """
+    return str(
+        "https://en.wikipedia.org/wiki/Special:Search?go=Go&search="
+        + search_term
+        + "&ns0=1"
+    )
+
+
+def handle_search_term(redis_client, search_term, ranker=None, term_ranker=None):
     """
     Function that handles the given search term by fetching the search page,
     creating the page index, and updating relevant pagerank scores.
@@ -24,95 +55,388 @@ def handle_search_term(redis_client, search_term):
     Parameters:
     - redis_client: Redis client object used to interact with Redis.
     - searchTerm: The search term entered by the user.
+    - ranker: Optional IncrementalPageRank that is kept up to date with the
+      links of every newly crawled page.
+    - term_ranker: Optional termrank.TermRanker to rank the results with
+      pagerank personalized to the search term.
     """
     fetcher = WikiFetcher()
-    search_url = str(
-        "https://en.wikipedia.org/wiki/Special:Search?go=Go&search="
-        + search_term
-        + "&ns0=1"
-    )
+    search_url = search_page_url(search_term)
 
     page_list = PageSearchList(search_term)
     page_list.add_page(search_url, 1)
 
     # do in-progress adjustment for which pages to search next
     # based on the calculated index scores so far?
-    # should I do the same with pagerank?
-    # Can I calculate pagerank scores while searching?
+    # should I do the same with pagerank? The ranker is refreshed after every
+    # new page, so its scores are available while searching.
 
-    while page_datum := page_list.get_page_with_highest_score():
-        search_url = page_datum.page_url
+    while batch := pop_frontier_batch(page_list):
+        new_urls = handle_existing_pages(
+            redis_client, [page_datum.page_url for page_datum in batch], page_list
+        )
 
-        if handle_existing_page(redis_client, search_url, page_list):
-            continue
+        for search_url in new_urls:
+            print(str(page_list))
+
+            handle_new_page(redis_client, search_url, page_list, fetcher, ranker)
+
+    print_ranked_results(redis_client, search_term, ranker, term_ranker)
 
-        print(str(page_list))
 
-        handle_new_page(redis_client, search_url, page_list, fetcher)
+async def handle_search_term_async(
+    redis_client, search_term, ranker=None, term_ranker=None, verbose=True, **options
+):
+    """
+    Function that handles the given search term like handle_search_term, but
+    runs the crawl through a CrawlPipeline: pages are fetched concurrently,
+    parsed on worker processes and indexed in batches.
+
+    Parameters:
+    - redis_client: Redis client object used to interact with Redis.
+    - search_term: The search term entered by the user.
+    - ranker: Optional IncrementalPageRank that is kept up to date with the
+      links of every newly crawled page.
+    - term_ranker: Optional termrank.TermRanker to rank the results with
+      pagerank personalized to the search term.
+    - verbose: Whether to print the search list while crawling and the
+      results at the end. Otherwise the pagerank scores are only stored
+      and the term ranker switched to the crawled graph.
+    - options: Passed on to CrawlPipeline.
+    """
+    search_url = search_page_url(search_term)
+
+    page_list = PageSearchList(search_term)
+    page_list.add_page(search_url, 1)
+
+    new_urls = deque()
+
+    def next_url():
+        while not new_urls:
+            batch = pop_frontier_batch(page_list)
+            if not batch:
+                return None
+            new_urls.extend(
+                handle_existing_pages(
+                    redis_client,
+                    [page_datum.page_url for page_datum in batch],
+                    page_list,
+                )
+            )
 
-    index_list = get_sorted_index_list_for_word(redis_client, search_term)
+        if verbose:
+            print(str(page_list))
+        return new_urls.popleft()
 
-    for url, score in index_list:
-        print(f"{url}: {score}")
+    def write_batch(batch):
+        index_parsed_pages(redis_client, batch, page_list, ranker)
 
+    await CrawlPipeline(**options).run(next_url, write_batch)
 
-def handle_existing_page(redis_client, search_url, page_list: PageSearchList):
+    if verbose:
+        print_ranked_results(redis_client, search_term, ranker, term_ranker)
+    else:
+        store_ranks(redis_client, ranker, term_ranker)
+
+
+def store_ranks(redis_client, ranker=None, term_ranker=None):
     """
+    Function that stores the latest pagerank scores and switches the term
+    ranker to the graph they were computed on, so newly crawled pages get
+    personalized scores too.
+
     Parameters:
     - redis_client: Redis client object used to interact with Redis.
-    - search_url: The search url entered by the user.
+    - ranker: Optional IncrementalPageRank with the latest scores.
+    - term_ranker: Optional termrank.TermRanker to update.
     """
-    links = linked_pages(redis_client, search_url)
+    if ranker is None:
+        return
 
-    index = get_index_for_page_for_search_term(
-        redis_client,
-        page_list.search_term,
-        search_url,
-    )
+    with metrics.timer("rank_store_seconds"):
+        store_page_ranks(redis_client, ranker.ranks())
 
-    if links:
-        for link in links:
-            total_score = calculate_page_score_for_searching(
-                url_relevance(link, page_list.search_term), index
-            )
+    if term_ranker is not None:
+        with metrics.timer("term_rank_seconds"):
+            term_ranker.update_graph(ranker.link_graph())
+
+
+def print_ranked_results(redis_client, search_term, ranker=None, term_ranker=None):
+    """
+    Function that stores the latest pagerank scores, if there is a ranker,
+    and prints the top pages for the search term sorted by their hybrid score.
+
+    With a term ranker the pages are ranked by pagerank personalized to the
+    search term, restarting at the search page and the pages that use the
+    term most, instead of the global scores.
+
+    Parameters:
+    - redis_client: Redis client object used to interact with Redis.
+    - search_term: The search term entered by the user.
+    - ranker: Optional IncrementalPageRank with the latest scores.
+    - term_ranker: Optional termrank.TermRanker for personalized scores.
+    """
+    store_ranks(redis_client, ranker, term_ranker)
+
+    options = {}
+    if term_ranker is not None:
+        with metrics.timer("term_rank_seconds"):
+            words = tokenize_query(search_term)
+            seed_urls = [search_page_url(search_term)]
+            options["rank_key"] = term_ranker.rank_key(redis_client, words, seed_urls)
+
+    with metrics.timer("query_seconds"):
+        ranked_list = search_index(
+            redis_client, search_term, count=RESULT_COUNT, **options
+        )
+
+    for url, score in ranked_list:
+        print(f"{url}: {score:.4f}")
+
+
+def pop_frontier_batch(page_list: PageSearchList):
+    """
+    Function that takes the next FRONTIER_BATCH_SIZE pages from the search
+    list and records the frontier metrics.
+
+    Parameters:
+    - page_list: The search list to take the pages from.
+
+    Returns:
+    - A list of PageDatum objects, empty when the crawl is done.
+    """
+    with metrics.timer("frontier_pop_seconds"):
+        batch = page_list.pop_batch(FRONTIER_BATCH_SIZE)
+    metrics.set_gauge("frontier_size", len(page_list))
+    return batch
+
+
+def handle_existing_pages(redis_client, search_urls, page_list: PageSearchList):
+    """
+    Function that adds the stored links of a batch of already crawled pages
+    to the search list. The links, index counts and highest index count are
+    read in a single script call for the whole batch, and the links are
+    scored with each page's index count relative to the highest, as in
+    index_parsed_pages.
+
+    Parameters:
+    - redis_client: Redis client object used to interact with Redis.
+    - search_urls: The URLs of the pages taken from the search list.
+    - page_list: The search list to add the links to.
+
+    Returns:
+    - The URLs that have no stored links and still need to be fetched.
+    """
+    with metrics.timer("redis_lookup_seconds"):
+        highest_index, pages = lookup_pages(
+            redis_client, search_urls, tokenize_query(page_list.search_term)
+        )
+
+    new_urls = []
+    for search_url, (links, index) in zip(search_urls, pages):
+        if not links:
+            new_urls.append(search_url)
+            continue
+
+        index_score = index / highest_index if index else 0
+        word_scores = url_relevance_batch(links, page_list.search_term)
+        for link, word_score in zip(links, word_scores):
+            total_score = calculate_page_score_for_searching(word_score, index_score)
             page_list.add_page(link, total_score)
-        return True
 
-    return False
+    metrics.count("pages_expanded_total", len(search_urls) - len(new_urls))
+    return new_urls
 
 
-def handle_new_page(redis_client, search_url, page_list: PageSearchList, fetcher):
+def handle_new_page(
+    redis_client, search_url, page_list: PageSearchList, fetcher, ranker=None
+):
     """
     Parameters:
     - redis_client: Redis client object used to interact with Redis.
     - search_url: The search url entered by the user.
+    - ranker: Optional IncrementalPageRank to update with the page's links.
     """
     page = fetcher.fetch_wikipedia(search_url)
+    index_new_page(redis_client, search_url, page, page_list, ranker)
 
-    iterator = iterate_words(page)
-    redis_index_pipeline(iterator, search_url, redis_client)
 
-    index = get_index_for_page_for_search_term(
-        redis_client,
-        page_list.search_term,
-        search_url,
-    )
+def index_new_page(
+    redis_client, search_url, page, page_list: PageSearchList, ranker=None
+):
+    """
+    Function that indexes a freshly fetched page, stores its links and adds
+    them to the search list.
 
-    index_score = index / get_highest_index_for_search_term(
-        redis_client, page_list.search_term
+    Parameters:
+    - redis_client: Redis client object used to interact with Redis.
+    - search_url: The URL the page was fetched from.
+    - page: The BeautifulSoup object of the page.
+    - page_list: The search list to add the page's links to.
+    - ranker: Optional IncrementalPageRank to update with the page's links.
+    """
+    with metrics.timer("tokenize_seconds"):
+        word_counts = Counter(iterate_words(page))
+    hrefs = [page_url.get("href") for page_url in link_generator(page)]
+
+    index_parsed_pages(
+        redis_client, [(search_url, word_counts, hrefs)], page_list, ranker
     )
 
+
+def index_parsed_pages(redis_client, batch, page_list: PageSearchList, ranker=None):
+    """
+    Function that indexes a batch of parsed pages and stores their links in a
+    single pipeline, which also reads back the highest index count for the
+    search words, then adds the links to the search list. Pages that were
+    indexed before only have the changes to their words and links written.
+
+    Parameters:
+    - redis_client: Redis client object used to interact with Redis.
+    - batch: A list of (url, word_counts, hrefs) tuples, one per page.
+    - page_list: The search list to add the pages' links to.
+    - ranker: Optional IncrementalPageRank to update with the pages' links.
+    """
+    words = tokenize_query(page_list.search_term)
+    page_links = [
+        ["https://en.wikipedia.org" + href for href in hrefs] for _, _, hrefs in batch
+    ]
+    with metrics.timer("redis_doc_ids_seconds"):
+        doc_ids = iter(
+            get_doc_ids(
+                redis_client,
+                [url for url, _, _ in batch]
+                + [link for links in page_links for link in links],
+            )
+        )
+    page_ids = [next(doc_ids) for _ in batch]
+    with metrics.timer("redis_forward_index_seconds"):
+        forward_index = get_forward_index(redis_client, page_ids)
+
+    p = redis_client.pipeline(transaction=False)
+    for (_, word_counts, _), page_id, links, (old_counts, old_link_ids) in zip(
+        batch, page_ids, page_links, forward_index
+    ):
+        link_ids = [next(doc_ids) for _ in links]
+        queue_page_index(p, page_id, word_counts, old_counts)
+        queue_page_links(p, page_id, link_ids, LINKS_TTL, old_link_ids)
+    queue_highest_index_for_words(p, words)
+    with metrics.timer("redis_write_seconds"):
+        results = p.execute()
+    highest_index = highest_index_from_scores(results[len(results) - len(words) :])
+    metrics.count("pages_indexed_total", len(batch))
+
+    with metrics.timer("frontier_add_seconds"):
+        for _, word_counts, hrefs in batch:
+            index = page_index_count(word_counts, words)
+            index_score = index / highest_index if index else 0
+            add_links_to_search_list(page_list, hrefs, index_score)
+    metrics.set_gauge("frontier_size", len(page_list))
+
+    if ranker is not None:
+        with metrics.timer("rank_update_seconds"):
+            for (url, _, _), links in zip(batch, page_links):
+                ranker.set_links(url, links)
+            ranker.refresh()
+
+
+def page_index_count(word_counts, words):
+    """
+    Function that returns a page's index count for the search words: the
+    sum of its counts for them, leaving out the counts too low to be indexed,
+    so it matches the count lookup_pages reads for a stored page.
+
+    Parameters:
+    - word_counts: A mapping of each word on the page to its count.
+    - words: The words of the search term.
+
+    Returns:
+    - The page's index count.
+    """
+    counts = (word_counts.get(word, 0) for word in words)
+    return sum(count for count in counts if count >= 3)
+
+
+def add_links_to_search_list(page_list: PageSearchList, hrefs, index_score):
+    """
+    Function that adds the linked pages of a page to the search list, scored
+    by how well each link matches the search term and the page's index score.
+
+    Parameters:
+    - page_list: The search list to add the pages to.
+    - hrefs: The hrefs of the page's /wiki links.
+    - index_score: The index score of the linking page.
+
+    Returns:
+    - The full URLs of the linked pages.
+    """
     links = []
-    for page_url in link_generator(page):
-        href = page_url.get("href")
+    word_scores = url_relevance_batch(hrefs, page_list.search_term)
+    for href, word_score in zip(hrefs, word_scores):
         new_url = str("https://en.wikipedia.org" + href)
-        word_score = url_relevance(href, page_list.search_term)
         total_score = calculate_page_score_for_searching(word_score, index_score)
 
         page_list.add_page(new_url, total_score)
         links.append(new_url)
 
-    store_page_links(redis_client, search_url, links)
+    return links
+
+
+def reindex_cached_pages(redis_client, cache, batch_size=100):
+    """
+    Function that indexes every page in the page cache again and stores its
+    links, without crawling.
+
+    Parameters:
+    - redis_client: Redis client object used to interact with Redis.
+    - cache: The PageCache to read the pages from.
+    - batch_size: The number of pages to write per pipeline.
+
+    Returns:
+    - The number of pages indexed.
+    """
+    count = 0
+    batch = []
+    for url, body in cache.iter_pages():
+        word_counts, hrefs = extract_page(body.decode("utf-8", errors="replace"))
+        links = ["https://en.wikipedia.org" + href for href in hrefs]
+        batch.append((url, word_counts, links))
+
+        count += 1
+        if len(batch) >= batch_size:
+            _reindex_batch(redis_client, batch)
+            batch = []
+    _reindex_batch(redis_client, batch)
+
+    return count
+
+
+def _reindex_batch(redis_client, batch):
+    """
+    Writes the changes to the words and links of a batch of (url,
+    word_counts, links) tuples in one pipeline.
+    """
+    if not batch:
+        return
+
+    doc_ids = iter(
+        get_doc_ids(
+            redis_client,
+            [url for url, _, _ in batch]
+            + [link for _, _, links in batch for link in links],
+        )
+    )
+    page_ids = [next(doc_ids) for _ in batch]
+    forward_index = get_forward_index(redis_client, page_ids)
+
+    p = redis_client.pipeline(transaction=False)
+    for (_, word_counts, links), page_id, (old_counts, old_link_ids) in zip(
+        batch, page_ids, forward_index
+    ):
+        link_ids = [next(doc_ids) for _ in links]
+        queue_page_index(p, page_id, word_counts, old_counts)
+        queue_page_links(p, page_id, link_ids, LINKS_TTL, old_link_ids)
+    p.execute()
 
 
 def calculate_page_score_for_searching(word_score, index_score):
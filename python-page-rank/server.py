@@ -0,0 +1,380 @@
+"""
+Module name: server
+
+A long-running HTTP/JSON query server, built on asyncio streams from the
+standard library.
+
+Queries are answered from the existing index with an asyncio Redis client,
+so many can be served at once. Identical queries that arrive while one is
+being answered share its result, and repeated queries are answered from a
+ResultCache until a word in them is indexed again. With a TermRanker, pages
+are ranked by pagerank personalized to the query words. Words that are not in
+the index yet are crawled by a background job, one at a time on a separate
+thread with its own event loop, so crawling never delays a query. The
+response says which words are being crawled, and asking again once the job
+is done returns the new results. A word that is still not in the index after
+its crawl, e.g. because no page uses it three times, is not crawled again
+until a cooldown has passed. At most MAX_CRAWL_JOBS crawls wait in the queue;
+words asked for while it is full are not crawled, and can be crawled when
+they are asked for again later.
+
+Endpoints:
+
+    GET /search?q=machine+learning&count=10&mode=and
+    GET /jobs
+    GET /health
+    GET /metrics   (Prometheus text format, when metrics are enabled)
+
+Example usage:
+
+    python main.py serve --port 8080
+
+"""
+
+import asyncio
+import json
+from time import monotonic
+from urllib.parse import parse_qs, urlsplit
+
+from metrics import metrics
+from query import search_index, tokenize_query
+from redistools import (
+    count_query,
+    create_async_redis_client,
+    find_unindexed_words,
+)
+from resultcache import ResultCache
+from search import handle_search_term_async
+
+MAX_COUNT = 100
+
+# Seconds before a word whose crawl is done or failed can be crawled again.
+CRAWL_COOLDOWN = 60 * 60
+
+# Crawls that can wait in the queue. Each one fetches up to a hundred pages,
+# so queries with many unknown words must not queue more than can be run.
+MAX_CRAWL_JOBS = 32
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class SearchServer:
+    """
+    Serves queries over HTTP and crawls unknown words in the background.
+
+    Attributes
+    ----------
+    redis_client : Redis
+        Sync Redis client used by the crawl jobs.
+    ranker : IncrementalPageRank or None
+        Kept up to date by the crawl jobs.
+    term_ranker : TermRanker or None
+        Solves the personalized pagerank the results are ranked by.
+    crawl_options : dict
+        Passed on to handle_search_term_async, e.g. cache=PageCache().
+    jobs : dict
+        The state of every crawl job by word: "queued", "running", "done"
+        or "failed".
+    crawl_cooldown : float
+        Seconds before a word whose job is done or failed is crawled again.
+    max_crawl_jobs : int
+        The most crawl jobs waiting in the queue.
+    result_cache : ResultCache
+        The cache of query results.
+
+    Methods
+    -------
+    serve_forever(host, port)
+        Listens for requests until cancelled.
+    search(query, count, mode)
+        Returns the results for a query, sharing them with identical
+        queries in flight.
+    can_crawl(word)
+        Returns whether a crawl can be queued for a word.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        ranker=None,
+        term_ranker=None,
+        crawl_cooldown=CRAWL_COOLDOWN,
+        max_crawl_jobs=MAX_CRAWL_JOBS,
+        **crawl_options,
+    ):
+        self.redis_client = redis_client
+        self.ranker = ranker
+        self.term_ranker = term_ranker
+        self.crawl_cooldown = crawl_cooldown
+        self.max_crawl_jobs = max_crawl_jobs
+        self.crawl_options = crawl_options
+        self.jobs = {}
+        self.job_finished = {}
+        self.result_cache = ResultCache()
+
+        self.async_redis = None
+        self.crawl_queue = None
+        self.in_flight = {}
+
+    async def serve_forever(self, host="127.0.0.1", port=8080):
+        """
+        Listens for requests on the given address until cancelled.
+        """
+        self.async_redis = create_async_redis_client()
+        self.crawl_queue = asyncio.Queue(self.max_crawl_jobs)
+        crawler = asyncio.create_task(self.crawl_worker())
+
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving queries on http://{host}:{port}/search?q=...")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            crawler.cancel()
+            await self.async_redis.aclose()
+
+    async def search(self, query, count=10, mode="and"):
+        """
+        Returns the results for a query, and queues a crawl for each of its
+        words that is not in the index. A query that is already being
+        answered is not sent to Redis again; it waits for the same result.
+
+        Parameters:
+        - query: The query entered by the user.
+        - count: The number of pages to return.
+        - mode: "and" for pages containing every word, "or" for any of them.
+
+        Returns:
+        - A dictionary with the results and the words being crawled.
+        """
+        words = tokenize_query(query)
+        key = (tuple(sorted(words)), count, mode)
+
+        metrics.count("queries_total")
+        task = self.in_flight.get(key)
+        if task is None:
+            task = self.in_flight[key] = asyncio.create_task(
+                self.answer(words, count, mode)
+            )
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            metrics.count("queries_coalesced_total")
+
+        # Shielded so a client that disconnects does not cancel the answer
+        # for the others waiting on it.
+        results, crawling = await asyncio.shield(task)
+        return {
+            "query": query,
+            "results": [{"url": url, "score": score} for url, score in results],
+            "crawling": crawling,
+        }
+
+    async def answer(self, words, count, mode):
+        """
+        Looks up a query in the index and queues crawls for unknown words.
+        The query is counted, so the most frequent ones can have their
+        personalized pagerank precomputed (see termrank.py).
+
+        Returns:
+        - A tuple of the (url, score) results and the words being crawled.
+        """
+        options = {}
+        if self.term_ranker is not None:
+            # Solving runs the sync Redis client and numpy on a worker thread.
+            async with metrics.timer("term_rank_seconds"):
+                options["rank_key"] = await asyncio.to_thread(
+                    self.term_ranker.rank_key, self.redis_client, words
+                )
+
+        async with metrics.timer("query_seconds"):
+            results, unindexed, _ = await asyncio.gather(
+                search_index(
+                    self.async_redis,
+                    " ".join(words),
+                    count,
+                    mode,
+                    self.result_cache,
+                    **options,
+                ),
+                find_unindexed_words(self.async_redis, words),
+                count_query(self.async_redis, words),
+            )
+
+        for word in unindexed:
+            if not self.can_crawl(word):
+                continue
+            try:
+                self.crawl_queue.put_nowait(word)
+            except asyncio.QueueFull:
+                metrics.count("crawl_jobs_rejected_total")
+                continue
+            self.jobs[word] = "queued"
+            metrics.set_gauge("crawl_jobs_queued", self.crawl_queue.qsize())
+
+        crawling = [
+            word for word in words if self.jobs.get(word) in ("queued", "running")
+        ]
+        return results, crawling
+
+    def can_crawl(self, word):
+        """
+        Returns whether a crawl can be queued for a word: it has no job, or
+        its last job finished at least crawl_cooldown seconds ago.
+        """
+        if self.jobs.get(word) in ("queued", "running"):
+            return False
+        finished = self.job_finished.get(word)
+        return finished is None or monotonic() - finished >= self.crawl_cooldown
+
+    async def crawl_worker(self):
+        """
+        Runs the queued crawl jobs one after another.
+        """
+        while True:
+            word = await self.crawl_queue.get()
+            self.jobs[word] = "running"
+            metrics.set_gauge("crawl_jobs_queued", self.crawl_queue.qsize())
+            try:
+                async with metrics.timer("crawl_job_seconds"):
+                    await asyncio.to_thread(self.crawl, word)
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"Crawl for {word} failed: {e}")
+                metrics.count("crawl_jobs_failed_total")
+                self.jobs[word] = "failed"
+            else:
+                self.jobs[word] = "done"
+            self.job_finished[word] = monotonic()
+
+    def crawl(self, word):
+        """
+        Crawls pages for a word. Runs on a worker thread with its own event
+        loop, so the sync Redis calls of the crawl do not block the server.
+        """
+        asyncio.run(
+            handle_search_term_async(
+                self.redis_client,
+                word,
+                self.ranker,
+                self.term_ranker,
+                verbose=False,
+                **self.crawl_options,
+            )
+        )
+
+    async def handle_connection(self, reader, writer):
+        """
+        Answers the requests on one connection until the client closes it.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                method, target, version = request_line.decode("latin-1").split()
+                try:
+                    status, body = await self.route(method, target)
+                except Exception as e:  # pylint: disable=broad-except
+                    print(f"Failed to answer {target}: {e!r}")
+                    metrics.count("request_errors_total")
+                    status, body = 500, {"error": "Internal server error."}
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+
+                if isinstance(body, str):
+                    content_type = "text/plain; version=0.0.4"
+                    data = body.encode("utf-8")
+                else:
+                    content_type = "application/json"
+                    data = json.dumps(body).encode("utf-8")
+                writer.write(
+                    f"{version} {status} {REASONS[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    "\r\n".encode("latin-1")
+                    + data
+                )
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, target):
+        """
+        Returns the status and body for a request: a dictionary to send as
+        JSON, or a string to send as plain text.
+        """
+        if method != "GET":
+            return 405, {"error": "Only GET is supported."}
+
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        if url.path == "/health":
+            return 200, {"status": "ok"}
+        if url.path == "/jobs":
+            return 200, self.jobs
+        if url.path == "/metrics":
+            return 200, metrics.to_prometheus()
+        if url.path != "/search":
+            return 404, {"error": f"Unknown path {url.path}."}
+
+        query = params.get("q", "")
+        mode = params.get("mode", "and")
+        if not tokenize_query(query):
+            return 400, {"error": "The q parameter needs at least one word."}
+        if mode not in ("and", "or"):
+            return 400, {"error": "The mode parameter must be 'and' or 'or'."}
+        try:
+            count = int(params.get("count", "10"))
+        except ValueError:
+            count = 0
+        if not 1 <= count <= MAX_COUNT:
+            return 400, {"error": f"The count parameter must be 1 to {MAX_COUNT}."}
+
+        return 200, await self.search(query, count, mode)
+
+
+def serve(
+    redis_client,
+    ranker=None,
+    host="127.0.0.1",
+    port=8080,
+    term_ranker=None,
+    **crawl_options,
+):
+    """
+    Function that runs a SearchServer until interrupted.
+
+    Parameters:
+    - redis_client: Redis client object used by the crawl jobs.
+    - ranker: Optional IncrementalPageRank kept up to date by the crawl jobs.
+    - term_ranker: Optional TermRanker to rank results with personalized
+      pagerank.
+    - host: The address to listen on.
+    - port: The port to listen on.
+    - crawl_options: Passed on to handle_search_term_async.
+    """
+    server = SearchServer(redis_client, ranker, term_ranker, **crawl_options)
+    try:
+        asyncio.run(server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        print("Server stopped.")
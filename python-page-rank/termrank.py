@@ -0,0 +1,446 @@
+"""
+Module name: termrank
+
+Personalized pagerank for search terms. Instead of teleporting to every page
+alike, the random surfer restarts at the pages that use the term most (the top
+of its IndexSorted:{term} sorted sets) and at optional seed pages, such as the
+search page the crawl started from. Rank then collects around the part of the
+graph that is about the term.
+
+Solving costs a power iteration over the whole sparse graph, so the rank
+vector of each term is kept in an LRU cache and reused while the term's index
+and the graph are unchanged. The top scores are stored in a TermRank:{words}
+sorted set, which queries can rank by instead of PageRank.
+
+Run as a script, it precomputes the scores of the most frequent queries sent
+to the server, solving them in blocks, e.g. as a nightly job:
+
+    python termrank.py --top 300
+
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+from time import perf_counter
+from collections import OrderedDict
+
+import numpy as np
+from redis import Redis
+
+from graphsnapshot import GraphSnapshot
+from linkgraph import load_link_graph
+from pagerank import (
+    edge_matrix,
+    pagerank_power,
+    pagerank_power_block,
+    transition_matrix,
+)
+from redistools import (
+    TERM_VERSION_KEY,
+    connect_to_redis,
+    get_sorted_index_list_for_word,
+    get_doc_ids,
+    get_term_versions,
+    get_top_queries,
+    store_doc_ranks,
+)
+
+TERM_RANK_PREFIX = "TermRank:"
+
+# A hash of the state every TermRank:* key was solved at (see
+# TermRanker._state), so other processes can tell whether it is current.
+TERM_RANK_STATE_KEY = "TermRankState"
+
+
+class TermRanker:
+    """
+    Solves and caches personalized pagerank vectors for search terms.
+
+    Attributes
+    ----------
+    graph : linkgraph.LinkGraph
+        The link graph the vectors are solved on.
+    alpha : float
+        Damping parameter for PageRank.
+    max_terms : int
+        The most rank vectors kept; the least recently used are dropped first,
+        together with their TermRank:* keys.
+    seed_pages : int
+        The number of highest counted pages of each word to restart at.
+    seed_weight : float
+        The share of the restart weight given to the seed URLs, if any.
+    store_count : int
+        The number of highest ranked pages stored in Redis.
+
+    Methods
+    -------
+    update_graph(graph)
+        Switches to a newer link graph, dropping the cached vectors if its
+        pages or links changed.
+    personalization(r, words, seed_urls)
+        Returns the restart weight of every node for the words.
+    ranks(r, words, seed_urls)
+        Returns the personalized pagerank vector for the words.
+    rank_key(r, words, seed_urls)
+        Stores the personalized scores in Redis and returns their key.
+    precompute(r, queries)
+        Solves and stores the scores of many queries in blocks.
+    """
+
+    def __init__(
+        self,
+        graph,
+        alpha=0.85,
+        max_terms=64,
+        seed_pages=100,
+        seed_weight=0.5,
+        store_count=10000,
+    ):
+        self.alpha = alpha
+        self.max_terms = max_terms
+        self.seed_pages = seed_pages
+        self.seed_weight = seed_weight
+        self.store_count = store_count
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.graph = None
+        self._doc_ids = None
+        self.update_graph(graph)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update_graph(self, graph):
+        """
+        Switches to the given link graph. The cached vectors are dropped if
+        it has different pages or links, since they were solved on the old one.
+        """
+        with self.lock:
+            if self.graph is not None and _same_graph(graph, self.graph):
+                return
+
+            self.graph = graph
+            self.node_ids = {url: node_id for node_id, url in enumerate(graph.urls)}
+            self.transition_t, self.dangling = transition_matrix(
+                edge_matrix(graph.sources, graph.targets, graph.num_nodes)
+            )
+            self.entries.clear()
+            self._doc_ids = None
+
+    def personalization(self, r: Redis, words, seed_urls=(), node_ids=None):
+        """
+        Function that returns the restart weights for the given words.
+
+        Each word gives the same total weight to its seed_pages highest
+        counted pages, in proportion to their counts. The seed URLs in the
+        graph share seed_weight of the total.
+
+        Parameters:
+        - r: Redis client object used to interact with Redis.
+        - words: The words of the query.
+        - seed_urls: Optional URLs to restart at as well.
+        - node_ids: The URL to node id map of the graph being solved,
+          defaults to that of the current graph.
+
+        Returns:
+        - An array with the weight of every node, summing to 1, or None if
+          no page in the graph matches, meaning uniform weights.
+        """
+        if node_ids is None:
+            node_ids = self.node_ids
+
+        index_weights = np.zeros(len(node_ids))
+        for word in words:
+            pages = get_sorted_index_list_for_word(r, word, count=self.seed_pages)
+            counts = {node_ids[url]: count for url, count in pages if url in node_ids}
+            if counts:
+                total = sum(counts.values())
+                for node_id, count in counts.items():
+                    index_weights[node_id] += count / total
+
+        seed_ids = [node_ids[url] for url in seed_urls if url in node_ids]
+        seed_weights = np.zeros(len(node_ids))
+        seed_weights[seed_ids] = 1.0
+
+        parts = [
+            (weights / weights.sum(), share)
+            for weights, share in (
+                (index_weights, 1 - self.seed_weight),
+                (seed_weights, self.seed_weight),
+            )
+            if weights.sum() > 0
+        ]
+        if not parts:
+            return None
+
+        total_share = sum(share for _, share in parts)
+        return sum(weights * (share / total_share) for weights, share in parts)
+
+    def _cache_key(self, words, seed_urls):
+        """
+        Returns the cache key and the TermRank:* key for a query.
+        """
+        words = tuple(sorted(set(words)))
+        seed_urls = tuple(sorted(set(seed_urls)))
+        key = TERM_RANK_PREFIX + " ".join(words)
+        if seed_urls:
+            digest = hashlib.sha1("\n".join(seed_urls).encode("utf-8"))
+            key += ":" + digest.hexdigest()[:12]
+        return (words, seed_urls), key
+
+    def _state(self, r: Redis, graph, versions):
+        """
+        Returns what a stored rank vector depends on, as a JSON string: the
+        digest of the graph and the index versions of the words.
+        """
+        digest = self._graph_doc_ids(r, graph)[1]
+        return json.dumps({"graph": digest, "versions": versions})
+
+    def _solve(self, r: Redis, cache_key, redis_key, versions):
+        """
+        Returns the cache entry for a query, solving it if the cached vector
+        is missing or was solved at different index versions.
+        """
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is not None and entry["versions"] == versions:
+                self.entries.move_to_end(cache_key)
+                return entry
+            graph, node_ids = self.graph, self.node_ids
+            transition_t, dangling = self.transition_t, self.dangling
+
+        personalization = self.personalization(r, *cache_key, node_ids=node_ids)
+        ranks = pagerank_power(
+            transition_t, dangling, self.alpha, personalization=personalization
+        )
+        entry = {
+            "versions": versions,
+            "ranks": ranks,
+            "graph": graph,
+            "key": redis_key,
+            "state": self._state(r, graph, versions),
+        }
+
+        with self.lock:
+            if graph is self.graph:
+                self.entries[cache_key] = entry
+                self.entries.move_to_end(cache_key)
+            evicted = []
+            while len(self.entries) > self.max_terms:
+                evicted.append(self.entries.popitem(last=False)[1]["key"])
+
+        if evicted:
+            p = r.pipeline(transaction=False)
+            p.delete(*evicted)
+            p.hdel(TERM_RANK_STATE_KEY, *evicted)
+            p.execute()
+        return entry
+
+    def _graph_doc_ids(self, r: Redis, graph):
+        """
+        Returns the doc id of every node of the graph and a digest of its
+        pages and links, computed once per graph, so stored scores need no
+        URL lookups.
+
+        The digest is taken over the sorted doc ids of the pages and links,
+        so processes that loaded the same graph in a different node order,
+        e.g. from a snapshot, agree on it.
+        """
+        cached = self._doc_ids
+        if cached is not None and cached[0] is graph:
+            return cached[1:]
+
+        doc_ids = np.array(get_doc_ids(r, graph.urls), dtype=np.int64)
+        links = doc_ids[np.asarray(graph.sources)] << 32
+        links |= doc_ids[np.asarray(graph.targets)]
+        links.sort()
+        if len(links):
+            links = links[np.concatenate(([True], links[1:] != links[:-1]))]
+        digest = hashlib.sha1(np.sort(doc_ids).tobytes())
+        digest.update(links.tobytes())
+
+        self._doc_ids = graph, doc_ids, digest.hexdigest()
+        return self._doc_ids[1:]
+
+    def _store(self, r: Redis, entry):
+        """
+        Stores the store_count highest scores of a cache entry in its
+        TermRank:* key, followed by the state they were solved at.
+        """
+        ranks = entry["ranks"]
+        top = np.arange(len(ranks))
+        if len(ranks) > self.store_count:
+            top = np.argpartition(ranks, -self.store_count)[-self.store_count :]
+
+        doc_ids, _ = self._graph_doc_ids(r, entry["graph"])
+        store_doc_ranks(
+            r, dict(zip(doc_ids[top].tolist(), ranks[top].tolist())), key=entry["key"]
+        )
+        r.hset(TERM_RANK_STATE_KEY, entry["key"], entry["state"])
+
+    def _stored_states(self, r: Redis, queries):
+        """
+        Returns the cache key, TermRank:* key, current versions and whether
+        the stored scores are current, for each (words, seed_urls) query, read
+        in one round trip.
+        """
+        keys = [self._cache_key(words, seed_urls) for words, seed_urls in queries]
+
+        p = r.pipeline(transaction=False)
+        for (words, _), redis_key in keys:
+            p.hmget(TERM_VERSION_KEY, list(words))
+            p.hget(TERM_RANK_STATE_KEY, redis_key)
+            p.exists(redis_key)
+        replies = p.execute()
+
+        states = []
+        graph = self.graph
+        for index, (cache_key, redis_key) in enumerate(keys):
+            versions, state, exists = replies[3 * index : 3 * index + 3]
+            versions = [None if value is None else int(value) for value in versions]
+            expected = self._state(r, graph, versions)
+            current = bool(exists) and state in (expected, expected.encode())
+            states.append((cache_key, redis_key, versions, current))
+        return states
+
+    def ranks(self, r: Redis, words, seed_urls=()):
+        """
+        Function that returns the personalized pagerank for a query.
+
+        Parameters:
+        - r: Redis client object used to interact with Redis.
+        - words: The words of the query.
+        - seed_urls: Optional URLs to restart at as well.
+
+        Returns:
+        - A dictionary of URL to pagerank score.
+        """
+        cache_key, redis_key = self._cache_key(words, seed_urls)
+        versions = get_term_versions(r, cache_key[0])
+        entry = self._solve(r, cache_key, redis_key, versions)
+        return dict(zip(entry["graph"].urls, map(float, entry["ranks"])))
+
+    def rank_key(self, r: Redis, words, seed_urls=()):
+        """
+        Function that stores the store_count highest personalized scores for
+        a query in Redis, unless they are already there, and returns the key
+        to pass to the query functions as rank_key.
+
+        Scores stored by another process for the same graph and index
+        versions, e.g. by the nightly precompute, are used as they are.
+
+        Parameters:
+        - r: Redis client object used to interact with Redis.
+        - words: The words of the query.
+        - seed_urls: Optional URLs to restart at as well.
+
+        Returns:
+        - The name of the TermRank:* sorted set.
+        """
+        [(cache_key, redis_key, versions, current)] = self._stored_states(
+            r, [(words, seed_urls)]
+        )
+        if not current:
+            self._store(r, self._solve(r, cache_key, redis_key, versions))
+        return redis_key
+
+    def precompute(self, r: Redis, queries, block_size=16):
+        """
+        Function that solves and stores the personalized scores of many
+        queries, solving block_size of them at a time with
+        pagerank.pagerank_power_block, so the graph is read once per
+        iteration for the whole block. Queries whose stored scores are
+        current are skipped. The vectors are not kept in the cache.
+
+        Parameters:
+        - r: Redis client object used to interact with Redis.
+        - queries: Lists of the words of each query.
+        - block_size: The number of queries solved together.
+
+        Returns:
+        - The number of queries solved.
+        """
+        with self.lock:
+            graph, node_ids = self.graph, self.node_ids
+            transition_t, dangling = self.transition_t, self.dangling
+
+        pending = [
+            state
+            for state in self._stored_states(r, [(words, ()) for words in queries])
+            if not state[3]
+        ]
+        uniform = np.ones(graph.num_nodes)
+
+        for start in range(0, len(pending), block_size):
+            block = pending[start : start + block_size]
+            personalization = np.empty((graph.num_nodes, len(block)))
+            for column, (cache_key, _, _, _) in enumerate(block):
+                weights = self.personalization(r, *cache_key, node_ids=node_ids)
+                personalization[:, column] = uniform if weights is None else weights
+
+            ranks = pagerank_power_block(
+                transition_t,
+                dangling,
+                personalization,
+                self.alpha,
+                block_size=block_size,
+            )
+            for column, (_, redis_key, versions, _) in enumerate(block):
+                entry = {
+                    "ranks": ranks[:, column],
+                    "graph": graph,
+                    "key": redis_key,
+                    "state": self._state(r, graph, versions),
+                }
+                self._store(r, entry)
+
+        return len(pending)
+
+
+def _same_graph(graph, other):
+    """
+    Returns whether two link graphs have the same pages and links, with the
+    same node ids.
+    """
+    return (
+        graph.num_nodes == other.num_nodes
+        and graph.num_edges == other.num_edges
+        and np.array_equal(graph.sources, other.sources)
+        and np.array_equal(graph.targets, other.targets)
+        and list(graph.urls) == list(other.urls)
+    )
+
+
+def main():
+    """
+    Precomputes the personalized scores of the most frequent queries.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[3])
+    parser.add_argument("--top", type=int, default=300)
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument(
+        "--snapshot", help="rank on this link graph snapshot instead of Redis"
+    )
+    args = parser.parse_args()
+
+    client = connect_to_redis()
+    if args.snapshot:
+        graph = GraphSnapshot(args.snapshot).link_graph()
+    else:
+        graph = load_link_graph(client)
+    print(graph)
+
+    queries = get_top_queries(client, args.top)
+    start = perf_counter()
+    solved = TermRanker(graph).precompute(client, queries, args.block_size)
+    print(
+        f"Solved {solved} of the top {len(queries)} queries "
+        f"in {perf_counter() - start:.1f} seconds."
+    )
+
+
+if __name__ == "__main__":
+    main()
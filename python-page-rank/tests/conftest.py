@@ -0,0 +1,30 @@
+"""
+The modules are run as scripts from the python-page-rank directory, so the
+tests import them from there as well.
+"""
+
+import os
+import sys
+
+import pytest
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def redis_server():
+    """
+    A client for the real Redis server at REDIS_TEST_URL, for tests that
+    fakeredis can not answer, such as how long a command takes. The database
+    is flushed before and after the test, so point it at a spare one.
+    """
+    url = os.getenv("REDIS_TEST_URL")
+    if not url:
+        pytest.skip("REDIS_TEST_URL is not set")
+
+    client = redis.Redis.from_url(url)
+    client.flushdb()
+    yield client
+    client.flushdb()
+    client.close()
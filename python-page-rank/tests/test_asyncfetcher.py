@@ -0,0 +1,119 @@
+import asyncio
+from time import monotonic
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import asyncfetcher
+from asyncfetcher import AsyncWikiFetcher
+from metrics import Metrics
+
+PAGE = """<html><body><div id="mw-content-text">
+<p>Python is a programming language.</p>
+<a href="/wiki/Guido_van_Rossum">Guido</a>
+</div></body></html>"""
+
+
+def run_fetch(responses, path="/wiki/Python", **options):
+    """
+    Serves the given (status, headers) responses in turn, then the fixture
+    page, and fetches the page once.
+
+    Returns:
+    - The fetch's result or exception, the number of requests the server
+      got and the seconds the fetch took.
+    """
+    responses = list(responses)
+    requests = []
+
+    async def handler(request):
+        requests.append(request.path)
+        if len(requests) <= len(responses):
+            status, headers = responses[len(requests) - 1]
+            return web.Response(status=status, headers=headers)
+        return web.Response(text=PAGE, content_type="text/html")
+
+    async def fetch():
+        app = web.Application()
+        app.router.add_get("/wiki/{title}", handler)
+        async with TestServer(app) as server:
+            options.setdefault("rate", 1000)
+            async with AsyncWikiFetcher(**options) as fetcher:
+                start = monotonic()
+                try:
+                    result = await fetcher.fetch_wikipedia(str(server.make_url(path)))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    result = error
+                return result, len(requests), monotonic() - start
+
+    return asyncio.run(fetch())
+
+
+def test_fetches_fixture_page():
+    page, requests, _ = run_fetch([])
+
+    assert requests == 1
+    assert page.find("a")["href"] == "/wiki/Guido_van_Rossum"
+
+
+def test_retries_with_exponential_backoff():
+    page, requests, seconds = run_fetch(
+        [(500, {}), (503, {}), (502, {})], retries=3, backoff=0.05
+    )
+
+    assert requests == 4
+    assert page.find("p").text == "Python is a programming language."
+    # Waits 0.05, 0.1 and 0.2 seconds between the attempts.
+    assert seconds >= 0.35
+
+
+def test_waits_for_retry_after():
+    page, requests, seconds = run_fetch(
+        [(429, {"Retry-After": "1"})], retries=1, backoff=0.01
+    )
+
+    assert requests == 2
+    assert page is not None
+    assert seconds >= 1
+
+
+def test_raises_after_last_retry():
+    error, requests, _ = run_fetch([(503, {})] * 3, retries=2, backoff=0.01)
+
+    assert requests == 3
+    assert isinstance(error, aiohttp.ClientResponseError)
+    assert error.status == 503
+
+
+@pytest.mark.parametrize("status", [404, 403])
+def test_does_not_retry_client_errors(status):
+    error, requests, _ = run_fetch([(status, {})], retries=3, backoff=0.01)
+
+    assert requests == 1
+    assert error.status == status
+
+
+def test_fetch_seconds_excludes_waiting_for_a_request_slot(monkeypatch):
+    registry = Metrics(enabled=True)
+    monkeypatch.setattr(asyncfetcher, "metrics", registry)
+
+    async def slow_handler(request):
+        await asyncio.sleep(0.2)
+        return web.Response(text=PAGE, content_type="text/html")
+
+    async def fetch_three():
+        app = web.Application()
+        app.router.add_get("/wiki/{title}", slow_handler)
+        async with TestServer(app) as server:
+            async with AsyncWikiFetcher(max_in_flight=1, rate=1000) as fetcher:
+                urls = [str(server.make_url(f"/wiki/{n}")) for n in "ABC"]
+                await asyncio.gather(*map(fetcher.fetch_html, urls))
+
+    asyncio.run(fetch_three())
+
+    # One request at a time: the last one waits 0.4 seconds for its slot.
+    histogram = registry.histograms["fetch_seconds"]
+    assert histogram.count == 3
+    assert 0.6 <= histogram.sum < 0.9
@@ -0,0 +1,46 @@
+import fakeredis
+import numpy as np
+
+from graphsnapshot import GraphSnapshot, write_snapshot
+from linkgraph import load_link_graph
+from pagesearchlist import PageSearchList
+from search import index_parsed_pages
+
+URL = "https://en.wikipedia.org/wiki/A"
+
+
+def crawl(r, url, hrefs):
+    index_parsed_pages(r, [(url, {"cat": 1}, hrefs)], PageSearchList("cat"))
+
+
+def test_snapshot_is_stale_after_links_change(tmp_path):
+    r = fakeredis.FakeRedis()
+    path = tmp_path / "graph.snapshot"
+    crawl(r, URL, ["/wiki/B", "/wiki/C"])
+    write_snapshot(load_link_graph(r), path)
+
+    snapshot = GraphSnapshot(path)
+    assert snapshot.num_edges == 2
+    assert not snapshot.is_stale(r)
+
+    # Crawling the page again with the same links writes nothing.
+    crawl(r, URL, ["/wiki/B", "/wiki/C"])
+    assert not snapshot.is_stale(r)
+
+    crawl(r, URL, ["/wiki/B"])
+    assert snapshot.is_stale(r)
+
+
+def test_snapshot_matches_graph(tmp_path):
+    r = fakeredis.FakeRedis()
+    crawl(r, URL, ["/wiki/B", "/wiki/C"])
+    crawl(r, "https://en.wikipedia.org/wiki/B", ["/wiki/A", "/wiki/A"])
+    graph = load_link_graph(r)
+    write_snapshot(graph, tmp_path / "graph.snapshot")
+
+    snapshot = GraphSnapshot(tmp_path / "graph.snapshot")
+    assert list(snapshot.urls) == list(graph.urls)
+    assert sorted(zip(snapshot.sources().tolist(), snapshot.targets.tolist())) == (
+        sorted(zip(graph.sources.tolist(), graph.targets.tolist()))
+    )
+    assert np.isclose(sum(snapshot.page_ranks().values()), 1.0)
@@ -0,0 +1,104 @@
+import numpy as np
+
+from graphsnapshot import GraphSnapshot, write_snapshot
+from incrementalrank import IncrementalPageRank
+from linkgraph import LinkGraph
+from pagerank import pagerank_edges
+
+
+def counting_recomputes(ranker):
+    """
+    Wraps the ranker's recompute() to count how often refresh() falls back
+    to it.
+    """
+    calls = []
+    recompute = ranker.recompute
+
+    def counted(*args, **kwargs):
+        calls.append(1)
+        return recompute(*args, **kwargs)
+
+    ranker.recompute = counted
+    return calls
+
+
+def assert_matches_pagerank_edges(ranker):
+    graph = ranker.link_graph()
+    expected = pagerank_edges(
+        graph.sources, graph.targets, graph.num_nodes, tol=1e-12, max_iter=1000
+    )
+    ranks = ranker.ranks()
+    actual = np.array([ranks[url] for url in graph.urls])
+    np.testing.assert_allclose(actual, expected, rtol=1e-3)
+
+
+def test_refresh_after_crawl_batches_does_not_recompute():
+    rng = np.random.default_rng(0)
+    num_pages = 5000
+    links = [rng.integers(0, num_pages, rng.integers(0, 30)) for _ in range(num_pages)]
+
+    ranker = IncrementalPageRank()
+    for page in range(1000):
+        ranker.set_links(f"p{page}", [f"p{link}" for link in links[page]])
+    ranker.refresh()
+
+    # Every batch links to new pages, which are dangling until crawled.
+    recomputes = counting_recomputes(ranker)
+    for start in range(1000, 1800, 16):
+        for page in range(start, start + 16):
+            ranker.set_links(f"p{page}", [f"p{link}" for link in links[page]])
+        ranker.refresh()
+
+    assert not recomputes
+    assert_matches_pagerank_edges(ranker)
+
+
+def test_changed_links_match_pagerank_edges():
+    rng = np.random.default_rng(1)
+    ranker = IncrementalPageRank()
+    recomputes = counting_recomputes(ranker)
+
+    # Pages get new links, lose all of them or link to new pages.
+    for _ in range(200):
+        for _ in range(10):
+            page = rng.integers(0, 2000)
+            count = rng.integers(0, 8) if rng.random() > 0.3 else 0
+            links = [f"p{link}" for link in rng.integers(0, 2000, count)]
+            ranker.set_links(f"p{page}", links)
+        ranker.refresh()
+
+    assert not recomputes
+    assert_matches_pagerank_edges(ranker)
+
+
+def test_single_page():
+    ranker = IncrementalPageRank()
+    ranker.set_links("a", [])
+    ranker.refresh()
+
+    assert ranker.ranks() == {"a": 1.0}
+
+
+def test_from_snapshot_then_changed_links(tmp_path):
+    rng = np.random.default_rng(2)
+    num_pages = 500
+    urls = [f"p{page}" for page in range(num_pages)]
+    sources = rng.integers(0, num_pages, 3000)
+    targets = rng.integers(0, num_pages, 3000)
+    write_snapshot(LinkGraph(urls, sources, targets), tmp_path / "graph.snapshot")
+
+    ranker = IncrementalPageRank.from_link_graph(
+        GraphSnapshot(tmp_path / "graph.snapshot").link_graph()
+    )
+    ranker.refresh()
+    assert_matches_pagerank_edges(ranker)
+
+    recomputes = counting_recomputes(ranker)
+    ranker.set_links("p0", ["p1", "p2", "new"])
+    ranker.set_links("p3", [])
+    ranker.refresh()
+
+    assert not recomputes
+    graph = ranker.link_graph()
+    assert set(graph.targets[graph.sources == 0].tolist()) == {1, 2, num_pages}
+    assert_matches_pagerank_edges(ranker)
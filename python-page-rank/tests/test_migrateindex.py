@@ -0,0 +1,55 @@
+import os
+
+import fakeredis
+import pytest
+from redis import Redis
+
+from migrateindex import build_forward_index, index_memory_usage, migrate_index
+
+
+@pytest.mark.parametrize("decode_responses", [False, True])
+def test_build_forward_index(decode_responses):
+    r = fakeredis.FakeRedis(decode_responses=decode_responses)
+    r.zadd("IndexSorted:cat", {"1": 3, "2": 5})
+    r.zadd("IndexSorted:dog", {"1": 4})
+
+    assert build_forward_index(r, batch_size=1) == 2
+    pages = {
+        doc_id: {
+            word.decode() if isinstance(word, bytes) else word: int(count)
+            for word, count in r.hgetall(f"PageWords:{doc_id}").items()
+        }
+        for doc_id in (1, 2)
+    }
+    assert pages == {1: {"cat": 3, "dog": 4}, 2: {"cat": 5}}
+
+
+@pytest.mark.parametrize("decode_responses", [False, True])
+def test_migrate_index(decode_responses):
+    r = fakeredis.FakeRedis(decode_responses=decode_responses)
+    r.hset("Index:cat", mapping={"1": 3, "2": 5})
+    r.zadd("IndexSorted:cat", {"1": 4})
+    r.hset("Index:dog", mapping={"1": 6})
+
+    assert migrate_index(r, batch_size=1) == 2
+    assert not r.exists("Index:cat", "Index:dog")
+    # Counts already in the sorted set are kept.
+    assert r.zrange("IndexSorted:cat", 0, -1, withscores=True) == [
+        (member if decode_responses else member.encode(), score)
+        for member, score in [("1", 4), ("2", 5)]
+    ]
+    assert r.zscore("IndexSorted:dog", "1") == 6
+
+
+@pytest.mark.parametrize("decode_responses", [False, True])
+def test_index_memory_usage(redis_server, decode_responses):
+    # The fixture flushes the database, this client reads it.
+    r = Redis.from_url(os.environ["REDIS_TEST_URL"], decode_responses=decode_responses)
+    r.hset("Index:cat", mapping={"1": 3})
+    r.zadd("IndexSorted:cat", {"1": 3})
+    r.zadd("IndexSorted:dog", {"1": 4})
+
+    words, hash_bytes, sorted_set_bytes = index_memory_usage(r)
+
+    assert words == 2
+    assert hash_bytes > 0 and sorted_set_bytes > hash_bytes
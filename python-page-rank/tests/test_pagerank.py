@@ -0,0 +1,70 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from pagerank import (
+    pagerank_numpy,
+    pagerank_power,
+    pagerank_power_block,
+    pagerank_sparse,
+    transition_matrix,
+)
+
+
+@pytest.fixture
+def graph():
+    # A random graph with some dangling nodes and some without in links.
+    graph = nx.gnp_random_graph(60, 0.05, seed=3, directed=True)
+    graph.remove_edges_from(list(graph.out_edges([0, 1, 2])))
+    return graph
+
+
+def assert_same_ranks(actual, expected):
+    assert actual.keys() == expected.keys()
+    np.testing.assert_allclose(
+        [actual[node] for node in expected], list(expected.values()), atol=1e-9
+    )
+
+
+def test_pagerank_power_matches_pagerank_numpy(graph):
+    expected = pagerank_numpy(graph, alpha=0.85)
+    actual = pagerank_sparse(graph, alpha=0.85, tol=1e-13, max_iter=1000)
+
+    assert_same_ranks(actual, expected)
+
+
+def test_personalized_pagerank_power_matches_pagerank_numpy(graph):
+    personalization = {node: node % 3 for node in graph}
+    dangling = {node: 1 for node in range(10)}
+    expected = pagerank_numpy(graph, 0.9, personalization, dangling)
+    actual = pagerank_sparse(
+        graph,
+        0.9,
+        personalization=[personalization[node] for node in graph],
+        dangling_weights=[dangling.get(node, 0) for node in graph],
+        tol=1e-13,
+        max_iter=1000,
+    )
+
+    assert_same_ranks(actual, expected)
+
+
+def test_pagerank_power_block_matches_pagerank_power(graph):
+    transition_t, dangling = transition_matrix(nx.to_scipy_sparse_array(graph))
+    rng = np.random.default_rng(0)
+    personalization = rng.random((len(graph), 5))
+    personalization[:, 0] = 0
+    personalization[4, 0] = 1
+
+    block = pagerank_power_block(
+        transition_t, dangling, personalization, block_size=2
+    )
+    for column in range(personalization.shape[1]):
+        expected = pagerank_power(
+            transition_t, dangling, personalization=personalization[:, column]
+        )
+        np.testing.assert_allclose(block[:, column], expected, rtol=0, atol=1e-15)
+
+
+def test_pagerank_power_empty_graph():
+    assert pagerank_sparse(nx.DiGraph()) == {}
@@ -0,0 +1,90 @@
+from pagesearchlist import PageSearchList
+
+
+def popped(page_list):
+    return page_list.pop_batch(len(page_list.urls))
+
+
+def popped_urls(page_list):
+    return [page.page_url for page in popped(page_list)]
+
+
+def test_pages_are_kept_once_with_their_highest_score():
+    page_list = PageSearchList("cat")
+    page_list.add_page("a", 0.1)
+    page_list.add_page("b", 0.5)
+    page_list.add_page("a", 0.9)
+    page_list.add_page("b", 0.2)
+    page_list.add_page(b"c", 0.3)
+
+    assert len(page_list) == 3
+    assert [(page.page_url, page.score) for page in popped(page_list)] == [
+        ("a", 0.9),
+        ("b", 0.5),
+        ("c", 0.3),
+    ]
+    assert len(page_list) == 0
+
+
+def test_searched_pages_are_not_added_again():
+    page_list = PageSearchList("cat")
+    page_list.add_page("a", 0.5)
+    page_list.get_page_with_highest_score()
+    page_list.add_page("a", 0.9)
+
+    assert len(page_list) == 0
+    assert page_list.get_page_with_highest_score() is None
+
+
+def test_stops_after_max_pages():
+    page_list = PageSearchList("cat", max_pages=2)
+    for page in "abc":
+        page_list.add_page(page, 0.5)
+
+    assert len(page_list.pop_batch(5)) == 2
+    assert page_list.get_page_with_highest_score() is None
+
+
+def test_lowest_pages_are_evicted_and_not_added_below_the_floor():
+    page_list = PageSearchList("cat", max_frontier=10)
+    for score in range(11):
+        page_list.add_page(f"p{score}", score)
+
+    # 90% of the frontier is kept, the rest are dropped.
+    assert len(page_list) == 9
+    assert page_list.eviction_floor == 2
+
+    page_list.add_page("low", 1.5)
+    assert len(page_list) == 9
+    page_list.add_page("p0", 5.5)
+    assert len(page_list) == 10
+
+    assert popped_urls(page_list) == [
+        "p10", "p9", "p8", "p7", "p6", "p0", "p5", "p4", "p3", "p2"
+    ]
+
+
+def test_compact_drops_stale_heap_entries():
+    page_list = PageSearchList("cat", max_frontier=5)
+    page_list.add_page("b", 0.5)
+    for step in range(1, 12):
+        page_list.add_page("a", step)
+
+    assert len(page_list.heap) <= 2 * page_list.max_frontier
+    assert len(page_list) == 2
+    assert popped_urls(page_list) == ["a", "b"]
+
+
+def test_compact_keeps_the_highest_pages():
+    page_list = PageSearchList("cat")
+    for score, page in enumerate("abcde"):
+        page_list.add_page(page, score)
+    page_list.add_page("a", 10)
+
+    page_list.compact(2)
+
+    assert len(page_list) == 2
+    assert popped_urls(page_list) == ["a", "e"]
+    # Dropped pages can be added again.
+    page_list.add_page("b", 1)
+    assert len(page_list) == 1
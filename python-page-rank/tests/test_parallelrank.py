@@ -0,0 +1,64 @@
+import numpy as np
+
+from benchmarks.fixtures import power_law_graph
+from pagerank import edge_matrix, pagerank_power, transition_matrix
+from parallelrank import ParallelPageRank, pagerank_parallel
+
+
+def transition(num_nodes, seed=0):
+    sources, targets = power_law_graph(num_nodes, seed=seed)
+    return transition_matrix(edge_matrix(sources, targets, num_nodes))
+
+
+def test_pagerank_parallel_matches_pagerank_power():
+    transition_t, dangling = transition(5000)
+
+    expected = pagerank_power(transition_t, dangling, tol=1e-10, max_iter=200)
+    actual = pagerank_parallel(
+        transition_t, dangling, processes=3, tol=1e-10, max_iter=200
+    )
+
+    np.testing.assert_allclose(actual, expected, rtol=1e-12, atol=0)
+
+
+def test_personalized_solves_match_pagerank_power():
+    transition_t, dangling = transition(2000, seed=1)
+    rng = np.random.default_rng(0)
+    options = {
+        "alpha": 0.9,
+        "personalization": rng.random(2000),
+        "dangling_weights": rng.random(2000),
+    }
+
+    with ParallelPageRank(transition_t, dangling, processes=2) as engine:
+        # The engine is reused, so each solve must start from its own vectors.
+        plain = engine.solve()
+        personalized = engine.solve(**options)
+
+    np.testing.assert_allclose(
+        plain, pagerank_power(transition_t, dangling), rtol=1e-12, atol=0
+    )
+    np.testing.assert_allclose(
+        personalized,
+        pagerank_power(transition_t, dangling, **options),
+        rtol=1e-12,
+        atol=0,
+    )
+
+
+def test_more_processes_than_nodes():
+    transition_t, dangling = transition_matrix(
+        edge_matrix(np.array([0, 1, 2]), np.array([1, 2, 0]), 5)
+    )
+
+    actual = pagerank_parallel(transition_t, dangling, processes=8)
+
+    np.testing.assert_allclose(
+        actual, pagerank_power(transition_t, dangling), rtol=1e-12, atol=0
+    )
+
+
+def test_empty_graph():
+    transition_t, dangling = transition_matrix(edge_matrix([], [], 0))
+
+    assert len(pagerank_parallel(transition_t, dangling, processes=2)) == 0
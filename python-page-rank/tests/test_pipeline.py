@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from pipeline import CrawlPipeline
+
+PAGE = '<html><body><p>cat cat cat</p><a href="/wiki/B">B</a></body></html>'
+
+
+class FullDiskCache:
+    """
+    A page cache that has nothing cached and fails to store the given page.
+    """
+
+    def __init__(self, failing_title):
+        self.failing_title = failing_title
+
+    def get(self, url):
+        return None, None
+
+    def store(self, url, body, etag, last_modified):
+        if url.endswith(self.failing_title):
+            raise OSError(28, "No space left on device")
+
+
+async def handler(request):
+    return web.Response(text=PAGE, content_type="text/html")
+
+
+def crawl(titles, **fetcher_options):
+    """
+    Crawls the given pages from a local server and returns the URLs of the
+    pages that were written.
+    """
+    written = []
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/wiki/{title}", handler)
+        async with TestServer(app) as server:
+            urls = [str(server.make_url(f"/wiki/{title}")) for title in titles]
+            pipeline = CrawlPipeline(
+                processes=1, rate=1000, retries=0, **fetcher_options
+            )
+            await asyncio.wait_for(
+                pipeline.run(
+                    lambda: urls.pop() if urls else None,
+                    lambda batch: written.extend(url for url, _, _ in batch),
+                ),
+                timeout=30,
+            )
+
+    asyncio.run(run())
+    return written
+
+
+def test_crawl_writes_parsed_pages():
+    written = crawl(["A", "C"])
+
+    assert sorted(url.rsplit("/", 1)[1] for url in written) == ["A", "C"]
+
+
+def test_crawl_finishes_when_a_fetch_raises():
+    written = crawl(["A", "B"], cache=FullDiskCache("/wiki/B"))
+
+    assert [url.rsplit("/", 1)[1] for url in written] == ["A"]
+
+
+def test_fetches_are_answered_while_a_batch_is_written():
+    answered = []
+    writes = []
+
+    async def slow_handler(request):
+        if request.match_info["title"] != "A":
+            await asyncio.sleep(0.2)
+        answered.append(time.monotonic())
+        return web.Response(text=PAGE, content_type="text/html")
+
+    def write_batch(batch):
+        start = time.monotonic()
+        if not writes:
+            # Blocks like a Redis pipeline or a pagerank recompute would.
+            time.sleep(1)
+        writes.append((start, time.monotonic()))
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/wiki/{title}", slow_handler)
+        async with TestServer(app) as server:
+            urls = [str(server.make_url(f"/wiki/{title}")) for title in "BCDA"]
+            pipeline = CrawlPipeline(processes=1, batch_size=1, rate=1000, retries=0)
+            await asyncio.wait_for(
+                pipeline.run(lambda: urls.pop() if urls else None, write_batch),
+                timeout=30,
+            )
+
+    asyncio.run(run())
+
+    start, end = writes[0]
+    assert len(writes) == 4
+    assert any(start < answered_at < end for answered_at in answered)
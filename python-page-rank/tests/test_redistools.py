@@ -0,0 +1,193 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+from pagesearchlist import PageSearchList
+from redistools import (
+    DOC_ID_KEY,
+    PAGE_RANK_KEY,
+    TERM_VERSION_KEY,
+    get_doc_urls,
+    get_forward_index,
+    get_ranked_index_list_for_words,
+    get_sorted_index_list_for_word,
+    get_sorted_index_page_for_word,
+    iter_sorted_index_for_word,
+    lookup_pages,
+    redis_index_pipeline,
+    store_page_ranks,
+)
+from search import index_parsed_pages
+
+URL = "https://en.wikipedia.org/wiki/A"
+
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis()
+
+
+def words(**counts):
+    return [word for word, count in counts.items() for _ in range(count)]
+
+
+def doc_id_of(r, url):
+    return int(r.hget(DOC_ID_KEY, url))
+
+
+def crawl(r, url, word_counts, hrefs):
+    index_parsed_pages(r, [(url, word_counts, hrefs)], PageSearchList("cat"))
+
+
+def test_reindex_removes_words_no_longer_on_the_page(r):
+    redis_index_pipeline(words(cat=3, dog=4, emu=2), URL, r)
+    redis_index_pipeline(words(cat=3, emu=5), URL, r)
+
+    doc_id = doc_id_of(r, URL)
+    assert get_forward_index(r, [doc_id]) == [({"cat": 3, "emu": 5}, set())]
+    assert get_sorted_index_list_for_word(r, "cat") == [(URL, 3)]
+    assert get_sorted_index_list_for_word(r, "dog") == []
+    assert get_sorted_index_list_for_word(r, "emu") == [(URL, 5)]
+    assert not r.exists("IndexSorted:dog")
+
+
+def test_reindex_only_writes_changed_counts(r):
+    redis_index_pipeline(words(cat=3, dog=4), URL, r)
+    redis_index_pipeline(words(cat=3, dog=5, emu=3), URL, r)
+    versions = r.hgetall(TERM_VERSION_KEY)
+
+    assert versions == {b"cat": b"1", b"dog": b"2", b"emu": b"1"}
+
+    redis_index_pipeline(words(cat=3, dog=5, emu=3), URL, r)
+    assert r.hgetall(TERM_VERSION_KEY) == versions
+
+
+def test_recrawl_applies_link_delta(r):
+    crawl(r, URL, {"cat": 3}, ["/wiki/B", "/wiki/C"])
+    crawl(r, URL, {"cat": 3, "dog": 3}, ["/wiki/C", "/wiki/D"])
+
+    doc_id = doc_id_of(r, URL)
+    ((counts, link_ids),) = get_forward_index(r, [doc_id])
+    assert counts == {"cat": 3, "dog": 3}
+    assert sorted(get_doc_urls(r, list(link_ids))) == [
+        "https://en.wikipedia.org/wiki/C",
+        "https://en.wikipedia.org/wiki/D",
+    ]
+    assert r.ttl(f"Links:{doc_id}") > 0
+
+    crawl(r, URL, {}, [])
+    assert get_forward_index(r, [doc_id]) == [({}, set())]
+    assert not r.exists(f"Links:{doc_id}", f"PageWords:{doc_id}", "IndexSorted:cat")
+
+
+def test_reindex_with_async_client():
+    async def reindex():
+        r = fakeredis.FakeAsyncRedis()
+        await redis_index_pipeline(words(cat=3, dog=3), URL, r)
+        await redis_index_pipeline(words(dog=4), URL, r)
+        doc_id = int(await r.hget(DOC_ID_KEY, URL))
+        return await get_forward_index(r, [doc_id]), await r.exists("IndexSorted:cat")
+
+    forward_index, cat_exists = asyncio.run(reindex())
+    assert forward_index == [({"dog": 4}, set())]
+    assert not cat_exists
+
+
+@pytest.mark.parametrize("mode", ["and", "or"])
+def test_multi_word_results_include_newly_indexed_pages(r, mode):
+    def ranked_urls():
+        results = get_ranked_index_list_for_words(r, ["cat", "dog"], mode=mode)
+        return [url for url, _ in results]
+
+    redis_index_pipeline(words(cat=3, dog=3), URL, r)
+    assert ranked_urls() == [URL]
+
+    other = "https://en.wikipedia.org/wiki/B"
+    redis_index_pipeline(words(cat=4, dog=4), other, r)
+    assert ranked_urls() == [other, URL]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 3, 4, 7, 8])
+def test_index_pages_step_over_tied_counts(r, batch_size):
+    # Runs of tied counts longer and shorter than a page.
+    counts = [5, 5, 5, 4, 4, 4, 4, 3]
+    pages = {f"{URL}{page}": count for page, count in enumerate(counts)}
+    for url, count in pages.items():
+        redis_index_pipeline(words(cat=count), url, r)
+    expected = get_sorted_index_list_for_word(r, "cat")
+
+    assert list(iter_sorted_index_for_word(r, "cat", batch_size)) == expected
+    assert dict(expected) == pages
+
+
+def test_index_page_cursor(r):
+    for page, count in enumerate([5, 5, 5, 4]):
+        redis_index_pipeline(words(cat=count), f"{URL}{page}", r)
+
+    first, cursor = get_sorted_index_page_for_word(r, "cat", 2)
+    assert [count for _, count in first] == [5, 5] and cursor == (5, 2)
+    second, cursor = get_sorted_index_page_for_word(r, "cat", 2, cursor)
+    assert [count for _, count in second] == [5, 4] and cursor == (4, 1)
+    last, cursor = get_sorted_index_page_for_word(r, "cat", 2, cursor)
+    assert last == [] and cursor is None
+
+    fives, cursor = get_sorted_index_page_for_word(r, "cat", 5, min_score=5)
+    assert len(fives) == 3 and cursor is None
+
+
+def test_hybrid_scores_keep_unranked_pages(r):
+    other = "https://en.wikipedia.org/wiki/B"
+    unranked = "https://en.wikipedia.org/wiki/C"
+    redis_index_pipeline(words(cat=8), URL, r)
+    redis_index_pipeline(words(cat=6), other, r)
+    redis_index_pipeline(words(cat=4), unranked, r)
+    store_page_ranks(r, {URL: 0.1, other: 0.4, "https://elsewhere": 0.5})
+
+    results = dict(get_ranked_index_list_for_words(r, ["cat"]))
+
+    assert results == pytest.approx(
+        {
+            URL: 0.3 * 8 / 8 + 0.7 * 0.1 / 0.5,
+            other: 0.3 * 6 / 8 + 0.7 * 0.4 / 0.5,
+            unranked: 0.3 * 4 / 8,
+        }
+    )
+
+
+def test_lookup_pages_with_many_links(r):
+    hrefs = [f"/wiki/L{i}" for i in range(20000)]
+    links = ["https://en.wikipedia.org" + href for href in hrefs]
+    crawl(r, URL, {"cat": 7}, hrefs)
+    redis_index_pipeline(words(cat=9), links[0], r)
+
+    highest, pages = lookup_pages(r, ["https://nowhere", URL, links[0]], ["cat"])
+
+    assert highest == 9
+    assert pages[0] == ([], 0)
+    assert sorted(pages[1][0]) == sorted(links) and pages[1][1] == 7
+    assert pages[2] == ([], 9)
+
+
+def test_ranked_query_time_does_not_grow_with_page_rank(redis_server):
+    def query_seconds():
+        get_ranked_index_list_for_words(redis_server, ["cat"], 10)
+        times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            get_ranked_index_list_for_words(redis_server, ["cat"], 10)
+            times.append(time.perf_counter() - start)
+        return sorted(times)[2]
+
+    redis_server.zadd("IndexSorted:cat", {str(i * 7): 3 + i % 5 for i in range(50)})
+    redis_server.zadd(PAGE_RANK_KEY, {str(i): i % 97 for i in range(1000)})
+    small = query_seconds()
+
+    p = redis_server.pipeline(transaction=False)
+    for start in range(0, 200000, 10000):
+        p.zadd(PAGE_RANK_KEY, {str(i): i % 97 for i in range(start, start + 10000)})
+    p.execute()
+    large = query_seconds()
+
+    assert large < 5 * small + 0.005
@@ -0,0 +1,105 @@
+import fakeredis
+import pytest
+
+import redistools
+from redistools import (
+    TERM_VERSION_KEY,
+    get_cached_ranked_index_list_for_words,
+    redis_index_pipeline,
+    store_page_ranks,
+)
+from resultcache import ResultCache
+
+WIKI = "https://en.wikipedia.org/wiki/"
+
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def computed(monkeypatch):
+    """
+    Counts how often the cached lookup computes the results again.
+    """
+    calls = []
+    compute = redistools.get_ranked_index_list_for_words
+
+    def counted(*args, **kwargs):
+        calls.append(args[1])
+        return compute(*args, **kwargs)
+
+    monkeypatch.setattr(redistools, "get_ranked_index_list_for_words", counted)
+    return calls
+
+
+def urls(results):
+    return [url for url, _ in results]
+
+
+def test_indexing_a_word_evicts_its_results(r, computed):
+    cache = ResultCache()
+    redis_index_pipeline(["cat"] * 3, WIKI + "A", r)
+    assert urls(get_cached_ranked_index_list_for_words(r, cache, ["cat"])) == [
+        WIKI + "A"
+    ]
+    version = int(r.hget(TERM_VERSION_KEY, "cat"))
+
+    # Unchanged, and a page without the word, leave the results cached.
+    get_cached_ranked_index_list_for_words(r, cache, ["cat"])
+    redis_index_pipeline(["dog"] * 3, WIKI + "C", r)
+    get_cached_ranked_index_list_for_words(r, cache, ["cat"])
+    assert len(computed) == 1
+
+    redis_index_pipeline(["cat"] * 5, WIKI + "B", r)
+    assert int(r.hget(TERM_VERSION_KEY, "cat")) == version + 1
+    assert urls(get_cached_ranked_index_list_for_words(r, cache, ["cat"])) == [
+        WIKI + "B",
+        WIKI + "A",
+    ]
+    assert len(computed) == 2
+
+
+def test_storing_page_ranks_evicts_results(r, computed):
+    cache = ResultCache()
+    redis_index_pipeline(["cat"] * 3, WIKI + "A", r)
+    redis_index_pipeline(["cat"] * 3, WIKI + "B", r)
+    store_page_ranks(r, {WIKI + "A": 0.9, WIKI + "B": 0.1})
+    first = get_cached_ranked_index_list_for_words(r, cache, ["cat"])
+
+    store_page_ranks(r, {WIKI + "A": 0.1, WIKI + "B": 0.9})
+    second = get_cached_ranked_index_list_for_words(r, cache, ["cat"])
+
+    assert urls(first) == [WIKI + "A", WIKI + "B"]
+    assert urls(second) == [WIKI + "B", WIKI + "A"]
+    assert len(computed) == 2
+
+
+def test_results_are_shared_through_redis(r, computed):
+    redis_index_pipeline(["cat"] * 3, WIKI + "A", r)
+    first = get_cached_ranked_index_list_for_words(r, ResultCache(), ["cat"])
+
+    # Another process, with an empty cache of its own.
+    assert get_cached_ranked_index_list_for_words(r, ResultCache(), ["cat"]) == first
+    assert len(computed) == 1
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", [1], ["A"])
+    cache.put("b", [1], ["B"])
+    cache.get("a")
+    cache.put("c", [1], ["C"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == ([1], ["A"])
+    assert cache.get("c") == ([1], ["C"])
+
+
+def test_expired_entry_is_dropped():
+    cache = ResultCache(ttl=0)
+    cache.put("a", [1], ["A"])
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
@@ -0,0 +1,88 @@
+import asyncio
+
+import fakeredis
+
+from incrementalrank import IncrementalPageRank
+from pagesearchlist import PageSearchList
+from search import (
+    handle_existing_pages,
+    handle_search_term_async,
+    index_parsed_pages,
+    search_page_url,
+)
+from termrank import TermRanker
+from wordtools import url_relevance
+
+WIKI = "https://en.wikipedia.org/wiki/"
+
+
+def test_existing_pages_are_scored_like_new_pages():
+    r = fakeredis.FakeRedis()
+    batch = [
+        (WIKI + "Cat", {"cat": 20}, ["/wiki/Lion"]),
+        (WIKI + "Pet", {"cat": 5}, ["/wiki/Dog"]),
+        (WIKI + "Zoo", {}, ["/wiki/Cat"]),
+    ]
+    index_parsed_pages(r, batch, PageSearchList("cat"))
+
+    page_list = PageSearchList("cat")
+    new_urls = handle_existing_pages(
+        r, [WIKI + "Pet", WIKI + "Zoo", WIKI + "Unknown"], page_list
+    )
+
+    assert new_urls == [WIKI + "Unknown"]
+    scores = dict(zip(page_list.urls, page_list.scores))
+    # Pet has 5 of the highest count of 20, Zoo does not have the term.
+    assert scores == {
+        WIKI + "Dog": url_relevance(WIKI + "Dog", "cat") * 0.5 + 5 / 20 * 0.5,
+        WIKI + "Cat": url_relevance(WIKI + "Cat", "cat") * 0.5,
+    }
+
+
+def test_multi_word_terms_are_scored_by_their_words():
+    r = fakeredis.FakeRedis()
+    batch = [
+        (WIKI + "ML", {"machine": 10, "learning": 10}, ["/wiki/Model"]),
+        (WIKI + "Gear", {"machine": 5, "learning": 2}, ["/wiki/Cog"]),
+    ]
+    new_list = PageSearchList("Machine Learning")
+    index_parsed_pages(r, batch, new_list)
+
+    stored_list = PageSearchList("Machine Learning")
+    handle_existing_pages(r, [WIKI + "ML", WIKI + "Gear"], stored_list)
+
+    # The highest counts of the words add up to 20. Gear's "learning" count
+    # is too low to be indexed.
+    expected = {
+        WIKI + "Model": url_relevance(WIKI + "Model", "Machine Learning") * 0.5
+        + 20 / 20 * 0.5,
+        WIKI + "Cog": url_relevance(WIKI + "Cog", "Machine Learning") * 0.5
+        + 5 / 20 * 0.5,
+    }
+    for page_list in (new_list, stored_list):
+        assert dict(zip(page_list.urls, page_list.scores)) == expected
+
+
+def test_quiet_crawl_updates_term_ranker_graph():
+    r = fakeredis.FakeRedis()
+    ranker = IncrementalPageRank()
+    ranker.set_links(WIKI + "Start", [])
+    term_ranker = TermRanker(ranker.link_graph())
+
+    # Every page of the crawl already has stored links, so nothing is fetched.
+    search_url = search_page_url("cat")
+    batch = [
+        (search_url, {"cat": 5}, ["/wiki/Cat"]),
+        (WIKI + "Cat", {"cat": 20}, [search_url[len("https://en.wikipedia.org") :]]),
+    ]
+    index_parsed_pages(r, batch, PageSearchList("cat"), ranker)
+
+    asyncio.run(
+        handle_search_term_async(
+            r, "cat", ranker, term_ranker, verbose=False, processes=1
+        )
+    )
+
+    assert list(term_ranker.graph.urls) == ranker.urls
+    assert WIKI + "Cat" in term_ranker.graph.urls
+    assert r.zcard("PageRank") == len(ranker.urls)
@@ -0,0 +1,84 @@
+import asyncio
+from time import monotonic
+
+import fakeredis
+from redis import RedisError
+
+from server import SearchServer
+
+
+def queued_words(server, words):
+    """
+    Answers a query and returns the words it queued a crawl for.
+    """
+
+    async def answer():
+        server.async_redis = fakeredis.FakeAsyncRedis()
+        server.crawl_queue = asyncio.Queue(server.max_crawl_jobs)
+        await server.answer(words, 10, "and")
+        queue = server.crawl_queue
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    return asyncio.run(answer())
+
+
+def test_unindexed_word_is_crawled_again_after_cooldown():
+    server = SearchServer(fakeredis.FakeRedis(), crawl_cooldown=3600)
+
+    assert queued_words(server, ["zyzzyva"]) == ["zyzzyva"]
+    # Still queued.
+    assert queued_words(server, ["zyzzyva"]) == []
+
+    for state in ("done", "failed"):
+        server.jobs["zyzzyva"] = state
+        server.job_finished["zyzzyva"] = monotonic()
+        assert queued_words(server, ["zyzzyva"]) == []
+
+        server.job_finished["zyzzyva"] = monotonic() - 3600
+        assert queued_words(server, ["zyzzyva"]) == ["zyzzyva"]
+
+
+def test_words_are_not_queued_while_the_crawl_queue_is_full():
+    server = SearchServer(fakeredis.FakeRedis(), max_crawl_jobs=2)
+
+    assert queued_words(server, ["aardvark", "bandicoot", "caracal"]) == [
+        "aardvark",
+        "bandicoot",
+    ]
+    assert "caracal" not in server.jobs
+
+    # Asked for again once there is room.
+    assert queued_words(server, ["caracal"]) == ["caracal"]
+
+
+def request(server, target):
+    """
+    Sends a GET request to the server's connection handler and returns the
+    response.
+    """
+
+    async def send():
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        async with listener:
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {target} HTTP/1.1\r\nConnection: close\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            return response.decode()
+
+    return asyncio.run(send())
+
+
+def test_failed_request_gets_internal_server_error():
+    server = SearchServer(fakeredis.FakeRedis())
+
+    async def search(query, count, mode):
+        raise RedisError("Connection refused.")
+
+    server.search = search
+    response = request(server, "/search?q=cat")
+
+    assert response.startswith("HTTP/1.1 500 Internal Server Error\r\n")
+    assert response.endswith('{"error": "Internal server error."}')
+    assert request(server, "/health").startswith("HTTP/1.1 200 OK\r\n")
@@ -0,0 +1,48 @@
+import fakeredis
+import numpy as np
+
+from incrementalrank import IncrementalPageRank
+from linkgraph import LinkGraph
+from redistools import redis_index_pipeline
+from termrank import TermRanker
+
+WIKI = "https://en.wikipedia.org/wiki/"
+
+
+def ranker_with_links(links):
+    ranker = IncrementalPageRank()
+    for page, targets in links.items():
+        ranker.set_links(WIKI + page, [WIKI + target for target in targets])
+    ranker.refresh()
+    return ranker
+
+
+def test_link_swap_drops_cached_and_stored_vectors():
+    r = fakeredis.FakeRedis()
+    redis_index_pipeline(["cat"] * 5, WIKI + "A", r)
+    ranker = ranker_with_links({"A": ["B"], "B": ["C"], "C": ["A"], "D": ["A"]})
+    term_ranker = TermRanker(ranker.link_graph())
+    key = term_ranker.rank_key(r, ["cat"])
+    stored = r.zrange(key, 0, -1, withscores=True)
+
+    # Same number of pages and links, different links.
+    ranker.set_links(WIKI + "C", [WIKI + "B"])
+    ranker.refresh()
+    graph = ranker.link_graph()
+    term_ranker.update_graph(graph)
+
+    assert term_ranker.ranks(r, ["cat"]) == TermRanker(graph).ranks(r, ["cat"])
+
+    assert term_ranker.rank_key(r, ["cat"]) == key
+    assert r.zrange(key, 0, -1, withscores=True) != stored
+
+
+def test_stored_vectors_are_shared_across_node_orders():
+    r = fakeredis.FakeRedis()
+    redis_index_pipeline(["cat"] * 5, WIKI + "A", r)
+    urls = [WIKI + page for page in "ABC"]
+    graph = LinkGraph(urls, np.array([0, 1, 2]), np.array([1, 2, 0]))
+    reordered = LinkGraph(urls[::-1], np.array([2, 1, 0]), np.array([1, 0, 2]))
+
+    assert TermRanker(graph).precompute(r, [["cat"]]) == 1
+    assert TermRanker(reordered).precompute(r, [["cat"]]) == 0
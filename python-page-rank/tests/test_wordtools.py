@@ -0,0 +1,33 @@
+import pytest
+
+from wordtools import AUTOJUNK_LENGTH, url_relevance, url_relevance_batch
+
+HREFS = [
+    "/wiki/Python_(programming_language)",
+    "/wiki/Monty_Python",
+    "/wiki/PYTHONPATH",
+    "/wiki/Pythagoras",
+    "/wiki/Reptile",
+    "/wiki/Caf%C3%A9",
+    "/wiki/Café_au_lait",
+    "/wiki/",
+    "",
+    "/wiki/aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaab",
+]
+
+
+@pytest.mark.parametrize(
+    "search_term",
+    ["python", "Python", "pyth", "thon programming", "café", "ab", "x", "a" * 40],
+)
+def test_url_relevance_batch_matches_url_relevance(search_term):
+    expected = [url_relevance(href, search_term) for href in HREFS]
+
+    assert url_relevance_batch(HREFS, search_term) == expected
+
+
+def test_url_relevance_batch_long_search_term():
+    search_term = "python " * (AUTOJUNK_LENGTH // 7 + 1)
+    expected = [url_relevance(href, search_term) for href in HREFS]
+
+    assert url_relevance_batch(HREFS, search_term) == expected
@@ -3,10 +3,13 @@ Module name: wikifetcher
 """
 
 from time import sleep, time
-from urllib.request import urlopen
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
 from bs4 import BeautifulSoup
 
+from metrics import metrics
+
 
 class WikiFetcher:
     """
@@ -18,11 +21,16 @@ class WikiFetcher:
         The time when the next request can be made.
     min_interval : int
         The minimum interval between requests in seconds.
+    cache : PageCache or None
+        Optional cache of page bodies. Fresh pages are served from it without
+        a request, stale ones are revalidated with a conditional GET.
 
     Methods
     -------
     fetch_wikipedia(url)
         Fetches the Wikipedia page at the given URL and returns a BeautifulSoup object.
+    fetch_html(url)
+        Fetches the body of the page at the given URL, using the cache if there is one.
     sleep_if_needed()
         Sleeps for the necessary amount of time to respect the minimum interval between requests.
     """
@@ -30,6 +38,9 @@ class WikiFetcher:
     next_request_time = None
     min_interval = 1  # second
 
+    def __init__(self, cache=None):
+        self.cache = cache
+
     def fetch_wikipedia(self, url):
         """
         Fetches the Wikipedia page at the given URL and returns a BeautifulSoup object.
@@ -44,11 +55,52 @@ class WikiFetcher:
         BeautifulSoup
             A BeautifulSoup object representing the fetched Wikipedia page.
         """
+        html = self.fetch_html(url)
+        with metrics.timer("parse_seconds"):
+            soup = BeautifulSoup(html, "html.parser")
+        return soup
+
+    def fetch_html(self, url):
+        """
+        Fetches the body of the page at the given URL.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the page to fetch.
+
+        Returns
+        -------
+        bytes
+            The body of the page.
+        """
+        cached, cached_body = self.cache.get(url) if self.cache else (None, None)
+        if cached and self.cache.is_fresh(cached):
+            metrics.count("page_cache_hits_total")
+            return cached_body
+
+        request = Request(url, headers=cached.conditional_headers() if cached else {})
         self.sleep_if_needed()
 
-        with urlopen(url) as fp:
-            soup = BeautifulSoup(fp, "html.parser")
-            return soup
+        try:
+            with metrics.timer("fetch_seconds"), urlopen(request) as fp:
+                body = fp.read()
+                headers = fp.headers
+        except HTTPError as e:
+            if e.code != 304 or not cached:
+                raise
+            metrics.count("page_cache_revalidated_total")
+            self.cache.touch(cached)
+            return cached_body
+
+        metrics.count("pages_fetched_total")
+        metrics.count("fetch_bytes_total", len(body))
+        if self.cache:
+            metrics.count("page_cache_misses_total")
+            self.cache.store(
+                url, body, headers.get("ETag"), headers.get("Last-Modified")
+            )
+        return body
 
     def sleep_if_needed(self):
         """
@@ -1,5 +1,9 @@
 from difflib import SequenceMatcher
 
+# SequenceMatcher starts treating popular characters as junk once the second
+# sequence is this long, so its match is no longer the longest common substring.
+AUTOJUNK_LENGTH = 200
+
 
 def url_relevance(url, search_term):
     url = str(url).lower()
@@ -16,3 +20,105 @@ def url_relevance(url, search_term):
     score = match_size / len(search_term)
 
     return score
+
+
+def url_relevance_batch(urls, search_term):
+    """
+    Function that scores many URLs against one search term, giving the same
+    scores as url_relevance.
+
+    Parameters:
+    - urls: The URLs or hrefs to score.
+    - search_term: The search term to score them against.
+
+    Returns:
+    - A list with the relevance score of each URL.
+    """
+    if len(str(search_term)) >= AUTOJUNK_LENGTH:
+        return [url_relevance(url, search_term) for url in urls]
+
+    matcher = TermMatcher(search_term)
+    return [matcher.relevance(url) for url in urls]
+
+
+class TermMatcher:
+    """
+    A suffix automaton of a search term, built once and then used to find the
+    longest common substring of the term and each URL in a single pass over
+    the URL.
+    """
+
+    def __init__(self, search_term):
+        self.search_term = str(search_term).lower()
+
+        # State 0 is the empty string. For each state: its transitions, its
+        # suffix link and the length of the longest string it represents.
+        self.transitions = [{}]
+        self.links = [-1]
+        self.lengths = [0]
+
+        last = 0
+        for character in self.search_term:
+            last = self._extend(last, character)
+
+    def _extend(self, last, character):
+        transitions, links, lengths = self.transitions, self.links, self.lengths
+
+        current = len(lengths)
+        transitions.append({})
+        links.append(0)
+        lengths.append(lengths[last] + 1)
+
+        state = last
+        while state != -1 and character not in transitions[state]:
+            transitions[state][character] = current
+            state = links[state]
+
+        if state != -1:
+            following = transitions[state][character]
+            if lengths[state] + 1 == lengths[following]:
+                links[current] = following
+            else:
+                clone = len(lengths)
+                transitions.append(dict(transitions[following]))
+                links.append(links[following])
+                lengths.append(lengths[state] + 1)
+
+                while state != -1 and transitions[state].get(character) == following:
+                    transitions[state][character] = clone
+                    state = links[state]
+
+                links[following] = clone
+                links[current] = clone
+
+        return current
+
+    def relevance(self, url):
+        """
+        Returns the relevance score of the URL, as url_relevance does.
+        """
+        url = str(url).lower()
+        search_term = self.search_term
+
+        if search_term in url:
+            return 1.0
+
+        transitions, links, lengths = self.transitions, self.links, self.lengths
+        state = 0
+        length = 0
+        longest = 0
+        for character in url:
+            while state and character not in transitions[state]:
+                state = links[state]
+                length = lengths[state]
+
+            following = transitions[state].get(character)
+            if following is None:
+                length = 0
+            else:
+                state = following
+                length += 1
+                if length > longest:
+                    longest = length
+
+        return longest / len(search_term)